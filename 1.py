@@ -1,6 +1,7 @@
 import os
 import requests
 import json
+import threading
 from flask import Flask, request, jsonify
 from datetime import datetime
 
@@ -100,6 +101,8 @@ class KiwoomAPI:
             return {"status": "error", "msg": str(e)}
 
 kiwoom = KiwoomAPI()
+# 첫 주문이 토큰 발급을 기다리지 않도록 기동 직후 백그라운드에서 미리 발급 (실패 시 send_order가 다시 시도)
+threading.Thread(target=kiwoom.get_token, daemon=True).start()
 
 @app.route('/')
 def index():
@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import tempfile
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from werkzeug.serving import make_server
+
+import mock_kiwoom
+
+# ==========================================
+# [1] 통계 헬퍼
+# ==========================================
+def percentile(values, p):
+    """nearest-rank 백분위수 (값이 없으면 None)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+def summarize(values):
+    """지연 목록(초) -> ms 단위 요약"""
+    if not values:
+        return {"count": 0}
+    ms = lambda v: round(v * 1000, 1)
+    return {
+        "count": len(values),
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "max_ms": ms(max(values)),
+    }
+
+# ==========================================
+# [2] 벤치마크 실행
+# ==========================================
+def build_signals(args):
+    """
+    벤치마크용 시그널을 생성합니다.
+    - 매수: 종목마다 고유 티커 (1xxxxx), 점수는 기준점 이상에서 무작위
+    - 매도: 모의 서버에 미리 보유시킨 티커 (9xxxxx)에 대한 전량 청산
+    주문-시그널 매칭을 위해 모든 시그널의 티커는 서로 다릅니다.
+    """
+    rng = random.Random(args.seed)
+    buys = [{"ticker": f"1{i:05d}", "action": "BUY", "price": args.price,
+             "score": round(rng.uniform(71, 100), 2)} for i in range(args.buys)]
+    sells = [{"ticker": f"9{i:05d}", "action": "Final Exit", "stop": args.price} for i in range(args.sells)]
+    signals = buys + sells
+    rng.shuffle(signals)
+    return signals
+
+def fire_burst(webhook_url, signals, concurrency):
+    """
+    시그널을 동시에 웹훅으로 전송합니다.
+    :return: ({ticker: 전송 시각}, [웹훅 응답 지연], 소요 시간, 실패 수)
+    """
+    local = threading.local()
+    sent_at, http_latency, failures = {}, [], []
+    lock = threading.Lock()
+
+    def _send(signal):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.time()
+        try:
+            res = session.post(webhook_url, data=json.dumps(signal), timeout=10)
+            ok = res.status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = time.time() - started
+        with lock:
+            sent_at[signal["ticker"]] = started
+            http_latency.append(elapsed)
+            if not ok:
+                failures.append(signal["ticker"])
+
+    burst_started = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(_send, signals))
+    return sent_at, http_latency, time.time() - burst_started, len(failures)
+
+def wait_for_orders(mock_url, since, expected, timeout, idle):
+    """
+    모의 서버에 기대 건수만큼 주문이 도착하거나, idle초 동안 새 주문이 없거나, timeout이 지날 때까지 대기합니다.
+    """
+    deadline = time.time() + timeout
+    last_count, last_change = -1, time.time()
+    orders = []
+    while time.time() < deadline:
+        orders = requests.get(f"{mock_url}/_mock/orders", params={"since": since}, timeout=5).json()
+        if len(orders) >= expected:
+            break
+        if len(orders) != last_count:
+            last_count, last_change = len(orders), time.time()
+        elif time.time() - last_change > idle:
+            break
+        time.sleep(0.05)
+    return orders
+
+def run(args):
+    signals = build_signals(args)
+    sell_positions = {s["ticker"]: 100 for s in signals if s["action"] != "BUY"}
+    listings = {s["ticker"]: args.price for s in signals} # 종목 마스터(ka10099) - 주문 경로에서 종목명/가격 제한폭 조회 없음
+
+    # 1. 모의 키움 서버 기동 (server.py import 전에 주소 지정)
+    mock_config = {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate,
+                   "rate_limit": args.broker_rate_limit, "token_ttl": args.token_ttl,
+                   "cash": args.cash, "positions": sell_positions, "listings": listings}
+
+    mock_server, mock_url = mock_kiwoom.serve_in_thread(config=mock_config)
+    os.environ["KIWOOM_BASE_URL"] = mock_url
+    work_dir = tempfile.mkdtemp(prefix="kiwoom-bench-")
+    os.environ.setdefault("KIWOOM_JOURNAL", os.path.join(work_dir, "signals.journal"))
+    os.environ.setdefault("KIWOOM_SYMBOLS", os.path.join(work_dir, "krx_symbols.bin"))
+    os.environ.setdefault("KIWOOM_LOG_FILE", os.path.join(work_dir, "kiwoom.log"))
+
+    import_started = time.perf_counter()
+    import server
+    import_seconds = time.perf_counter() - import_started
+    server.BUFFER_SECONDS = args.buffer_seconds
+    server.BUY_MAX_WAIT_SECONDS = max(server.BUY_MAX_WAIT_SECONDS, args.buffer_seconds)
+    server.BUY_FLUSH_POLICY = args.flush_policy
+    server.MAX_BUY_RANK = args.max_buy_rank
+    server.CASH_RECONCILE_SECONDS = 3600 # 측정 구간 밖으로 미룸
+
+    # 2. 트레이딩 서버(Flask) 기동 - 실제 HTTP로 웹훅 전송
+    app_server = make_server("127.0.0.1", 0, server.app, threaded=True)
+    threading.Thread(target=app_server.serve_forever, name="BenchApp", daemon=True).start()
+    app_url = f"http://127.0.0.1:{app_server.server_port}"
+    webhook_url = f"{app_url}/webhook"
+    server.startup.wait(args.timeout) # 키움 연결(토큰/예열/잔고) 준비 후 측정 시작
+    requests.get(f"{app_url}/ready", timeout=10) # 앱 서버 예열 (신호는 보내지 않음)
+    server.start_worker_if_needed()               # 첫 신호가 워커 기동을 떠안지 않도록
+    ready_seconds = time.perf_counter() - import_started
+
+    # 3. 부하 전송 및 주문 수집
+    since = time.time()
+    sent_at, http_latency, burst_seconds, failures = fire_burst(webhook_url, signals, args.concurrency)
+    expected = len(sell_positions) + min(args.buys, args.max_buy_rank)
+    orders = wait_for_orders(mock_url, since, expected, args.timeout, idle=args.buffer_seconds + 5)
+
+    # 4. 시그널별 webhook -> 주문 접수 지연 계산 (티커당 첫 주문 기준)
+    first_order = {}
+    for order in orders:
+        first_order.setdefault(order["ticker"], order)
+    e2e = {"buy": [], "sell": []}
+    for ticker, order in first_order.items():
+        if ticker in sent_at:
+            e2e[order["side"]].append(order["ts"] - sent_at[ticker])
+
+    order_span = (max(o["ts"] for o in orders) - since) if orders else None
+    mock_stats = requests.get(f"{mock_url}/_mock/stats", timeout=5).json()
+    mock_stats.pop("positions", None)
+    limiter = server.kiwoom.limiter.stats()
+
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "json"},
+        "startup": {
+            "import_seconds": round(import_seconds, 3),
+            "ready_seconds": round(ready_seconds, 3),
+            "phases": server.startup.status()["phases"],
+        },
+        "webhook": {
+            "signals": len(signals),
+            "failures": failures,
+            "burst_seconds": round(burst_seconds, 3),
+            "throughput_rps": round(len(signals) / burst_seconds, 1) if burst_seconds else None,
+            "latency": summarize(http_latency),
+        },
+        "orders": {
+            "count": len(orders),
+            "expected": expected,
+            "throughput_ops": round(len(orders) / order_span, 2) if order_span else None,
+        },
+        "e2e_buy": summarize(e2e["buy"]),
+        "e2e_sell": summarize(e2e["sell"]),
+        "broker": mock_stats,
+        "rate_limit_wait": {api_id: b["wait_total"] for api_id, b in limiter.items()},
+        "transport": server.kiwoom.transport.stats(),
+    }
+
+def print_report(report, out):
+    w = report["webhook"]
+    o = report["orders"]
+    out.write("\n=== Kiwoom Bot End-to-End Benchmark ===\n")
+    st = report["startup"]
+    out.write(f"콜드 스타트  : import {st['import_seconds']}초 / 준비 완료 {st['ready_seconds']}초 | {st['phases']}\n")
+    out.write(f"웹훅 전송    : {w['signals']}건 / {w['burst_seconds']}초 -> {w['throughput_rps']} req/s (실패 {w['failures']})\n")
+    out.write(f"웹훅 응답    : {w['latency']}\n")
+    out.write(f"주문 접수    : {o['count']}/{o['expected']}건 -> {o['throughput_ops']} orders/s\n")
+    out.write(f"매수 E2E     : {report['e2e_buy']}\n")
+    out.write(f"매도 E2E     : {report['e2e_sell']}\n")
+    out.write(f"모의 브로커  : {report['broker']}\n")
+    out.write(f"한도 대기(s) : {report['rate_limit_wait']}\n")
+    out.write(f"커넥션 풀    : {report['transport']}\n")
+
+# ==========================================
+# [3] 메인 실행 블록
+# ==========================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="webhook -> 주문 접수 end-to-end 부하/지연 벤치마크 (모의 키움 서버 사용)")
+    parser.add_argument("--buys", type=int, default=20, help="매수 시그널 수")
+    parser.add_argument("--sells", type=int, default=20, help="매도 시그널 수")
+    parser.add_argument("--concurrency", type=int, default=8, help="동시 웹훅 전송 수")
+    parser.add_argument("--price", type=int, default=10000)
+    parser.add_argument("--cash", type=int, default=1000000000)
+    parser.add_argument("--buffer-seconds", type=float, default=2, help="server.BUFFER_SECONDS 대체값")
+    parser.add_argument("--flush-policy", default="fixed", help="server.BUY_FLUSH_POLICY 대체값")
+    parser.add_argument("--max-buy-rank", type=int, default=7, help="server.MAX_BUY_RANK 대체값")
+    parser.add_argument("--latency-ms", type=float, default=30, help="모의 브로커 평균 지연")
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--broker-rate-limit", type=int, default=0, help="모의 브로커 api-id별 초당 한도 (0=무제한)")
+    parser.add_argument("--token-ttl", type=float, default=86400)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="결과를 JSON으로 출력")
+    parser.add_argument("--verbose", action="store_true", help="서버 로그 출력")
+    args = parser.parse_args()
+
+    out = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w") # 서버 로그 출력 억제
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    report = run(args)
+    if args.json:
+        out.write(json.dumps(report, ensure_ascii=False, indent=2) + "\n")
+    else:
+        print_report(report, out)
+    out.flush()
+    os._exit(0) # 데몬 스레드(워커/타이머) 정리 대기 없이 종료
@@ -0,0 +1,343 @@
+import os
+import json
+import time
+import random
+import threading
+import argparse
+from collections import deque
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from flask import Flask, request, jsonify, Response
+from werkzeug.serving import make_server
+
+# ==========================================
+# [1] 모의 서버 설정
+# ==========================================
+DEFAULT_CONFIG = {
+    "latency_ms": 30,          # 평균 응답 지연 (ms)
+    "jitter_ms": 10,           # 지연 편차 (±ms, 균등 분포)
+    "error_rate": 0.0,         # HTTP 500 응답 비율 (0~1)
+    "tail_rate": 0.0,          # 지연 꼬리 비율 (0~1) - 이 비율의 요청은 tail_ms만큼 추가로 지연
+    "tail_ms": 1000,           # 지연 꼬리 요청의 추가 지연 (ms)
+    "token_ttl": 86400,        # 토큰 수명 (초) - 만료 후 요청은 8005 응답
+    "rate_limit": 0,           # api-id별 초당 허용 요청 수 (0이면 무제한, 초과 시 HTTP 429 / 1700)
+    "cash": 100000000,         # 초기 주문 가능 현금 (원)
+    "positions": {},           # 초기 보유 잔고 {ticker: qty}
+    "fill_parts": 1,           # 주문 1건의 체결을 N번에 나눠 실시간 스트림으로 전송 (부분 체결 재현)
+    "listings": {},            # 종목 목록(ka10099) {ticker: 기준가} - KOSPI(0)로 응답
+    "listing_page": 500,       # ka10099 한 페이지 종목 수 (초과분은 cont-yn/next-key로 연속 조회)
+}
+
+KST = ZoneInfo("Asia/Seoul")
+
+# ==========================================
+# [2] 모의 계좌 상태
+# ==========================================
+class MockBroker():
+    """
+    키움 REST API 모의 서버의 계좌/주문/토큰 상태를 보관합니다.
+    주문은 접수 즉시 전량 체결된 것으로 처리하고, 실시간 주문체결(type 00) 메시지를 events에 쌓습니다.
+    """
+    def __init__(self, config=None):
+        self.lock = threading.Lock()
+        self.feed_cond = threading.Condition(self.lock) # 새 체결 메시지 / 스트림 강제 종료 알림
+        self.feed_epoch = 0
+        self.configure(config or {})
+
+    def configure(self, config):
+        with self.lock:
+            self.config = {**DEFAULT_CONFIG, **(config or {})}
+            self.cash = int(self.config["cash"])
+            self.positions = {t: int(q) for t, q in self.config["positions"].items()}
+            self.tokens = {}            # token -> 만료 epoch
+            self.orders = []            # 접수된 주문 기록
+            self.windows = {}           # api-id -> 최근 1초 요청 시각 deque
+            self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "token_expired": 0, "tokens_issued": 0}
+            self._ord_seq = 0
+            self.events = []            # 실시간 주문체결 메시지 (REAL)
+            self.feed_epoch += 1        # 연결된 스트림 종료 (상태 초기화)
+            self.feed_cond.notify_all()
+
+    # --- 공통 처리 ---
+    def delay(self):
+        latency = self.config["latency_ms"] + random.uniform(-1, 1) * self.config["jitter_ms"]
+        if random.random() < self.config["tail_rate"]:
+            latency += self.config["tail_ms"]
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def check_rate(self, api_id):
+        """초당 허용 요청 수를 넘으면 False"""
+        limit = self.config["rate_limit"]
+        if not limit:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.setdefault(api_id, deque())
+            while window and now - window[0] >= 1.0:
+                window.popleft()
+            if len(window) >= limit:
+                self.stats["rate_limited"] += 1
+                return False
+            window.append(now)
+            return True
+
+    def check_token(self, auth_header):
+        token = (auth_header or "").replace("Bearer ", "", 1)
+        expires_at = self.tokens.get(token)
+        if expires_at is None or time.time() >= expires_at:
+            with self.lock:
+                self.stats["token_expired"] += 1
+            return False
+        return True
+
+    # --- 엔드포인트 동작 ---
+    def issue_token(self):
+        with self.lock:
+            self.stats["tokens_issued"] += 1
+            token = f"mock-{self.stats['tokens_issued']}-{random.getrandbits(32):08x}"
+            expires_at = time.time() + self.config["token_ttl"]
+            self.tokens[token] = expires_at
+        expires_dt = datetime.fromtimestamp(expires_at, KST).strftime("%Y%m%d%H%M%S")
+        return {"expires_dt": expires_dt, "token_type": "bearer", "token": token,
+                "return_code": 0, "return_msg": "정상적으로 처리되었습니다"}
+
+    def balance(self):
+        with self.lock:
+            rows = [{"stk_cd": f"A{t}", "stk_nm": f"모의{t}", "rmnd_qty": f"{q:012d}"}
+                    for t, q in self.positions.items() if q > 0]
+        return {"acnt_evlt_remn_indv_tot": rows, "return_code": 0, "return_msg": "조회가 완료되었습니다"}
+
+    def listing(self, market, next_key):
+        """:return: (응답 본문, 다음 페이지 키 또는 None)"""
+        if market != "0":
+            return {"list": [], "return_code": 0, "return_msg": "조회가 완료되었습니다"}, None
+        items = sorted(self.config["listings"].items())
+        start = int(next_key or 0)
+        end = start + int(self.config["listing_page"])
+        rows = [{"code": t, "name": f"모의{t}", "lastPrice": f"{int(p):08d}", "marketCode": "0", "marketName": "거래소"}
+                for t, p in items[start:end]]
+        return {"list": rows, "return_code": 0, "return_msg": "조회가 완료되었습니다"}, (str(end) if end < len(items) else None)
+
+    def orderable(self, ticker, price):
+        price = max(int(float(price or 0)), 1)
+        with self.lock:
+            cash = self.cash
+        return {"min_ord_alow_amt": f"{cash:015d}", "min_ord_alowq": f"{cash // price:010d}",
+                "return_code": 0, "return_msg": "조회가 완료되었습니다"}
+
+    def order(self, api_id, payload):
+        ticker = payload.get("stk_cd")
+        qty = int(payload.get("ord_qty", 0))
+        price = int(float(payload.get("ord_uv", 0) or 0))
+        side = "buy" if api_id == "kt10000" else "sell"
+        with self.lock:
+            if side == "buy":
+                amount = qty * max(price, 1)
+                if qty <= 0 or amount > self.cash:
+                    return {"return_code": 1, "return_msg": "주문가능금액을 초과합니다"}
+                self.cash -= amount
+                self.positions[ticker] = self.positions.get(ticker, 0) + qty
+            else:
+                if qty <= 0 or qty > self.positions.get(ticker, 0):
+                    return {"return_code": 1, "return_msg": "주문가능수량이 부족합니다"}
+                self.positions[ticker] -= qty
+                self.cash += qty * max(price, 1)
+            self._ord_seq += 1
+            ord_no = f"{self._ord_seq:07d}"
+            self.orders.append({"ord_no": ord_no, "side": side, "ticker": ticker,
+                                "qty": qty, "price": price, "ts": time.time()})
+            self._emit_fills(ord_no, side, ticker, qty, price)
+        return {"ord_no": ord_no, "dmst_stex_tp": "KRX", "return_code": 0,
+                "return_msg": f"모의투자 {'매수' if side == 'buy' else '매도'}주문이 완료되었습니다"}
+
+    def _emit_fills(self, ord_no, side, ticker, qty, price):
+        """접수 1건 + 체결 fill_parts건의 실시간 메시지를 쌓습니다. (self.lock 보유 상태에서 호출)"""
+        parts = max(min(int(self.config["fill_parts"]), qty), 1)
+        def _message(status, filled, unit):
+            values = {
+                "9201": "mock", "9203": ord_no, "9001": f"A{ticker}", "302": f"모의{ticker}", "913": status,
+                "905": "+매수" if side == "buy" else "-매도", "907": "2" if side == "buy" else "1",
+                "900": str(qty), "901": str(price), "902": str(qty - filled),
+                "910": str(price) if filled else "", "911": str(filled), "915": str(unit) if unit else "",
+            }
+            return {"trnm": "REAL", "data": [{"type": "00", "name": "주문체결", "item": ticker, "values": values}]}
+        self.events.append(_message("접수", 0, 0))
+        filled = 0
+        for i in range(parts):
+            unit = qty // parts + (1 if i < qty % parts else 0)
+            filled += unit
+            self.events.append(_message("체결", filled, unit))
+        self.feed_cond.notify_all()
+
+# ==========================================
+# [3] 웹 서버 라우팅 (Flask)
+# ==========================================
+def create_app(broker=None):
+    """키움 REST API 엔드포인트를 흉내내는 Flask 앱을 생성합니다."""
+    app = Flask(__name__)
+    broker = broker or MockBroker()
+    app.broker = broker
+
+    def _guard(api_id, auth=True):
+        """공통 전처리: 지연 -> 오류 주입 -> 호출 한도 -> 토큰 검사. 문제 없으면 None"""
+        broker.delay()
+        with broker.lock:
+            broker.stats["requests"] += 1
+        if random.random() < broker.config["error_rate"]:
+            with broker.lock:
+                broker.stats["errors"] += 1
+            return jsonify({"return_code": 9999, "return_msg": "모의 서버 내부 오류"}), 500
+        if not broker.check_rate(api_id):
+            return jsonify({"return_code": 1700, "return_msg": "허용된 요청 개수를 초과하였습니다"}), 429
+        if auth and not broker.check_token(request.headers.get("authorization")):
+            return jsonify({"return_code": 8005, "return_msg": "Token이 유효하지 않습니다"}), 200
+        return None
+
+    @app.route('/oauth2/token', methods=['POST'])
+    def token():
+        blocked = _guard("oauth2", auth=False)
+        if blocked: return blocked
+        body = request.get_json(force=True, silent=True) or {}
+        if not body.get("appkey") or not body.get("secretkey"):
+            return jsonify({"return_code": 3, "return_msg": "appkey/secretkey가 필요합니다"}), 400
+        return jsonify(broker.issue_token())
+
+    @app.route('/api/dostk/stkinfo', methods=['POST'])
+    def stkinfo():
+        api_id = request.headers.get("api-id", "ka10001")
+        blocked = _guard(api_id)
+        if blocked: return blocked
+        body = request.get_json(force=True, silent=True) or {}
+        if api_id == "ka10099":
+            data, next_key = broker.listing(body.get("mrkt_tp"), request.headers.get("next-key"))
+            res = jsonify(data)
+            res.headers["cont-yn"] = "Y" if next_key else "N"
+            res.headers["next-key"] = next_key or ""
+            return res
+        ticker = body.get("stk_cd", "")
+        return jsonify({"stk_cd": ticker, "stk_nm": f"모의{ticker}", "return_code": 0})
+
+    @app.route('/api/dostk/acnt', methods=['POST'])
+    def acnt():
+        api_id = request.headers.get("api-id", "")
+        blocked = _guard(api_id)
+        if blocked: return blocked
+        body = request.get_json(force=True, silent=True) or {}
+        if api_id == "kt00018":
+            return jsonify(broker.balance())
+        if api_id == "kt00011":
+            return jsonify(broker.orderable(body.get("stk_cd"), body.get("uv")))
+        if api_id == "ka10075": # 모의 주문은 즉시 전량 체결되므로 미체결 없음
+            return jsonify({"oso": [], "return_code": 0, "return_msg": "조회가 완료되었습니다"})
+        return jsonify({"return_code": 2, "return_msg": f"지원하지 않는 api-id: {api_id}"}), 400
+
+    @app.route('/api/dostk/ordr', methods=['POST'])
+    def ordr():
+        api_id = request.headers.get("api-id", "")
+        blocked = _guard(api_id)
+        if blocked: return blocked
+        if api_id not in ("kt10000", "kt10001"):
+            return jsonify({"return_code": 2, "return_msg": f"지원하지 않는 api-id: {api_id}"}), 400
+        return jsonify(broker.order(api_id, request.get_json(force=True, silent=True) or {}))
+
+    @app.route('/_mock/stream')
+    def mock_stream():
+        """
+        실시간 주문체결 스트림 (키움 WebSocket과 같은 메시지를 한 줄에 1건씩 NDJSON으로 전송)
+        LOGIN/REG 응답 후 연결 이후의 REAL 메시지를 보내고, 메시지가 없으면 15초마다 PING을 보냅니다.
+        """
+        if not broker.check_token(request.headers.get("authorization")):
+            return jsonify({"return_code": 8005, "return_msg": "Token이 유효하지 않습니다"}), 401
+
+        def _line(message):
+            return json.dumps(message, ensure_ascii=False) + "\n"
+
+        def _stream():
+            with broker.lock:
+                cursor, epoch = len(broker.events), broker.feed_epoch
+            yield _line({"trnm": "LOGIN", "return_code": 0, "return_msg": ""})
+            yield _line({"trnm": "REG", "return_code": 0, "return_msg": ""})
+            while True:
+                with broker.feed_cond:
+                    broker.feed_cond.wait_for(lambda: len(broker.events) > cursor or broker.feed_epoch != epoch, timeout=15)
+                    if broker.feed_epoch != epoch:
+                        return
+                    batch, cursor = broker.events[cursor:], len(broker.events)
+                if not batch:
+                    yield _line({"trnm": "PING"})
+                for message in batch:
+                    yield _line(message)
+
+        return Response(_stream(), mimetype="application/x-ndjson")
+
+    # --- 테스트 제어용 엔드포인트 ---
+    @app.route('/_mock/orders')
+    def mock_orders():
+        """접수된 주문 기록 (?since=<epoch>)"""
+        since = float(request.args.get("since", 0))
+        with broker.lock:
+            orders = [o for o in broker.orders if o["ts"] >= since]
+        return jsonify(orders)
+
+    @app.route('/_mock/stats')
+    def mock_stats():
+        with broker.lock:
+            return jsonify({**broker.stats, "cash": broker.cash, "positions": dict(broker.positions)})
+
+    @app.route('/_mock/config', methods=['POST'])
+    def mock_config():
+        """상태 초기화 + 설정 변경 (본문: DEFAULT_CONFIG 키 일부)"""
+        broker.configure({**broker.config, **(request.get_json(force=True, silent=True) or {})})
+        return jsonify(broker.config)
+
+    @app.route('/_mock/expire_tokens', methods=['POST'])
+    def mock_expire_tokens():
+        """발급된 모든 토큰을 즉시 만료시킵니다. (8005 재발급 경로 점검용)"""
+        with broker.lock:
+            for token in broker.tokens:
+                broker.tokens[token] = 0
+        return jsonify({"status": "ok"})
+
+    @app.route('/_mock/disconnect', methods=['POST'])
+    def mock_disconnect():
+        """연결된 실시간 스트림을 모두 끊습니다. (폴링 대체/재연결 경로 점검용)"""
+        with broker.feed_cond:
+            broker.feed_epoch += 1
+            broker.feed_cond.notify_all()
+        return jsonify({"status": "ok"})
+
+    return app
+
+def serve_in_thread(port=0, config=None, host="127.0.0.1"):
+    """
+    모의 서버를 백그라운드 스레드로 실행합니다. (벤치마크/테스트용)
+    :return: (서버 객체, base_url)
+    """
+    app = create_app(MockBroker(config))
+    server = make_server(host, port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="MockKiwoom", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+# ==========================================
+# [4] 메인 실행 블록
+# ==========================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="키움 REST API 로컬 모의 서버")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8090)))
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_CONFIG["latency_ms"])
+    parser.add_argument("--jitter-ms", type=float, default=DEFAULT_CONFIG["jitter_ms"])
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_CONFIG["error_rate"])
+    parser.add_argument("--tail-rate", type=float, default=DEFAULT_CONFIG["tail_rate"])
+    parser.add_argument("--tail-ms", type=float, default=DEFAULT_CONFIG["tail_ms"])
+    parser.add_argument("--token-ttl", type=float, default=DEFAULT_CONFIG["token_ttl"])
+    parser.add_argument("--rate-limit", type=int, default=DEFAULT_CONFIG["rate_limit"])
+    parser.add_argument("--cash", type=int, default=DEFAULT_CONFIG["cash"])
+    parser.add_argument("--positions", default="{}", help='초기 잔고 JSON (예: {"005930": 10})')
+    parser.add_argument("--fill-parts", type=int, default=DEFAULT_CONFIG["fill_parts"])
+    args = parser.parse_args()
+
+    config = {k: v for k, v in vars(args).items() if k != "port"}
+    config["positions"] = json.loads(args.positions)
+    print(f">>> 모의 키움 서버 시작: http://127.0.0.1:{args.port} (KIWOOM_BASE_URL로 지정)")
+    make_server("0.0.0.0", args.port, create_app(MockBroker(config)), threaded=True).serve_forever()
@@ -0,0 +1,310 @@
+import sys
+import json
+import math
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import strategy
+
+try:
+    import numpy as np # 손익 집계 벡터화 (없으면 순수 파이썬으로 계산)
+except ImportError:
+    np = None
+
+# ==========================================
+# [1] 재생 파라미터
+# ==========================================
+# server.py [1] 설정과 같은 기본값. --set / --grid로 바꿔가며 재생합니다.
+DEFAULT_PARAMS = {
+    "buffer_seconds": 10,        # BUFFER_SECONDS
+    "quiet_seconds": 2,          # BUY_QUIET_SECONDS
+    "max_wait_seconds": 10,      # BUY_MAX_WAIT_SECONDS
+    "flush_policy": "fixed",     # BUY_FLUSH_POLICY
+    "score_threshold": 70,       # SCORE_THRESHOLD
+    "max_buy_rank": 7,           # MAX_BUY_RANK
+    "target_buy_amount": 1000000, # TARGET_BUY_AMOUNT
+    "tp1_ratio": strategy.DEFAULT_EXIT_SPLITS["tp1"],
+    "stop_loss_ratio": strategy.DEFAULT_EXIT_SPLITS["stop_loss"],
+    "default_exit_ratio": strategy.DEFAULT_EXIT_SPLITS["default"],
+    "cash": 100000000,           # 시작 현금 (원)
+}
+
+def parse_value(text):
+    """CLI 값 문자열 -> 숫자/문자열"""
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+def load_events(path):
+    """
+    기록된 웹훅 신호를 읽어 시각순으로 정렬합니다.
+    한 줄에 JSON 1건: {"ts": epoch초, "data": {...}} (server.py 저널의 접수 기록 {"op": "a", ...}도 그대로 사용 가능)
+    :return: [(ts, data)]
+    """
+    events = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("op", "a") != "a" or not isinstance(record.get("data"), dict):
+                continue # 저널의 전송/완료 기록
+            data = {k: v for k, v in record["data"].items() if not k.startswith("_")}
+            events.append((float(record["ts"]), data))
+    events.sort(key=lambda e: e[0])
+    return events
+
+# ==========================================
+# [2] 모의 브로커 (즉시 체결)
+# ==========================================
+class SimBroker():
+    """
+    재생용 계좌입니다. 주문은 요청 가격에 즉시 전량 체결됩니다.
+    - 보유 종목별 평균 단가로 실현 손익을 계산합니다.
+    - 신호에 실린 가격(price/stop)을 종목의 최근 가격으로 기록해 미실현 손익을 평가합니다.
+    """
+    def __init__(self, cash):
+        self.cash = cash
+        self.positions = {}      # ticker -> [수량, 평균 단가]
+        self.last_price = {}
+        self.buys = []           # (ts, ticker, 수량, 가격)
+        self.sells = []          # (ts, ticker, 수량, 가격, 실현 손익)
+
+    def mark(self, ticker, price):
+        if price and price > 0:
+            self.last_price[ticker] = price
+
+    def qty(self, ticker):
+        return self.positions.get(ticker, [0, 0])[0]
+
+    def buy(self, ts, ticker, qty, price):
+        position = self.positions.setdefault(ticker, [0, 0.0])
+        position[1] = (position[0] * position[1] + qty * price) / (position[0] + qty)
+        position[0] += qty
+        self.cash -= qty * price
+        self.buys.append((ts, ticker, qty, price))
+
+    def sell(self, ts, ticker, qty, price):
+        position = self.positions[ticker]
+        realized = (price - position[1]) * qty
+        position[0] -= qty
+        if position[0] == 0:
+            del self.positions[ticker]
+        self.cash += qty * price
+        self.sells.append((ts, ticker, qty, price, realized))
+
+    def unrealized(self):
+        return sum((self.last_price.get(t, cost) - cost) * qty for t, (qty, cost) in self.positions.items())
+
+# ==========================================
+# [3] 재생 엔진 (가상 시계)
+# ==========================================
+class ReplayEngine():
+    """
+    기록된 신호를 server.py 워커와 같은 의사결정 코드(strategy.py)로 재생합니다.
+    - 가상 시계: 선택기 마감 시각을 신호 시각 사이에서 계산하므로 sleep 없이 하루치를 수 초에 재생합니다.
+    - 청산: 도착 즉시 strategy.exit_quantity로 보유 수량을 분할 매도 (stop 가격, 없으면 price로 체결)
+    - 매수: strategy.BuySelector로 Top-K를 모은 뒤 마감 시각에 랭킹 순으로 예산 배정 후 매수
+    큐 적체에 따른 신호 병합(SignalScheduler)과 API 지연/거절은 재현하지 않습니다. country가 US인 신호는 건너뜁니다.
+    """
+    def __init__(self, params=None):
+        self.params = {**DEFAULT_PARAMS, **(params or {})}
+        p = self.params
+        self.now = 0.0
+        self.broker = SimBroker(p["cash"])
+        self.splits = {"tp1": p["tp1_ratio"], "stop_loss": p["stop_loss_ratio"], "default": p["default_exit_ratio"]}
+        policy = strategy.make_flush_policy(p["flush_policy"], window=p["buffer_seconds"],
+                                            max_wait=p["max_wait_seconds"], quiet=p["quiet_seconds"])
+        self.selector = strategy.BuySelector(k=p["max_buy_rank"], threshold=p["score_threshold"],
+                                             policy=policy, clock=lambda: self.now)
+        self.batches = 0
+        self.skipped = 0
+
+    def run(self, events):
+        deadline = None
+        for ts, data in events:
+            if deadline is not None and ts >= deadline:
+                self.now = deadline
+                self._flush()
+                deadline = None
+            self.now = ts
+            if data.get("country") == "US":
+                continue
+            ticker = data.get("ticker")
+            action = data.get("action", "")
+            self.broker.mark(ticker, _price(data, "price") or _price(data, "stop"))
+            if strategy.is_exit_signal(action):
+                self._exit(data)
+            elif "BUY" in action:
+                self.selector.add(data)
+                deadline = self.selector.deadline()
+        if deadline is not None:
+            self.now = deadline
+            self._flush()
+        return self
+
+    def _exit(self, data):
+        ticker = data.get("ticker")
+        current_qty = self.broker.qty(ticker)
+        price = _price(data, "stop") or _price(data, "price") or self.broker.last_price.get(ticker)
+        if current_qty <= 0 or not price:
+            self.skipped += 1
+            return
+        sell_qty, _ = strategy.exit_quantity(data.get("action", ""), current_qty, self.splits)
+        self.broker.sell(self.now, ticker, min(sell_qty, current_qty), price)
+
+    def _flush(self):
+        targets, _ = self.selector.flush()
+        self.batches += 1
+        available = self.broker.cash
+        for target in targets:
+            price = _price(target, "price")
+            if price <= 0:
+                self.skipped += 1
+                continue
+            # server.py: CashLedger.allocate 예약액 -> execute_buy 수량 보정과 같은 순서
+            budget = min(strategy.order_amount(price, self.params["target_buy_amount"]), max(available, 0))
+            qty = min(strategy.target_quantity(price, self.params["target_buy_amount"]), int(budget / price))
+            if qty <= 0:
+                self.skipped += 1
+                continue
+            available -= qty * price
+            self.broker.buy(self.now, target.get("ticker"), qty, price)
+
+    def result(self):
+        """손익 요약 (실현 손익 배열을 한 번에 집계)"""
+        realized = [s[4] for s in self.broker.sells]
+        stats = summarize_pnl(realized)
+        unrealized = self.broker.unrealized()
+        return {
+            **stats,
+            "unrealized_pnl": round(unrealized),
+            "total_pnl": round(stats["realized_pnl"] + unrealized),
+            "buys": len(self.broker.buys),
+            "sells": len(self.broker.sells),
+            "batches": self.batches,
+            "skipped": self.skipped,
+            "open_positions": len(self.broker.positions),
+            "cash": round(self.broker.cash),
+        }
+
+def _price(data, key):
+    try:
+        return float(data.get(key) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def summarize_pnl(realized):
+    """
+    매도 건별 실현 손익 -> 합계/승률/손익비/최대 낙폭
+    numpy가 있으면 배열 연산으로, 없으면 순수 파이썬으로 계산합니다.
+    """
+    if not realized:
+        return {"realized_pnl": 0, "win_rate": None, "profit_factor": None, "max_drawdown": 0}
+    if np is not None:
+        pnl = np.asarray(realized, dtype=float)
+        equity = np.cumsum(pnl)
+        drawdown = float(np.max(np.maximum.accumulate(np.concatenate(([0.0], equity)))[1:] - equity))
+        gains, losses = float(pnl[pnl > 0].sum()), float(-pnl[pnl < 0].sum())
+        total, wins = float(equity[-1]), int((pnl > 0).sum())
+    else:
+        equity = list(itertools.accumulate(realized))
+        peaks = itertools.accumulate([0.0] + equity, max)
+        next(peaks)
+        drawdown = max(peak - value for peak, value in zip(peaks, equity))
+        gains, losses = sum(v for v in realized if v > 0), -sum(v for v in realized if v < 0)
+        total, wins = equity[-1], sum(1 for v in realized if v > 0)
+    return {
+        "realized_pnl": round(total),
+        "win_rate": round(wins / len(realized), 4),
+        "profit_factor": round(gains / losses, 3) if losses else None,
+        "max_drawdown": round(max(drawdown, 0)),
+    }
+
+# ==========================================
+# [4] 파라미터 그리드 (프로세스 풀)
+# ==========================================
+_events = None # 프로세스 풀 워커별 신호 사본 (작업마다 다시 보내지 않음)
+
+def _init_worker(events):
+    global _events
+    _events = events
+
+def run_params(params):
+    """그리드 1칸 재생 (프로세스 풀 작업 단위)"""
+    started = time.perf_counter()
+    result = ReplayEngine(params).run(_events).result()
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return {"params": params, **result}
+
+def expand_grid(grid):
+    """{"name": [값...]} -> 모든 조합 [{"name": 값}]"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+def sweep(events, grid, base=None, workers=None):
+    """
+    파라미터 조합마다 재생을 병렬로 수행합니다.
+    :return: 조합별 결과 리스트 (입력 순서)
+    """
+    combos = [{**(base or {}), **combo} for combo in expand_grid(grid)]
+    if workers == 1 or len(combos) == 1:
+        _init_worker(events)
+        return [run_params(c) for c in combos]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(events,)) as pool:
+        return list(pool.map(run_params, combos, chunksize=max(len(combos) // (4 * (workers or 4)), 1)))
+
+def print_table(results, sort_key, top, out):
+    keys = sorted({k for r in results for k in r["params"]})
+    ranked = sorted(results, key=lambda r: -math.inf if r.get(sort_key) is None else r[sort_key], reverse=True)[:top]
+    columns = keys + ["total_pnl", "realized_pnl", "win_rate", "max_drawdown", "buys", "sells"]
+    out.write(" | ".join(columns) + "\n")
+    for r in ranked:
+        row = [str(r["params"].get(k)) for k in keys] + [str(r.get(c)) for c in columns[len(keys):]]
+        out.write(" | ".join(row) + "\n")
+
+# ==========================================
+# [5] 메인 실행 블록
+# ==========================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="기록된 웹훅 신호 오프라인 재생 및 파라미터 탐색")
+    parser.add_argument("events", help="신호 기록 파일 (JSONL: {\"ts\", \"data\"} 또는 server.py 저널)")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="고정 파라미터 (예: cash=50000000)")
+    parser.add_argument("--grid", action="append", default=[], metavar="NAME=V1,V2",
+                        help="탐색할 파라미터 값 목록 (예: buffer_seconds=5,10,20)")
+    parser.add_argument("--workers", type=int, default=None, help="프로세스 수 (기본: CPU 수)")
+    parser.add_argument("--sort", default="total_pnl", help="정렬 기준 결과 항목")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="결과를 JSON으로 출력")
+    args = parser.parse_args()
+
+    def _pairs(items, many):
+        parsed = {}
+        for item in items:
+            name, _, value = item.partition("=")
+            if name not in DEFAULT_PARAMS:
+                parser.error(f"알 수 없는 파라미터: {name} (사용 가능: {', '.join(DEFAULT_PARAMS)})")
+            parsed[name] = [parse_value(v) for v in value.split(",")] if many else parse_value(value)
+        return parsed
+
+    base, grid = _pairs(args.set, False), _pairs(args.grid, True)
+    loaded = time.perf_counter()
+    events = load_events(args.events)
+    started = time.perf_counter()
+    results = sweep(events, grid or {"flush_policy": [base.get("flush_policy", DEFAULT_PARAMS["flush_policy"])]},
+                    base=base, workers=args.workers)
+    elapsed = time.perf_counter() - started
+
+    if args.json:
+        sys.stdout.write(json.dumps(results, ensure_ascii=False, indent=2, default=float) + "\n")
+    else:
+        span = (events[-1][0] - events[0][0]) / 3600 if events else 0
+        sys.stdout.write(f"신호 {len(events)}건 ({span:.1f}시간 분량, 읽기 {started - loaded:.2f}초) | "
+                         f"조합 {len(results)}개 재생 {elapsed:.2f}초\n")
+        print_table(results, args.sort, args.top, sys.stdout)
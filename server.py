@@ -1,14 +1,42 @@
 import os
+import sys
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import time
 import threading
 import queue
-from flask import Flask, request, jsonify
+import heapq
+import bisect
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+from flask import Flask, request, jsonify, Response, stream_with_context
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from collections import deque
-import math
+from collections import deque, OrderedDict
+import atexit
+import asyncio
+import sqlite3
+import hashlib
+import contextlib
+import contextvars
+import functools
+import hmac
+import strategy
+import symbols as symbol_master
+from strategy import is_exit_signal, is_buy_signal, is_full_exit, target_quantity, exit_quantity
+
+_BOOT_STARTED = time.perf_counter() # 콜드 스타트 측정 기준 (모듈 import 시작)
+
+try:
+    import aiohttp # 실시간 체결 스트림(WebSocket) / 비동기 주문 전송(AsyncKiwoomAPI)
+except ImportError:
+    aiohttp = None
+
+try:
+    import fcntl # 다중 프로세스 모드의 리더 선출 전용 (Linux/macOS)
+except ImportError:
+    fcntl = None
 
 app = Flask(__name__)
 
@@ -17,169 +45,2882 @@ app = Flask(__name__)
 # ==========================================
 app_key = os.environ.get("APP_KEY", "WEyClVdBvdo2e1QE8xuKSBbMTEbihZaM7v192j0DMko")
 app_secret = os.environ.get("APP_SECRET", "a8E-GslMXGkFNptImpzTU1DUQ6s6cCfpDD_gSNuyL4Y")
-BASE_URL = "https://mockapi.kiwoom.com"
+BASE_URL = os.environ.get("KIWOOM_BASE_URL", "https://mockapi.kiwoom.com") # 로컬 모의 서버: mock_kiwoom.py
+
+# --- 다중 계좌 ---
+# KIWOOM_ACCOUNTS='[{"name": "A", "app_key": "...", "app_secret": "..."}, ...]' (base_url 생략 시 BASE_URL)
+# 미지정 시 APP_KEY/APP_SECRET 단일 계좌로 동작합니다.
+ACCOUNTS = json.loads(os.environ.get("KIWOOM_ACCOUNTS") or "null") or [
+    {"name": "main", "app_key": app_key, "app_secret": app_secret},
+]
 
 # --- 트레이딩 설정 ---
 TARGET_BUY_AMOUNT = 1000000  # 1회 매수 시도 금액 (원)
 MAX_BUY_RANK = 7             # 동시 매수 허용 최대 종목 수 (랭킹 상위 N개)
 BUFFER_SECONDS = 10          # 매수 신호 수집 및 랭킹 산정을 위한 대기 시간 (초)
 SCORE_THRESHOLD = 70         # 매수 최소 기준 점수
+BUY_FLUSH_POLICY = "fixed"   # 매수 배치 마감 정책: fixed(고정) / sliding(무신호 구간) / early(K개 확보 시 즉시)
+BUY_QUIET_SECONDS = 2        # sliding: 마지막 매수 신호 후 N초간 추가 신호가 없으면 마감
+BUY_MAX_WAIT_SECONDS = 10    # 모든 정책 공통: 첫 매수 신호 후 최대 대기 시간 (초)
+BUY_DISPATCH_WORKERS = 4     # 랭킹 매수 동시 집행 스레드 수 (호출 속도는 RateLimiter가 제한)
+ASYNC_DISPATCH = os.environ.get("KIWOOM_ASYNC_DISPATCH", "") == "1" # 1이면 매수 배치/청산 주문을 스레드 대신 asyncio 루프 하나에서 동시 전송 (AsyncKiwoomAPI)
+POSITION_CACHE_SECONDS = 3   # 보유 잔고 스냅샷(kt00018) 재조회 최소 간격 (초)
+CASH_RECONCILE_SECONDS = 30  # 매수 배치 후 현금 장부를 브로커(kt00011)와 재대조하기까지의 지연 (초)
+
+# --- HTTP 전송 설정 ---
+HTTP_POOL_SIZE = 10          # 호스트당 유지할 keep-alive 커넥션 수
+HTTP_WARM_CONNECTIONS = 3    # 기동 시 미리 열어둘 커넥션 수 (TLS 핸드셰이크 선지불)
+HTTP_DEFAULT_TIMEOUT = (3, 10)  # (connect, read) 초
+HTTP_TIMEOUTS = {            # api-id별 (connect, read) 타임아웃
+    "oauth2":  (3, 10),
+    "ka10001": (3, 5),       # 종목 정보
+    "ka10099": (3, 15),      # 종목 목록 (시장 전체, 응답이 큼)
+    "kt00018": (3, 8),       # 계좌 평가 잔고
+    "kt00011": (3, 5),       # 주문 가능 금액
+    "ka10075": (3, 5),       # 미체결 주문 (체결 스트림 재연결 시 장부 재정렬)
+    "kt10000": (3, 10),      # 매수 주문
+    "kt10001": (3, 10),      # 매도 주문
+    "warmup":  (3, 3),
+}
+
+# --- 접근 토큰 수명 관리 ---
+TOKEN_REFRESH_MARGIN = 600   # 만료 N초 전에 백그라운드에서 미리 재발급
+TOKEN_DEFAULT_TTL = 6 * 3600 # 응답에 만료 정보가 없을 때 가정하는 수명 (초)
+TOKEN_RETRY_SECONDS = 10     # 재발급 실패 시 재시도 간격 (초)
+TOKEN_STARTUP_TIMEOUT = 30   # 기동 시 최초 토큰 발급을 기다리는 최대 시간 (초, 초과한 계좌는 제외하고 기동)
+STARTUP_RETRY_SECONDS = (5, 60) # 기동 실패(기본 계좌 연결 실패 등) 시 재시도 간격 (최소, 최대 초 - 실패마다 2배)
+
+# --- API 호출 한도 (토큰 버킷) ---
+RATE_LIMITS = {              # api-id: (초당 허용 요청 수, 최대 버스트)
+    "global":  (5, 5),       # 모든 api-id 합산 한도
+    "oauth2":  (1, 1),       # 토큰 발급
+    "ka10001": (3, 3),       # 종목 정보
+    "ka10099": (1, 1),       # 종목 목록 (하루 1회)
+    "kt00018": (2, 2),       # 계좌 평가 잔고
+    "kt00011": (3, 3),       # 주문 가능 금액
+    "ka10075": (1, 1),       # 미체결 주문 (스트림 재연결 시 1회)
+    "kt10000": (3, 3),       # 매수 주문
+    "kt10001": (3, 3),       # 매도 주문
+}
+
+# --- 조회 API 복원력 (헤지 요청 + 서킷 브레이커) ---
+HEDGED_READS = ("kt00018", "kt00011") # 헤지/서킷 브레이커 적용 api-id (멱등 조회만 - 주문 api-id는 절대 넣지 않음)
+HEDGE_QUANTILE = 0.95        # 최근 응답 지연의 이 분위를 넘기면 같은 요청을 한 번 더 보냄
+HEDGE_WINDOW = 200           # 분위 추정에 쓰는 최근 응답 수 (api-id별)
+HEDGE_MIN_SAMPLES = 20       # 이만큼 쌓이기 전에는 헤지하지 않음
+HEDGE_MIN_DELAY = 0.05       # 헤지 대기 하한 (초)
+HEDGE_WORKERS = 12           # 조회/헤지 요청 전송 스레드 수 (계좌별)
+BREAKER_FAILURES = 5         # 연속 실패 N회면 차단 (즉시 실패, 캐시된 계좌 상태 사용)
+BREAKER_COOLDOWN = (1, 30)   # 차단 후 시험 요청까지 대기 (최소, 최대) - 시험 실패마다 2배
+
+# --- 실시간 체결 수신 ---
+EXEC_FEED_URL = os.environ.get("KIWOOM_EXEC_FEED_URL", "auto") # 주문체결 스트림 주소 (auto: 계좌 base_url에서 유도, 빈 값이면 비활성)
+EXEC_FEED_IDLE_TIMEOUT = 30  # 이 시간 동안 메시지(PING 포함)가 없으면 끊긴 것으로 판단 (초)
+EXEC_FEED_RECONNECT_SECONDS = (1, 30) # 재연결 대기 (최소, 최대) - 실패할 때마다 2배
+EXEC_POLL_SECONDS = 2        # 스트림이 끊긴 동안 잔고(kt00018)를 일괄 재조회하는 간격 (초)
+EXEC_ORDER_CAPACITY = 2000   # 주문 장부에 보관할 최대 주문 수 (완료된 주문부터 정리)
+
+# --- 종목 마스터 ---
+SYMBOL_MASTER_PATH = os.environ.get("KIWOOM_SYMBOLS", "krx_symbols.bin") # 전 종목 정보 파일 (모든 프로세스가 mmap 공유, 빈 값이면 비활성)
+SYMBOL_MARKETS = {           # ka10099 시장 구분 코드 -> 시장
+    "0": "KOSPI",
+    "10": "KOSDAQ",
+    "50": "KONEX",
+    "8": "ETF",
+    "60": "ETN",
+}
+SYMBOL_FETCH_PRIORITY = 1000 # 종목 목록 연속 조회의 한도 대기 순위 (주문/조회 대기자가 있으면 항상 뒤로 양보)
 
 # --- 시스템 설정 ---
-order_queue = queue.Queue()  # 웹훅 수신 데이터 -> 워커 전달용 FIFO 큐
-server_logs = deque() # 웹 대시보드 표시용 로그 (최신 50개 유지)
+LOG_CAPACITY = 500           # 메모리 로그 저장소 최대 보관 건수 (링 버퍼)
+LOG_PAGE_SIZE = 200          # /logs 1회 응답 최대 건수
+DASHBOARD_LOG_LINES = 50     # 대시보드에 표시할 최근 로그 수
+LOG_BUFFER_SIZE = 10000      # 로그 스레드가 아직 쓰지 않은 기록의 최대 수 (초과분은 버리고 개수만 셈)
+LOG_BATCH_SIZE = 500         # 로그 스레드가 한 번에 출력/저장하는 최대 기록 수
+LOG_FILE = os.environ.get("KIWOOM_LOG_FILE", "kiwoom.log") # 로그 파일 (빈 값이면 파일 기록 안 함)
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024 # 로그 파일이 이 크기를 넘으면 교체 (kiwoom.log -> kiwoom.log.1 ...)
+LOG_FILE_BACKUPS = 5         # 보관할 이전 로그 파일 수
+QUEUE_MAX_BUYS = 500         # 매수 레인 최대 대기 수 (가득 차면 새 매수는 429, 청산은 항상 접수)
+QUEUE_BUY_MAX_AGE = 30       # 이보다 오래 대기한 매수 신호는 집행하지 않고 만료 (초, 가격이 이미 지나감)
+QUEUE_STALL_SECONDS = 15     # 가장 오래된 신호가 이 시간 이상 대기 중이면 워커 정체로 보고 매수 접수 거절 (503)
+QUEUE_RETRY_AFTER = 5        # 접수 거절 응답의 Retry-After (초)
+DEDUP_TTL_SECONDS = 300      # 중복 웹훅 판정 기간 (초)
+DEDUP_CAPACITY = 10000       # 중복 판정 색인 최대 보관 건수 (메모리 상한)
+DEDUP_BUCKET_SECONDS = 10    # signal_id/time이 없는 신호의 도착 시각 묶음 단위 (초)
+JOURNAL_PATH = os.environ.get("KIWOOM_JOURNAL", "signals.journal") # 시그널 저널 파일 (빈 값이면 저널 비활성)
+JOURNAL_SYNC_TIMEOUT = 1.0   # 웹훅이 저널 fsync 완료를 기다리는 최대 시간 (초, 초과 시 503)
+JOURNAL_COMMIT_DELAY = 0.0   # group commit 시 추가로 모을 시간 (초, 0이면 fsync 중 쌓인 기록만 묶음)
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024 # 저널이 이 크기를 넘고 대부분 완료 기록이면 압축
+JOURNAL_REPLAY_BUY_SECONDS = 60 # 재기동 시 이보다 오래된 미처리 매수 신호는 재실행하지 않음 (초)
+
+# --- 다중 프로세스 모드 (gunicorn -w N) ---
+CLUSTER_DB = os.environ.get("KIWOOM_CLUSTER_DB", "") # 프로세스 간 공유 SQLite 경로 (빈 값이면 단일 프로세스 모드)
+CLUSTER_SYNCHRONOUS = "FULL" # 시그널 INSERT 확정 수준 (FULL: 커밋마다 fsync, NORMAL: 프로세스 장애까지만 보장)
+CLUSTER_POLL_SECONDS = 0.02  # 리더가 다른 프로세스가 받은 신규 시그널을 확인하는 간격 (초)
+CLUSTER_ELECT_SECONDS = 1    # 리더 선출 재시도 및 지표 공유 주기 (초)
+CLUSTER_BUSY_TIMEOUT = 5     # SQLite 쓰기 잠금 대기 최대 시간 (초)
+CLUSTER_PUMP_BATCH = 500     # 리더가 한 번에 옮기는 시그널 수
+ADMIN_TOKEN = os.environ.get("KIWOOM_ADMIN_TOKEN", "") # 관리자 엔드포인트(/admin/*) 인증 토큰 (빈 값이면 비활성)
+PROFILE_INTERVAL = 0.005     # 샘플링 프로파일러 스택 수집 간격 (초)
+PROFILE_MAX_SECONDS = 120    # 프로파일링 1회 최대 시간 (초, 백그라운드 수집이라 요청/워커 타임아웃과 무관)
+PROFILE_THREADS = ("KiwoomWorker", "KiwoomBuy", "KiwoomRoute", "KiwoomHedge", "MainThread", "process_request_thread", "waitress") # 기본 수집 대상 스레드 (이름 포함 여부, gunicorn sync 워커는 MainThread에서 요청 처리)
+TRACE_MAX_SIGNALS = 200      # 한 번에 추적을 예약할 수 있는 최대 신호 수 (보관 건수도 동일)
+METRIC_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30) # 히스토그램 구간 (초)
+_dispatch_ctx = threading.local() # 스레드별 주문 우선순위 (RateLimiter 대기열 정렬 기준)
+_async_ctx = contextvars.ContextVar("kiwoom_async_ctx", default=(0, None)) # asyncio 태스크별 (주문 우선순위, 추적) - AsyncKiwoomAPI용
 
 # ==========================================
 # [2] 헬퍼 함수
 # ==========================================
-def add_log(message):
+class LogStore():
+    """
+    고정 용량 링 버퍼 기반의 구조화 로그 저장소입니다.
+    - 각 항목: id(단조 증가), ts, time, level, ticker, event, message
+    - 용량을 넘으면 가장 오래된 항목부터 버려지므로 메모리 사용량이 일정합니다.
+    - since(id)로 클라이언트가 마지막으로 받은 id 이후의 항목만 조회할 수 있습니다.
+    """
+    def __init__(self, capacity=LOG_CAPACITY):
+        self._entries = deque(maxlen=capacity)
+        self._last_id = 0
+        self._cond = threading.Condition()
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def append(self, message, level="INFO", ticker=None, event=None, ts=None, time_str=None):
+        with self._cond:
+            self._last_id += 1
+            entry = {
+                "id": self._last_id,
+                "ts": ts if ts is not None else time.time(),
+                "time": time_str,
+                "level": level,
+                "ticker": ticker,
+                "event": event,
+                "message": message,
+            }
+            self._entries.append(entry)
+            self._cond.notify_all()
+            return entry
+
+    def extend(self, records):
+        """
+        여러 항목을 한 번의 락 획득/알림으로 추가합니다. (로그 스레드의 일괄 기록용)
+        :param records: [(message, level, ticker, event, ts, time_str)]
+        """
+        with self._cond:
+            for message, level, ticker, event, ts, time_str in records:
+                self._last_id += 1
+                self._entries.append({"id": self._last_id, "ts": ts, "time": time_str, "level": level,
+                                      "ticker": ticker, "event": event, "message": message})
+            self._cond.notify_all()
+
+    def since(self, last_id=0, limit=LOG_PAGE_SIZE):
+        """
+        last_id 이후의 항목을 오래된 순으로 최대 limit개 반환합니다.
+        :return: (entries, truncated) - truncated: 요청 구간 일부가 이미 버려졌는지 여부
+        """
+        with self._cond:
+            if not self._entries:
+                return [], False
+            first_id = self._entries[0]["id"]
+            start = max(int(last_id) + 1 - first_id, 0)
+            truncated = int(last_id) + 1 < first_id and int(last_id) > 0
+            return list(itertools.islice(self._entries, start, start + limit)), truncated
+
+    def tail(self, count):
+        """최근 count개 항목을 오래된 순으로 반환합니다."""
+        with self._cond:
+            return list(self._entries)[-count:]
+
+    def wait(self, last_id, timeout):
+        """last_id 이후 새 항목이 생길 때까지 최대 timeout초 대기합니다."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._last_id > last_id, timeout=timeout)
+
+    def __len__(self):
+        return len(self._entries)
+
+def sqlite_connect(path, synchronous="NORMAL"):
+    """WAL 모드 SQLite 연결 (autocommit, 프로세스 간 공유용)"""
+    conn = sqlite3.connect(path, timeout=CLUSTER_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={synchronous}")
+    return conn
+
+class SharedLogStore():
+    """
+    다중 프로세스 모드용 로그 저장소입니다. (LogStore와 같은 인터페이스)
+    모든 프로세스의 로그를 공유 SQLite의 logs 테이블에 모아, 어느 워커가 /logs 요청을 받아도 같은 로그를 보여줍니다.
+    - id는 테이블 rowid (프로세스 전체에서 단조 증가)
+    - 최근 capacity개만 남기고 주기적으로 정리합니다.
+    - wait()는 프로세스 간 알림 수단이 없어 짧은 간격 폴링으로 대신합니다.
+    """
+    def __init__(self, path, capacity=LOG_CAPACITY):
+        self.capacity = capacity
+        self._conn = sqlite_connect(path, synchronous="OFF") # 로그는 fsync 생략
+        self._conn.execute("CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL, time TEXT,"
+                           " level TEXT, ticker TEXT, event TEXT, message TEXT)")
+        self._lock = threading.Lock()
+        self._appended = 0
+
+    _COLUMNS = ("id", "ts", "time", "level", "ticker", "event", "message")
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return [dict(zip(self._COLUMNS, row)) for row in self._conn.execute(sql, args).fetchall()]
+
+    @property
+    def last_id(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM logs").fetchone()[0]
+
+    def append(self, message, level="INFO", ticker=None, event=None, ts=None, time_str=None):
+        ts = ts if ts is not None else time.time()
+        with self._lock:
+            cur = self._conn.execute("INSERT INTO logs (ts, time, level, ticker, event, message) VALUES (?, ?, ?, ?, ?, ?)",
+                                     (ts, time_str, level, ticker, event, message))
+            self._appended += 1
+            if self._appended % 100 == 0:
+                self._conn.execute("DELETE FROM logs WHERE id <= ?", (cur.lastrowid - self.capacity,))
+        return {"id": cur.lastrowid, "ts": ts, "time": time_str, "level": level, "ticker": ticker, "event": event, "message": message}
+
+    def extend(self, records):
+        """여러 항목을 한 트랜잭션으로 추가합니다. (capacity 초과분 정리도 같은 트랜잭션) :param records: [(message, level, ticker, event, ts, time_str)]"""
+        rows = [(ts, time_str, level, ticker, event, message) for message, level, ticker, event, ts, time_str in records]
+        with self._lock:
+            before = self._appended
+            self._conn.execute("BEGIN IMMEDIATE") # 쓰기 잠금을 먼저 잡아 다른 프로세스와 교착 없이 추가 + 정리
+            try:
+                self._conn.executemany("INSERT INTO logs (ts, time, level, ticker, event, message) VALUES (?, ?, ?, ?, ?, ?)", rows)
+                if (before + len(rows)) // 100 != before // 100:
+                    self._conn.execute("DELETE FROM logs WHERE id <= (SELECT MAX(id) FROM logs) - ?", (self.capacity,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._appended += len(rows)
+
+    def since(self, last_id=0, limit=LOG_PAGE_SIZE):
+        """:return: (entries, truncated) - LogStore.since와 동일"""
+        last_id = int(last_id)
+        entries = self._query(f"SELECT {', '.join(self._COLUMNS)} FROM logs WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit))
+        truncated = bool(entries) and last_id > 0 and entries[0]["id"] > last_id + 1
+        return entries, truncated
+
+    def tail(self, count):
+        entries = self._query(f"SELECT {', '.join(self._COLUMNS)} FROM logs ORDER BY id DESC LIMIT ?", (count,))
+        return entries[::-1]
+
+    def wait(self, last_id, timeout):
+        deadline = time.time() + timeout
+        while self.last_id <= last_id:
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.2)
+        return True
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+# 웹 대시보드 표시용 로그 (최근 LOG_CAPACITY개 유지, 다중 프로세스 모드에서는 모든 프로세스가 공유)
+server_logs = SharedLogStore(CLUSTER_DB) if CLUSTER_DB else LogStore()
+
+class RotatingLogFile():
+    """
+    크기 기준으로 교체되는 로그 파일입니다. (로그 스레드 전용, 일괄 기록 단위로 write 1회)
+    max_bytes를 넘으면 path -> path.1 -> ... -> path.{backups} 순으로 밀어내고 새 파일을 엽니다.
+    """
+    def __init__(self, path, max_bytes=LOG_FILE_MAX_BYTES, backups=LOG_FILE_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = open(path, "ab")
+        self._size = self._file.tell()
+
+    def write(self, data):
+        if self._size and self._size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+
+    def _rotate(self):
+        self._file.close()
+        for idx in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{idx}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{idx + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "ab")
+        self._size = 0
+
+KST = ZoneInfo("Asia/Seoul")
+_log_queue = queue.SimpleQueue()  # add_log -> 로그 스레드 전달용
+_log_write_lock = threading.Lock() # 로그 스레드와 flush_logs(종료 시) 간 출력 순서 보장
+_log_dropped = [0]                # 버퍼 초과로 버린 기록 수
+_log_dropped_lock = threading.Lock() # 여러 스레드가 동시에 버릴 때 누락 없이 세기 위함 (버릴 때만 획득)
+_time_cache = [None, ""]          # (epoch 초, 포맷된 문자열) - 같은 초 안에서는 재포맷 생략
+
+def _open_log_file():
+    if not LOG_FILE:
+        return None
+    path = LOG_FILE
+    if CLUSTER_DB: # 다중 프로세스 모드: 프로세스마다 파일을 따로 씀 (교체 경합 방지)
+        root, ext = os.path.splitext(LOG_FILE)
+        path = f"{root}.{os.getpid()}{ext}"
+    try:
+        return RotatingLogFile(path)
+    except OSError as e:
+        print(f"⚠️ [로그 파일 열기 실패] {path}: {e}")
+        return None
+
+_log_file = _open_log_file()
+
+def add_log(message, level=None, ticker=None, event=None):
     """
     시스템 로그를 생성하여 콘솔 출력 및 메모리에 저장합니다.
-    - Console: 실시간 디버깅용
-    - server_logs: 웹 페이지(/) 조회용
+    호출 스레드는 큐에 넣기만 하고(대기 없음), 시간 포맷/출력/저장은 로그 스레드(KiwoomLog)가 모아서 처리합니다.
+    - Console / 로그 파일(LOG_FILE, 크기 기준 교체): 일괄 write 1회
+    - server_logs: 웹 페이지(/) 및 /logs 조회용
+    쓰지 않은 기록이 LOG_BUFFER_SIZE를 넘으면 새 기록은 버리고 개수만 셉니다. (kiwoom_log_dropped_total)
+    :param level: 미지정 시 메시지 아이콘으로 추정 (❌ ERROR / ⚠️ WARN / 그 외 INFO)
+    :param ticker: 관련 종목 코드 (필터링용)
+    :param event: 이벤트 유형 (예: order, webhook, rank)
+    """
+    if _log_queue.qsize() >= LOG_BUFFER_SIZE:
+        with _log_dropped_lock:
+            _log_dropped[0] += 1
+        return
+    _log_queue.put((time.time(), message, level, ticker, event))
+
+def _format_log_time(ts):
+    sec = int(ts)
+    if _time_cache[0] != sec:
+        _time_cache[1] = datetime.fromtimestamp(sec, KST).strftime('%Y-%m-%d %H:%M:%S')
+        _time_cache[0] = sec
+    return _time_cache[1]
+
+def _write_logs(batch):
+    """기록 묶음을 포맷해 콘솔/파일에 한 번씩 쓰고 로그 저장소에 한 번에 추가합니다."""
+    records, lines = [], []
+    for ts, message, level, ticker, event in batch:
+        time_str = _format_log_time(ts)
+        if level is None:
+            level = "ERROR" if message.startswith("❌") else "WARN" if message.startswith("⚠️") else "INFO"
+        lines.append(f"[{time_str}] {message}\n")
+        records.append((message, level, ticker, event, ts, time_str))
+    text = "".join(lines)
+    with _log_write_lock:
+        try:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+        except (OSError, ValueError):
+            pass # 콘솔이 닫혀도 파일/저장소 기록은 계속
+        if _log_file is not None:
+            try:
+                _log_file.write(text.encode("utf-8"))
+            except OSError as e:
+                sys.stderr.write(f"⚠️ [로그 파일 기록 실패] {e}\n")
+        server_logs.extend(records)
+
+def _drain_logs(first=None):
+    """큐에서 최대 LOG_BATCH_SIZE개를 꺼냅니다. (first: 이미 꺼낸 첫 기록)"""
+    batch = [first] if first is not None else []
+    while len(batch) < LOG_BATCH_SIZE:
+        try:
+            batch.append(_log_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+def _log_writer():
+    while True:
+        batch = _drain_logs(_log_queue.get())
+        try:
+            _write_logs(batch)
+        except Exception as e:
+            sys.stderr.write(f"❌ [로그 기록 오류] {e}\n")
+
+def flush_logs():
+    """대기 중인 로그를 호출 스레드에서 즉시 모두 기록합니다. (종료 시 유실 방지)"""
+    while True:
+        batch = _drain_logs()
+        if not batch:
+            return
+        _write_logs(batch)
+
+threading.Thread(target=_log_writer, name="KiwoomLog", daemon=True).start()
+atexit.register(flush_logs)
+
+def current_priority():
+    """현재 스레드의 API 호출 우선순위를 반환합니다. (작을수록 먼저, 매도/기본값 0)"""
+    return getattr(_dispatch_ctx, "priority", 0)
+
+def parse_signal(raw_data):
+    """
+    웹훅 본문 1건을 시그널 dict로 변환합니다. (1회 파싱)
+    - 표준 JSON (strict=False: 문자열 안의 줄바꿈도 허용하므로 별도 치환 불필요)
+    - TradingView 경고 메시지 포맷 ('메시지||{json}')
+    :raises ValueError: 파싱 실패 (args[0]은 응답용 사유 코드)
+    """
+    try:
+        data = json.loads(raw_data, strict=False)
+    except json.JSONDecodeError:
+        head, sep, json_str = raw_data.partition("||")
+        if not sep:
+            raise ValueError("invalid json")
+        try:
+            data = json.loads(json_str, strict=False)
+        except json.JSONDecodeError:
+            raise ValueError("invalid split format")
+    if not isinstance(data, dict):
+        raise ValueError("invalid json")
+    check_action(data)
+    return data
+
+def check_action(data):
+    """
+    매수/청산으로 분류되지 않는 action은 접수하지 않습니다. (매수 레인 용량을 차지하지 않도록)
+    :raises ValueError: "unknown action"
+    """
+    action = data.get("action")
+    if not isinstance(action, str) or not (is_exit_signal(action) or is_buy_signal(action)):
+        raise ValueError("unknown action")
+
+class Histogram():
+    """고정 구간 누적 히스토그램 (Prometheus histogram 형식)"""
+    def __init__(self, buckets=METRIC_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # 마지막 칸: +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+class MetricsRegistry():
+    """
+    운영 지표 저장소입니다. /metrics에서 Prometheus 텍스트 형식으로 노출합니다.
+    - observe(): 구간별 지연 히스토그램 (초)
+    - inc(): 누적 카운터
+    - gauge(): 조회 시점에 계산되는 값 (콜백)
+    - counter(): 다른 객체가 세고 있는 누적 값을 조회 시점에 읽는 카운터 (콜백, 이름은 _total로 끝남)
+    기록 비용은 dict 조회 + 락 1회 수준이라 운영 중 상시 사용합니다.
+    """
+    def __init__(self):
+        self._histograms = {}   # (name, labels) -> Histogram
+        self._counters = {}     # (name, labels) -> float
+        self._gauges = {}       # name -> (help, callback -> {labels: value})
+        self._counter_callbacks = {} # name -> callback (누적 값, counter 형식으로 노출)
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        hist = self._histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(key, Histogram())
+        hist.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, callback, help_text=""):
+        """:param callback: () -> {labels tuple: value} 또는 숫자"""
+        self._gauges[name] = callback
+        if help_text:
+            self._help[name] = help_text
+
+    def counter(self, name, callback, help_text=""):
+        """:param callback: () -> {labels tuple: value} 또는 숫자 (단조 증가하는 누적 값)"""
+        self._counter_callbacks[name] = callback
+        if help_text:
+            self._help[name] = help_text
+
+    @staticmethod
+    def _fmt_labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+    def snapshot(self):
+        """
+        현재 값을 JSON 직렬화 가능한 형태로 반환합니다. (다른 프로세스와 지표 공유용)
+        :return: {"histograms": [[name, labels, buckets, counts, sum, count]], "counters": [[name, labels, value]], "gauges": [...]}
+        """
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+        snap = {"histograms": [], "counters": [], "gauges": []}
+        for (name, labels), hist in histograms:
+            with hist._lock:
+                snap["histograms"].append([name, list(labels), list(hist.buckets), list(hist.counts), hist.sum, hist.count])
+        for (name, labels), value in counters:
+            snap["counters"].append([name, list(labels), value])
+        for kind, callbacks in (("counters", self._counter_callbacks), ("gauges", self._gauges)):
+            for name, callback in callbacks.items():
+                try:
+                    values = callback()
+                except Exception:
+                    continue
+                if not isinstance(values, dict):
+                    values = {(): values}
+                for labels, value in values.items():
+                    snap[kind].append([name, list(labels), value])
+        return snap
+
+    def render(self, labels=(), peers=()):
+        """
+        Prometheus text exposition format (0.0.4)
+        :param labels: 이 프로세스의 모든 지표에 붙일 라벨 (예: (("pid", 1234),))
+        :param peers: 다른 프로세스의 (labels, snapshot) 목록 - 함께 출력
+        """
+        merged = {"histograms": [], "counters": [], "gauges": []}
+        for extra, snap in [(labels, self.snapshot())] + list(peers):
+            extra = [tuple(pair) for pair in extra]
+            for kind, rows in snap.items():
+                for row in rows:
+                    merged[kind].append([row[0], [tuple(pair) for pair in row[1]] + extra] + row[2:])
+
+        lines = []
+        seen = set()
+        def _header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for name, labels, buckets, counts, total, count in sorted(merged["histograms"], key=lambda r: (r[0], r[1])):
+            _header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{self._fmt_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{self._fmt_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{self._fmt_labels(labels)} {count}")
+
+        for kind, type_name in (("counters", "counter"), ("gauges", "gauge")):
+            for name, labels, value in sorted(merged[kind], key=lambda r: (r[0], r[1])):
+                _header(name, type_name)
+                lines.append(f"{name}{self._fmt_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+metrics.counter("kiwoom_log_dropped_total", lambda: _log_dropped[0], "로그 버퍼 초과로 버린 기록 누적 수")
+metrics.gauge("kiwoom_log_queue_depth", lambda: _log_queue.qsize(), "로그 스레드가 아직 쓰지 않은 기록 수")
+
+class Startup():
+    """
+    기동 단계(토큰 발급 -> 커넥션 예열 -> 잔고 선적재)를 백그라운드에서 진행하고 준비 상태를 알려줍니다.
+    - 모듈 import는 네트워크를 기다리지 않으므로 gunicorn이 바로 포트를 열고 /webhook을 받습니다.
+    - 준비 전에 받은 시그널은 저널/스케줄러에 쌓아두고, 워커는 준비가 끝난 뒤에 집행합니다.
+    - 단계별 소요 시간(여러 계좌면 가장 느린 계좌 기준)은 /ready와 kiwoom_startup_seconds 지표로 확인합니다.
+    - 실패하면(기본 계좌 토큰 발급 시간 초과 등) STARTUP_RETRY_SECONDS 간격을 늘려가며 성공할 때까지 다시 시도합니다.
+      그동안은 failed로 보고 /webhook이 503으로 거절합니다. (집행할 수 없는 신호를 "queued"로 받지 않음)
+    """
+    def __init__(self, started):
+        self.started = started      # perf_counter 기준 측정 시작 시각
+        self.phases = {}            # 단계 -> 소요 시간 (초)
+        self.state = "idle"         # 현재 진행 중인 단계 (로그/상태 표시용)
+        self.error = None
+        self.attempts = 0           # prepare() 시도 횟수
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    @property
+    def failed(self):
+        """기동에 실패해 재시도 중인지 여부 (준비되면 False)"""
+        return self.error is not None and not self.ready
+
+    def wait(self, timeout=None):
+        """준비가 끝날 때까지 대기합니다. :return: 준비되었으면 True"""
+        return self._ready.wait(timeout)
+
+    def record(self, phase, since):
+        """since(perf_counter) 이후 경과 시간을 phase 소요 시간으로 기록합니다. (기존 값보다 길 때만)"""
+        elapsed = round(time.perf_counter() - since, 4)
+        with self._lock:
+            self.phases[phase] = max(self.phases.get(phase, 0), elapsed)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        self.state = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started)
+
+    def start(self, prepare):
+        """
+        prepare()를 백그라운드 스레드에서 실행하고, 끝나면 준비 완료로 표시합니다. (한 번만 실행)
+        :param prepare: 기동 작업 () -> None
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(prepare,), name="KiwoomStartup", daemon=True)
+        self._thread.start()
+
+    def _run(self, prepare):
+        delay = STARTUP_RETRY_SECONDS[0]
+        while True:
+            self.attempts += 1
+            try:
+                prepare()
+                break
+            except Exception as e:
+                self.error = str(e)
+                self.state = "failed"
+                add_log(f"❌ [기동 실패] {e} ({self.attempts}회째, {delay:.0f}초 후 재시도)")
+            time.sleep(delay)
+            delay = min(delay * 2, STARTUP_RETRY_SECONDS[1])
+        self.error = None
+        self.record("total", self.started)
+        self.state = "ready"
+        self._ready.set()
+        phases = " / ".join(f"{k} {v:.2f}초" for k, v in self.phases.items() if k != "total")
+        add_log(f"🟢 [기동 완료] 총 {self.phases['total']:.2f}초 ({phases})")
+
+    def status(self):
+        with self._lock:
+            phases = dict(self.phases)
+        return {"ready": self.ready, "state": self.state, "error": self.error, "attempts": self.attempts, "phases": phases,
+                "uptime": round(time.perf_counter() - self.started, 3)}
+
+startup = Startup(_BOOT_STARTED)
+metrics.gauge("kiwoom_startup_seconds", lambda: {(("phase", k),): v for k, v in dict(startup.phases).items()},
+              "콜드 스타트 단계별 소요 시간")
+metrics.gauge("kiwoom_ready", lambda: int(startup.ready), "키움 연결 준비 완료 여부")
+metrics.describe("kiwoom_webhook_parse_seconds", "웹훅 본문 파싱 시간")
+metrics.describe("kiwoom_queue_wait_seconds", "스케줄러 대기 시간 (레인별)")
+metrics.describe("kiwoom_buy_buffer_residency_seconds", "매수 후보가 선택기에 머문 시간")
+metrics.describe("kiwoom_ranking_seconds", "매수 후보 랭킹 산정 시간")
+metrics.describe("kiwoom_http_request_seconds", "키움 API HTTP 왕복 시간 (api-id별)")
+metrics.describe("kiwoom_rate_limit_wait_seconds", "호출 한도 대기 시간 (api-id별)")
+metrics.describe("kiwoom_buy_dispatch_seconds", "매수 배치 시작 -> 주문 응답까지의 시간")
+
+class SamplingProfiler():
+    """
+    대상 스레드의 호출 스택을 주기적으로 수집하는 샘플링 프로파일러입니다. (/admin/profile로 시작한 동안만 동작)
+    - interval마다 sys._current_frames()로 스택을 읽어 "스레드;파일:함수;... 횟수" collapsed 형식으로 집계합니다.
+      (flamegraph.pl / speedscope에 그대로 입력 가능)
+    - 벽시계 기준이라 CPU 사용뿐 아니라 호출 한도/HTTP/락 대기 구간도 함께 드러납니다.
+    - 수집은 전용 스레드(KiwoomProfiler)가 하므로 요청은 바로 반환되고, 프로파일링 중이 아닐 때는 아무 비용도 없습니다.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, threads=PROFILE_THREADS, interval=PROFILE_INTERVAL):
+        """:param threads: 스레드 이름에 포함될 문자열 목록 (None이면 모든 스레드)"""
+        self.id = next(self._ids)
+        self.threads = threads
+        self.interval = interval
+        self.seconds = 0.0
+        self.stacks = {}  # collapsed 스택 -> 샘플 수
+        self.samples = 0
+        self.elapsed = 0.0
+        self.done = threading.Event()
+
+    def start(self, seconds, on_done=None):
+        """백그라운드 스레드에서 seconds 동안 수집합니다. 끝나면 done이 설정되고 on_done(self)을 호출합니다."""
+        self.seconds = seconds
+        def _run():
+            try:
+                self.run(seconds)
+            finally:
+                if on_done:
+                    on_done(self)
+                self.done.set()
+        threading.Thread(target=_run, name="KiwoomProfiler", daemon=True).start()
+        return self
+
+    def status(self):
+        return {"id": self.id, "status": "done" if self.done.is_set() else "running", "seconds": self.seconds,
+                "interval": self.interval, "samples": self.samples}
+
+    def _wanted(self, name):
+        return self.threads is None or any(t in name for t in self.threads)
+
+    def run(self, seconds):
+        """seconds 동안 호출 스레드에서 샘플을 수집합니다."""
+        me = threading.get_ident()
+        started = time.monotonic()
+        deadline = started + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident)
+                if ident == me or name is None or not self._wanted(name):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(name.split(" ")[0]) # "Thread-3 (process_request_thread)" -> "Thread-3"
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+            time.sleep(self.interval)
+        self.elapsed = time.monotonic() - started
+        return self
+
+    def collapsed(self):
+        """:return: 샘플 수 내림차순 collapsed 스택 텍스트"""
+        return "".join(f"{k} {v}\n" for k, v in sorted(self.stacks.items(), key=lambda kv: -kv[1]))
+
+class SignalTracer():
+    """
+    다음 M개 시그널의 처리 과정을 구간(span)별로 기록합니다. (/admin/trace)
+    - 워커가 신호를 꺼낼 때 begin, 집행 스레드에서 attach, 저널 완료와 함께 end
+    - 추적 중인 스레드의 키움 API 호출마다 호출 한도 대기/HTTP 왕복 시간을 구간으로 남깁니다.
+    - 예약된 추적이 없으면 active가 False라 호출 지점의 비용은 속성 확인 1회뿐입니다.
+    """
+    def __init__(self, capacity=TRACE_MAX_SIGNALS):
+        self.active = False          # 예약 또는 진행 중인 추적이 있는지 (핫패스 확인용)
+        self.remaining = 0           # 추적할 남은 신호 수
+        self.traces = deque(maxlen=capacity)
+        self._open = {}              # id(data) -> 진행 중인 추적
+        self._lock = threading.Lock()
+
+    def arm(self, count):
+        """다음 count개 신호를 추적하도록 예약합니다. (이전 결과는 지움)"""
+        with self._lock:
+            self.remaining = count
+            self.traces.clear()
+            self.active = bool(count or self._open)
+
+    def begin(self, data, kind):
+        """워커가 신호를 꺼낼 때 호출합니다. 예약이 남아 있으면 추적을 시작합니다."""
+        if not self.remaining:
+            return
+        with self._lock:
+            if not self.remaining:
+                return
+            self.remaining -= 1
+            self._open[id(data)] = {"ticker": data.get("ticker"), "action": data.get("action"), "kind": kind,
+                                    "started": _format_log_time(time.time()), "t0": time.perf_counter(),
+                                    "status": None, "spans": []}
+
+    def attach(self, data, bind=True):
+        """
+        신호를 집행하는 스레드에 추적을 연결합니다. (매수는 버퍼 대기 시간을 구간으로 남김)
+        :param bind: False면 스레드에 연결하지 않고 반환만 함 (asyncio 태스크는 추적을 직접 들고 다님)
+        :return: 진행 중인 추적 또는 None
+        """
+        if not self.active:
+            return None
+        trace = self._open.get(id(data))
+        if trace is not None:
+            if trace["kind"] == "buy":
+                self._add(trace, "buffer", trace["t0"], time.perf_counter())
+            if bind:
+                _dispatch_ctx.trace = trace
+        return trace
+
+    def span(self, name, started, ended=None, trace=None, **fields):
+        """현재 스레드에 연결된 추적(또는 trace)에 구간을 추가합니다. (perf_counter 기준)"""
+        trace = trace or getattr(_dispatch_ctx, "trace", None)
+        if trace is not None:
+            self._add(trace, name, started, ended or time.perf_counter(), **fields)
+
+    @staticmethod
+    def _add(trace, name, started, ended, **fields):
+        trace["spans"].append({"name": name, "at_ms": round((started - trace["t0"]) * 1000, 2),
+                               "ms": round((ended - started) * 1000, 2), **fields})
+
+    def end(self, data, status):
+        """신호 처리가 끝나면 호출합니다. 추적을 닫고 보관합니다."""
+        if not self.active:
+            return
+        with self._lock:
+            trace = self._open.pop(id(data), None)
+            self.active = bool(self.remaining or self._open)
+        if trace is None:
+            return
+        if getattr(_dispatch_ctx, "trace", None) is trace:
+            _dispatch_ctx.trace = None
+        trace["status"] = status
+        trace["total_ms"] = round((time.perf_counter() - trace.pop("t0")) * 1000, 2)
+        with self._lock:
+            self.traces.append(trace)
+
+    def status(self):
+        with self._lock:
+            return {"remaining": self.remaining, "in_progress": len(self._open), "traces": list(self.traces)}
+
+tracer = SignalTracer()
+
+def normalize_ticker(code):
+    """잔고 응답의 종목코드('A005930')를 웹훅 티커 형식('005930')으로 정규화합니다."""
+    code = str(code or "").strip()
+    if code[:1] in ("A", "J", "Q") and code[1:].isdigit():
+        code = code[1:]
+    return code
+
+class DedupIndex():
+    """
+    웹훅 중복 수신(TradingView 재전송, 같은 알림 두 번 발송) 판정용 색인입니다.
+    - 키: 클라이언트가 준 signal_id, 없으면 ticker/action/price + 시각 구간의 해시
+        * 시각 구간: 신호의 time 필드(봉 시각 등), 없으면 도착 시각을 DEDUP_BUCKET_SECONDS 단위로 묶음
+          (구간 경계에 걸친 재전송도 잡도록 직전 구간까지 확인)
+    - 키는 8바이트 해시로 저장하고 TTL/최대 건수를 넘으면 오래된 것부터 버려 메모리 사용량이 일정합니다.
+    프로세스 내 색인이므로 다중 프로세스 모드에서는 같은 프로세스에 들어온 중복만 걸러집니다.
+    """
+    def __init__(self, ttl=DEDUP_TTL_SECONDS, capacity=DEDUP_CAPACITY, bucket=DEDUP_BUCKET_SECONDS):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.bucket = bucket
+        self._entries = OrderedDict() # key -> 만료 시각 (삽입 순 = 만료 순)
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    @staticmethod
+    def _digest(*parts):
+        return hashlib.blake2b("|".join(str(p) for p in parts).encode("utf-8"), digest_size=8).digest()
+
+    def keys(self, data, now=None):
+        """:return: [저장할 키, 추가로 확인할 키...]"""
+        if data.get("signal_id"):
+            return [self._digest("id", data["signal_id"])]
+        base = (data.get("ticker"), data.get("action"), data.get("price"))
+        if data.get("time"):
+            return [self._digest(*base, data["time"])]
+        slot = int((time.time() if now is None else now) // self.bucket)
+        return [self._digest(*base, slot), self._digest(*base, slot - 1)]
+
+    def check(self, data, now=None):
+        """
+        이미 받은 신호인지 확인하고, 처음이면 색인에 등록합니다.
+        :return: 등록한 키 (forget에 전달) / 중복이면 None
+        """
+        now = time.time() if now is None else now
+        keys = self.keys(data, now)
+        with self._lock:
+            self._expire(now)
+            if any(k in self._entries for k in keys):
+                self.duplicates += 1
+                return None
+            self._entries[keys[0]] = now + self.ttl
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            return keys[0]
+
+    def forget(self, key):
+        """
+        check()가 등록한 키를 취소합니다. (큐 확정에 실패해 클라이언트가 다시 보내야 하는 경우)
+        시각 구간을 다시 계산하지 않으므로 구간 경계를 넘긴 뒤에 취소해도 같은 키가 지워집니다.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _expire(self, now):
+        while self._entries:
+            key, expires_at = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+dedup = DedupIndex() # 웹훅 중복 수신 판정
+
+# ==========================================
+# [2-1] 시그널 스케줄러 (우선순위 레인 + 종목별 병합)
+# ==========================================
+class SignalScheduler():
     """
-    time_str = datetime.now(ZoneInfo("Asia/Seoul")).strftime('%Y-%m-%d %H:%M:%S')
-    log_entry = f"[{time_str}] {message}"
-    print(log_entry) 
-    server_logs.appendleft(log_entry)
+    웹훅 시그널을 워커에 전달하는 스케줄러입니다. (단일 FIFO 큐 대체)
+    - 레인 분리: 청산(exit) 레인이 항상 매수(buy) 레인보다 먼저 나갑니다.
+    - 종목별 병합: 같은 종목의 대기 중 신호와 합쳐 불필요한 처리를 없앱니다.
+        * 대기 중인 전량 청산이 있으면 이후 청산 신호는 중복이므로 버림
+        * 새 전량 청산은 대기 중인 부분 청산(예: Profit Target 1)을 대체 (대기 순서는 유지)
+        * 같은 문구의 청산 신호가 이미 대기 중이면 버림
+        * 청산 신호가 오면 같은 종목의 대기 중 매수 신호는 취소
+        * 같은 종목의 매수 신호는 최신 신호로 교체 (새 신호 도착 시각 기준으로 매수 레인 맨 뒤로 이동)
+    - Condition 기반 이벤트 대기로 신호 도착 즉시 워커가 깨어납니다. (타임아웃 폴링 없음)
+    - 접수 제어: 청산은 항상 받고, 매수는 레인 크기(max_buys)와 대기 시간으로 제한합니다.
+        * admit(): 웹훅 단계에서 매수 레인이 가득 찼거나(full) 워커가 정체되었으면(stalled) 거절
+        * max_age보다 오래 기다린 매수는 워커에 넘기지 않고 만료 (expired)
+        * 웹훅을 거치지 않고 들어온 신호(다중 프로세스 이관, 저널 복구)로 넘치면 가장 오래된 매수부터 버림 (shed)
+    queue.Queue와 같은 put / get(timeout) / qsize / task_done 인터페이스를 제공합니다.
+    """
+    def __init__(self, max_buys=QUEUE_MAX_BUYS, max_age=QUEUE_BUY_MAX_AGE, stall_seconds=QUEUE_STALL_SECONDS):
+        self.max_buys = max_buys
+        self.max_age = max_age
+        self.stall_seconds = stall_seconds
+        self._cond = threading.Condition()
+        self.on_discard = None       # 병합/만료/폐기로 버려진 신호 콜백 (data, reason) -> None
+        self._exits = deque()        # [data, alive, 도착 시각] 항목
+        self._buys = deque()
+        self._pending_exits = {}     # ticker -> [항목, ...]
+        self._pending_buys = {}      # ticker -> 항목
+        self._size = 0
+        self.coalesced = 0           # 병합/폐기된 신호 수
+        self.expired = 0             # 오래 대기해 만료된 매수 수
+        self.shed = 0                # 레인 초과로 버린 매수 수
+        self.rejected = 0            # 접수 단계에서 거절한 매수 수
+
+    def put(self, data):
+        with self._cond:
+            self._put(data)
+            self._cond.notify()
+
+    def put_many(self, items):
+        """여러 신호를 한 번의 락 획득으로 넣습니다."""
+        with self._cond:
+            for data in items:
+                self._put(data)
+            self._cond.notify()
+
+    def _drop(self, entry, reason="coalesced"):
+        entry[1] = False
+        self._size -= 1
+        self._discard(entry[0], reason)
+
+    def _discard(self, data, reason="coalesced"):
+        if reason == "coalesced":
+            self.coalesced += 1
+        if self.on_discard:
+            self.on_discard(data, reason)
+
+    def _drop_buy(self, entry, reason):
+        """대기 중인 매수 항목을 버립니다. (만료/초과)"""
+        ticker = entry[0].get("ticker")
+        if self._pending_buys.get(ticker) is entry:
+            del self._pending_buys[ticker]
+        self._drop(entry, reason)
+        if reason == "expired":
+            self.expired += 1
+        else:
+            self.shed += 1
+        add_log(f"⌛ [매수 {'만료' if reason == 'expired' else '폐기'}] {ticker} 대기 {time.monotonic() - entry[2]:.1f}초",
+                ticker=ticker, event="shed")
+
+    def _buy_depth(self):
+        return self._size - sum(len(v) for v in self._pending_exits.values())
+
+    def _oldest(self, lane):
+        """레인에서 가장 오래 대기 중인 항목 (버려진 항목은 정리)"""
+        while lane and not lane[0][1]:
+            lane.popleft()
+        return lane[0] if lane else None
+
+    def _expire_buys(self, now):
+        """매수 레인 앞쪽부터 max_age를 넘긴 매수를 만료시킵니다."""
+        while True:
+            entry = self._oldest(self._buys)
+            if entry is None or now - entry[2] < self.max_age:
+                return
+            self._buys.popleft()
+            self._drop_buy(entry, "expired")
+
+    def admit(self, items, backlog=None):
+        """
+        웹훅 접수 단계의 혼잡 검사입니다. (여기서 거절된 신호는 저널/큐에 들어가지 않음)
+        - 청산 신호: 항상 허용
+        - 매수 신호: 워커 정체(가장 오래된 신호가 stall_seconds 이상 대기) 시 "stalled", 매수 레인 잔여 용량 초과분은 "full"
+        :param backlog: 이 스케줄러 밖의 대기열 (대기 수, 가장 오래된 대기 시간) - 다중 프로세스 모드의 공유 큐/리더 레인
+        :return: (허용 목록, 거절 목록, 거절 사유 또는 None)
+        """
+        extra_depth, extra_age = backlog or (0, 0)
+        with self._cond:
+            now = time.monotonic()
+            self._expire_buys(now)
+            oldest = [e[2] for e in (self._oldest(self._exits), self._oldest(self._buys)) if e]
+            stalled = (bool(oldest) and now - min(oldest) >= self.stall_seconds) or extra_age >= self.stall_seconds
+            room = self.max_buys - self._buy_depth() - extra_depth
+
+            admitted, rejected = [], []
+            for data in items:
+                action = data.get("action", "")
+                if not is_buy_signal(action):
+                    admitted.append(data)
+                elif not stalled and room > 0:
+                    admitted.append(data)
+                    room -= 1
+                else:
+                    rejected.append(data)
+            self.rejected += len(rejected)
+            reason = ("stalled" if stalled else "full") if rejected else None
+            return admitted, rejected, reason
+
+    def oldest_age(self):
+        """:return: (청산 레인, 매수 레인) 가장 오래된 신호의 대기 시간 (초, 비어 있으면 0)"""
+        with self._cond:
+            now = time.monotonic()
+            return tuple(round(now - e[2], 3) if e else 0 for e in (self._oldest(self._exits), self._oldest(self._buys)))
+
+    def _put(self, data):
+        action = data.get("action", "")
+        ticker = data.get("ticker")
+
+        if not is_exit_signal(action) and not is_buy_signal(action):
+            self._discard(data, "ignored") # 웹훅을 거치지 않은 알 수 없는 action (저널 복구/이관)
+            return
+
+        if is_exit_signal(action):
+            # 대기 중인 매수는 청산 신호로 무의미해짐
+            pending_buy = self._pending_buys.pop(ticker, None)
+            if pending_buy:
+                self._drop(pending_buy)
+
+            pending = self._pending_exits.setdefault(ticker, [])
+            if any(is_full_exit(e[0].get("action", "")) or e[0].get("action") == action for e in pending):
+                self._discard(data)
+                return # 이미 전량 청산(또는 동일 신호)이 대기 중
+            if is_full_exit(action) and pending:
+                # 첫 부분 청산 자리를 전량 청산으로 교체, 나머지는 폐기
+                replaced, pending[0][0] = pending[0][0], data
+                for entry in pending[1:]:
+                    self._drop(entry)
+                del pending[1:]
+                self._discard(replaced)
+                return
+            entry = [data, True, time.monotonic()]
+            pending.append(entry)
+            self._exits.append(entry)
+
+        elif ticker in self._pending_buys:
+            # 최신 매수 신호로 교체: 기존 자리는 비우고 맨 뒤에 다시 넣음
+            # (매수 레인은 도착 시각 순이어야 _expire_buys가 앞쪽만 보고 만료할 수 있음)
+            replaced = self._pending_buys[ticker]
+            replaced[1] = False
+            entry = [data, True, time.monotonic()]
+            self._pending_buys[ticker] = entry
+            self._buys.append(entry)
+            self._discard(replaced[0])
+            return # 대기 수(_size)는 그대로
+
+        else:
+            entry = [data, True, time.monotonic()]
+            self._pending_buys[ticker] = entry
+            self._buys.append(entry)
+            if self._buy_depth() >= self.max_buys:
+                self._drop_buy(self._oldest(self._buys), "shed") # 가장 오래된 매수부터 버림 (메모리 상한)
+        self._size += 1
+
+    def _pop(self):
+        self._expire_buys(time.monotonic()) # 오래된 매수는 워커에 넘기지 않음
+        for lane in (self._exits, self._buys):
+            while lane:
+                entry = lane.popleft()
+                if not entry[1]:
+                    continue
+                data = entry[0]
+                ticker = data.get("ticker")
+                if lane is self._exits:
+                    pending = self._pending_exits.get(ticker)
+                    if pending and entry in pending:
+                        pending.remove(entry)
+                        if not pending:
+                            del self._pending_exits[ticker]
+                elif self._pending_buys.get(ticker) is entry:
+                    del self._pending_buys[ticker]
+                self._size -= 1
+                metrics.observe("kiwoom_queue_wait_seconds", time.monotonic() - entry[2],
+                                lane="exit" if lane is self._exits else "buy")
+                return data
+        return None
+
+    def get(self, timeout=None):
+        """
+        다음 신호를 꺼냅니다. (청산 레인 우선)
+        :param timeout: 최대 대기 시간 (None이면 신호가 올 때까지 대기)
+        :raises queue.Empty: timeout 안에 신호가 없을 때
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+                if not self._cond.wait_for(lambda: self._size > 0, timeout=remaining):
+                    raise queue.Empty
+                data = self._pop()
+                if data is not None:
+                    return data # None: 남은 신호가 모두 만료됨
+
+    def qsize(self):
+        return self._size
+
+    def lane_sizes(self):
+        """:return: (청산 대기 수, 매수 대기 수)"""
+        with self._cond:
+            exits = sum(len(v) for v in self._pending_exits.values())
+            return exits, self._size - exits
+
+    def task_done(self):
+        pass # queue.Queue 호환용
+
+order_queue = SignalScheduler() # 웹훅 수신 데이터 -> 워커 전달용 스케줄러
+metrics.counter("kiwoom_webhook_duplicates_total", lambda: dedup.duplicates, "중복으로 판정되어 버린 웹훅 누적 수")
+metrics.gauge("kiwoom_dedup_index_size", lambda: len(dedup), "중복 판정 색인 보관 건수")
+metrics.counter("kiwoom_signals_coalesced_total", lambda: order_queue.coalesced, "병합/폐기된 신호 누적 수")
+metrics.counter("kiwoom_signals_shed_total", lambda: {(("reason", "expired"),): order_queue.expired, (("reason", "shed"),): order_queue.shed,
+                                                      (("reason", "rejected"),): order_queue.rejected},
+                "접수 제어로 버리거나 거절한 매수 신호 누적 수")
+
+# ==========================================
+# [2-2] 시그널 저널 (Write-Ahead Log)
+# ==========================================
+class SignalJournal():
+    """
+    수신한 시그널과 처리 결과를 기록하는 append-only 저널입니다. (재기동/장애 시 유실 방지)
+    - 한 줄에 JSON 기록 1건:
+        {"op": "a", "id", "ts", "data"}   접수 (웹훅 수신)
+        {"op": "d", "id"}                 주문 전송 시작
+        {"op": "c", "id", "status"}       처리 완료 (주문 결과/병합/탈락)
+    - group commit: 전용 스레드가 쌓인 기록을 한 번에 쓰고 fsync 1회로 확정합니다.
+      웹훅은 자기 접수 기록이 확정될 때까지만 기다리므로, 동시 요청이 많을수록 fsync 1회를 여럿이 나눠 씁니다.
+    - 완료/전송 기록은 기다리지 않습니다. (유실돼도 재기동 시 안전한 쪽으로 처리됨)
+    - 재기동 시 replay(): 완료되지 않은 접수 신호를 돌려주고, 남은 기록만으로 파일을 다시 씁니다.
+        * 전송 시작 후 완료 기록이 없는 신호는 이중 주문 위험이 있어 재실행하지 않고 경고만 남김
+        * JOURNAL_REPLAY_BUY_SECONDS보다 오래된 매수 신호는 만료 처리
+    - 완료 기록이 대부분이 되면 미완료 기록만 남기도록 압축합니다.
+    단일 프로세스 기준입니다. (같은 파일을 여러 프로세스가 열면 안 됨)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.enabled = bool(path)
+        self._cond = threading.Condition()
+        self._pending = []       # 아직 쓰지 않은 기록 (bytes)
+        self._appended = 0       # 마지막으로 대기열에 들어간 기록 순번
+        self._durable = 0        # fsync까지 끝난 마지막 기록 순번
+        self._next_id = 1
+        self._live = {}          # id -> (기록 순번, [기록 bytes]) : 완료되지 않은 신호
+        self._file = None
+        self._size = 0
+        self._thread = None
+        self.commits = 0
+        self.records = 0
+        self.max_sid = 0         # 다중 프로세스 모드: 저널에 옮겨진 마지막 공유 큐 id (중복 이관 방지)
+
+    @staticmethod
+    def _encode(record):
+        return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def replay(self):
+        """
+        기존 저널을 읽어 미완료 신호를 복구하고, 파일을 압축한 뒤 기록 스레드를 시작합니다.
+        :return: 다시 큐에 넣을 시그널 목록 (data["_jid"]에 저널 id 포함)
+        """
+        if not self.enabled:
+            return []
+        accepted, dispatched, completed = {}, set(), set()
+        self.max_sid = 0
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue # 기록 도중 중단된 마지막 줄
+                    jid = record.get("id", 0)
+                    self._next_id = max(self._next_id, jid + 1)
+                    if record.get("op") == "a":
+                        accepted[jid] = record
+                        self.max_sid = max(self.max_sid, (record.get("data") or {}).get("_sid", 0))
+                    elif record.get("op") == "d":
+                        dispatched.add(jid)
+                    elif record.get("op") == "c":
+                        completed.add(jid)
+
+        now = time.time()
+        replayed, expired, unknown = [], [], []
+        for jid, record in accepted.items():
+            if jid in completed:
+                continue
+            data = record.get("data") or {}
+            if jid in dispatched:
+                unknown.append(data.get("ticker"))
+            elif "BUY" in data.get("action", "") and now - record.get("ts", 0) > JOURNAL_REPLAY_BUY_SECONDS:
+                expired.append(data.get("ticker"))
+            else:
+                self._live[jid] = (0, [self._encode(record)])
+                replayed.append({**data, "_jid": jid})
+
+        self._rewrite()
+        self._thread = threading.Thread(target=self._writer, name="KiwoomJournal", daemon=True)
+        self._thread.start()
+
+        if unknown:
+            add_log(f"⚠️ [저널 복구] 주문 전송 중 중단된 신호 {len(unknown)}건은 재실행하지 않습니다. 체결 여부를 확인하세요: {unknown}")
+        if expired:
+            add_log(f"🗑️ [저널 복구] 오래된 매수 신호 {len(expired)}건 만료: {expired}")
+        if replayed:
+            add_log(f"♻️ [저널 복구] 미처리 신호 {len(replayed)}건을 다시 대기열에 넣습니다.")
+        return replayed
+
+    def _rewrite(self):
+        """미완료 기록만으로 저널 파일을 다시 씁니다. (임시 파일 -> fsync -> 교체)"""
+        with self._cond:
+            lines = [b"".join(chunks) for seq, chunks in self._live.values() if seq <= self._durable]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        try:
+            dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+            try:
+                os.fsync(dir_fd) # 파일 교체(rename) 자체를 확정
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass
+        if self._file:
+            self._file.close()
+        self._file = open(self.path, "ab")
+        self._size = sum(len(line) for line in lines)
+
+    def _live_bytes(self):
+        with self._cond:
+            return sum(len(c) for _, chunks in self._live.values() for c in chunks)
+
+    def _enqueue(self, chunk):
+        """기록을 대기열에 넣고 순번을 돌려줍니다. (self._cond 보유 상태에서 호출)"""
+        self._pending.append(chunk)
+        self._appended += 1
+        self._cond.notify_all()
+        return self._appended
+
+    def accept(self, items, timeout=JOURNAL_SYNC_TIMEOUT):
+        """
+        시그널 접수 기록을 남기고 fsync로 확정될 때까지 기다립니다.
+        각 data에 저널 id("_jid")를 붙입니다.
+        :return: timeout 안에 확정되면 True
+        """
+        if not self.enabled:
+            return True
+        started = time.perf_counter()
+        now = time.time()
+        with self._cond:
+            for data in items:
+                jid = self._next_id
+                self._next_id += 1
+                chunk = self._encode({"op": "a", "id": jid, "ts": now, "data": data})
+                data["_jid"] = jid
+                self._live[jid] = (self._enqueue(chunk), [chunk])
+            target = self._appended
+            ok = self._cond.wait_for(lambda: self._durable >= target, timeout=timeout)
+        metrics.observe("kiwoom_journal_wait_seconds", time.perf_counter() - started)
+        if not ok:
+            for data in items:
+                self.complete(data, "rejected") # 503으로 거절한 신호는 재기동 시 복구 대상에서 제외
+        return ok
+
+    def dispatched(self, data):
+        """주문 전송 직전 기록 (기다리지 않음)"""
+        jid = data.get("_jid") if self.enabled else None
+        if jid is None:
+            return
+        with self._cond:
+            live = self._live.get(jid)
+            if live is None:
+                return
+            chunk = self._encode({"op": "d", "id": jid})
+            live[1].append(chunk)
+            self._enqueue(chunk)
+
+    def complete(self, data, status):
+        """처리 완료 기록 (기다리지 않음)"""
+        jid = data.get("_jid") if self.enabled else None
+        if jid is None:
+            return
+        with self._cond:
+            if self._live.pop(jid, None) is None:
+                return
+            self._enqueue(self._encode({"op": "c", "id": jid, "status": status}))
+
+    def _writer(self):
+        """group commit 스레드: 쌓인 기록을 한 번에 쓰고 fsync 1회"""
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+            if JOURNAL_COMMIT_DELAY:
+                time.sleep(JOURNAL_COMMIT_DELAY)
+            with self._cond:
+                batch, self._pending = self._pending, []
+                last_seq = self._appended
+            started = time.perf_counter()
+            try:
+                data = b"".join(batch)
+                self._file.write(data)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                add_log(f"❌ [저널 기록 실패] {e}")
+                with self._cond:
+                    self._pending[:0] = batch # 다음 시도에서 다시 기록
+                time.sleep(1)
+                continue
+            metrics.observe("kiwoom_journal_commit_seconds", time.perf_counter() - started)
+            with self._cond:
+                self._durable = last_seq
+                self._size += len(data)
+                self.commits += 1
+                self.records += len(batch)
+                self._cond.notify_all()
+            if self._size > JOURNAL_COMPACT_BYTES and self._size > 4 * self._live_bytes():
+                try:
+                    self._rewrite()
+                    add_log(f"🗜️ [저널 압축] 미완료 {len(self._live)}건만 남겼습니다. ({self._size:,} bytes)")
+                except OSError as e:
+                    add_log(f"❌ [저널 압축 실패] {e}")
+
+journal = SignalJournal(JOURNAL_PATH)
+order_queue.on_discard = lambda data, reason: journal.complete(data, reason)
+metrics.describe("kiwoom_journal_wait_seconds", "웹훅이 저널 확정(fsync)을 기다린 시간")
+metrics.describe("kiwoom_journal_commit_seconds", "저널 group commit 1회 (write + fsync) 시간")
+metrics.gauge("kiwoom_journal_records_per_commit", lambda: round(journal.records / journal.commits, 2) if journal.commits else 0,
+              "group commit 1회당 평균 기록 수")
+
+# ==========================================
+# [2-3] 다중 프로세스 모드 (공유 큐 + 리더 선출)
+# ==========================================
+class ClusterCoordinator():
+    """
+    gunicorn 등으로 여러 프로세스를 띄울 때, 웹훅 수신은 모든 프로세스가 나눠 받고
+    주문 집행(워커/토큰/랭킹)은 리더 프로세스 하나만 수행하도록 조율합니다.
+    - 공유 큐: SQLite(WAL)의 signals 테이블. 웹훅은 INSERT 커밋(확정) 후 "queued" 응답
+    - 리더 선출: <db>.leader 파일의 fcntl.flock 배타 잠금. 잠금을 얻은 프로세스만 리더가 되고,
+      리더 프로세스가 죽으면 OS가 잠금을 풀어 다른 프로세스가 CLUSTER_ELECT_SECONDS 안에 이어받습니다.
+    - 리더의 pump 스레드가 공유 큐의 시그널을 id 순으로 저널(SignalJournal)에 옮긴 뒤 삭제하고 스케줄러에 넣습니다.
+      저널에 기록된 마지막 공유 큐 id(_sid) 이하는 다시 옮기지 않으므로, 리더가 바뀌어도 주문은 한 번만 나갑니다.
+    - 지표: 각 프로세스가 주기적으로 스냅샷을 metrics 테이블에 올리고, /metrics는 전체를 pid 라벨로 합쳐 보여줍니다.
+    - 접수 제어: 리더는 스케줄러 레인 크기를 lanes 테이블에 올리고, 모든 프로세스는 공유 큐의 미이관 행과
+      리더 레인을 합친 클러스터 대기열(queue_view)로 매수 접수를 판단합니다.
+    gunicorn은 --preload 없이 실행해야 합니다. (포크 전에 시작된 스레드는 자식 프로세스에 없음)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.enabled = bool(path)
+        self.pid = os.getpid()
+        self.is_leader = False
+        self.on_elected = None   # 리더가 되었을 때 1회 호출 () -> None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._lock_file = None
+        self.pumped = 0
+
+    @property
+    def labels(self):
+        return (("pid", self.pid),) if self.enabled else ()
+
+    def start(self, on_elected):
+        if fcntl is None:
+            raise RuntimeError("다중 프로세스 모드(KIWOOM_CLUSTER_DB)는 fcntl을 지원하는 OS(Linux/macOS)에서만 사용할 수 있습니다.")
+        self.on_elected = on_elected
+        self._conn = sqlite_connect(self.path, synchronous=CLUSTER_SYNCHRONOUS)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS signals (id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL, data TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS metrics (pid INTEGER PRIMARY KEY, role TEXT, updated_at REAL, snapshot TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS lanes (pid INTEGER PRIMARY KEY, updated_at REAL, exits INTEGER, buys INTEGER, "
+                           "exit_age REAL, buy_age REAL)")
+        threading.Thread(target=self._elect_loop, name="KiwoomCluster", daemon=True).start()
+
+    def submit(self, items):
+        """
+        시그널을 공유 큐에 넣고 커밋(확정)합니다.
+        :return: 확정되면 True
+        """
+        now = time.time()
+        rows = [(now, json.dumps(data, ensure_ascii=False)) for data in items]
+        try:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.executemany("INSERT INTO signals (ts, data) VALUES (?, ?)", rows)
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            add_log(f"❌ [공유 큐 기록 실패] {e}")
+            return False
+        if self.is_leader:
+            self._wake.set() # 리더 프로세스가 받은 신호는 폴링 없이 바로 이관
+        return True
+
+    def _try_lock(self):
+        lock_file = open(self.path + ".leader", "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file # 프로세스가 살아있는 동안 잠금 유지
+        return True
+
+    def _elect_loop(self):
+        while True:
+            if not self.is_leader and self._try_lock():
+                self.is_leader = True
+                add_log(f"👑 [리더 선출] pid {self.pid} 프로세스가 주문 집행을 맡습니다.")
+                try:
+                    self.on_elected()
+                except Exception as e:
+                    add_log(f"❌ [리더 기동 오류] {e}")
+                threading.Thread(target=self._pump, name="KiwoomPump", daemon=True).start()
+            self._publish_metrics()
+            time.sleep(CLUSTER_ELECT_SECONDS)
+
+    def _pump(self):
+        """리더 전용: 공유 큐 -> 저널 -> 스케줄러"""
+        cursor = journal.max_sid
+        with self._lock:
+            self._conn.execute("DELETE FROM signals WHERE id <= ?", (cursor,)) # 이전 리더가 저널에 옮긴 뒤 못 지운 행
+        while True:
+            try:
+                with self._lock:
+                    rows = self._conn.execute("SELECT id, data FROM signals WHERE id > ? ORDER BY id LIMIT ?",
+                                              (cursor, CLUSTER_PUMP_BATCH)).fetchall()
+                if not rows:
+                    self._wake.wait(CLUSTER_POLL_SECONDS)
+                    self._wake.clear()
+                    continue
+                signals = [{**json.loads(data), "_sid": sid} for sid, data in rows]
+                while not journal.accept(signals):
+                    time.sleep(0.1)
+                cursor = rows[-1][0]
+                with self._lock:
+                    self._conn.execute("DELETE FROM signals WHERE id <= ?", (cursor,))
+                order_queue.put_many(signals)
+                self.pumped += len(signals)
+                start_worker_if_needed()
+            except Exception as e:
+                add_log(f"❌ [공유 큐 이관 오류] {e}")
+                time.sleep(1)
+
+    def _publish_metrics(self):
+        try:
+            snapshot = json.dumps(metrics.snapshot(), ensure_ascii=False)
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO metrics (pid, role, updated_at, snapshot) VALUES (?, ?, ?, ?)",
+                                   (self.pid, "leader" if self.is_leader else "follower", time.time(), snapshot))
+                self._conn.execute("DELETE FROM metrics WHERE updated_at < ?", (time.time() - 10 * CLUSTER_ELECT_SECONDS,))
+                if self.is_leader:
+                    (exits, buys), (exit_age, buy_age) = order_queue.lane_sizes(), order_queue.oldest_age()
+                    self._conn.execute("DELETE FROM lanes WHERE pid != ?", (self.pid,)) # 이전 리더 기록
+                    self._conn.execute("INSERT OR REPLACE INTO lanes (pid, updated_at, exits, buys, exit_age, buy_age) VALUES (?, ?, ?, ?, ?, ?)",
+                                       (self.pid, time.time(), exits, buys, exit_age, buy_age))
+        except sqlite3.Error as e:
+            add_log(f"⚠️ [지표 공유 실패] {e}")
+
+    def queue_view(self):
+        """
+        클러스터 전체 대기열입니다. (접수 제어/지표용)
+        - exit/buy: 리더 스케줄러의 레인 (리더는 자기 스케줄러, 팔로워는 리더가 올린 값. 최근 값이 없으면 0)
+        - shared: 공유 큐에 남아 아직 리더가 옮기지 않은 시그널 (COUNT(*), MIN(ts))
+        :return: {"exit": (대기 수, 가장 오래된 대기 시간), "buy": (...), "shared": (...)}
+        """
+        if self.is_leader:
+            (exits, buys), (exit_age, buy_age) = order_queue.lane_sizes(), order_queue.oldest_age()
+        else:
+            with self._lock:
+                row = self._conn.execute("SELECT exits, buys, exit_age, buy_age FROM lanes WHERE updated_at >= ? "
+                                         "ORDER BY updated_at DESC LIMIT 1",
+                                         (time.time() - 3 * CLUSTER_ELECT_SECONDS,)).fetchone()
+            exits, buys, exit_age, buy_age = row or (0, 0, 0, 0)
+        with self._lock:
+            pending, oldest_ts = self._conn.execute("SELECT COUNT(*), MIN(ts) FROM signals").fetchone()
+        shared_age = round(max(time.time() - oldest_ts, 0), 3) if oldest_ts is not None else 0
+        return {"exit": (exits, exit_age), "buy": (buys, buy_age), "shared": (pending, shared_age)}
+
+    def backlog(self):
+        """
+        이 프로세스의 스케줄러 밖에 쌓인 대기열입니다. (SignalScheduler.admit의 backlog 인자)
+        공유 큐의 미이관 행은 매수/청산을 구분하지 않고 모두 매수 레인 용량에 포함합니다.
+        :return: (대기 수, 가장 오래된 대기 시간) - 단일 프로세스 모드이면 None
+        """
+        if not self.enabled or self._conn is None:
+            return None
+        view = self.queue_view()
+        if self.is_leader:
+            return view["shared"] # 리더 레인은 스케줄러가 직접 셈
+        return view["buy"][0] + view["shared"][0], max(age for _, age in view.values())
+
+    def peer_metrics(self):
+        """:return: 다른 프로세스들의 [(labels, snapshot)] (최근 갱신분만)"""
+        if not self.enabled:
+            return []
+        with self._lock:
+            rows = self._conn.execute("SELECT pid, snapshot FROM metrics WHERE pid != ? AND updated_at >= ?",
+                                      (self.pid, time.time() - 3 * CLUSTER_ELECT_SECONDS)).fetchall()
+        return [((("pid", pid),), json.loads(snapshot)) for pid, snapshot in rows]
+
+cluster = ClusterCoordinator(CLUSTER_DB)
+metrics.gauge("kiwoom_cluster_leader", lambda: int(cluster.is_leader), "이 프로세스가 주문 집행 리더인지 여부")
+
+def queue_view():
+    """
+    접수 제어/지표 기준 대기열
+    :return: {레인: (대기 수, 가장 오래된 대기 시간)} - 다중 프로세스 모드에서는 클러스터 전체 (shared: 공유 큐 미이관분)
+    """
+    if cluster.enabled:
+        return cluster.queue_view()
+    (exits, buys), (exit_age, buy_age) = order_queue.lane_sizes(), order_queue.oldest_age()
+    return {"exit": (exits, exit_age), "buy": (buys, buy_age)}
+
+metrics.gauge("kiwoom_queue_depth", lambda: {(("lane", lane),): depth for lane, (depth, _) in queue_view().items()},
+              "대기 신호 수 (레인별, 다중 프로세스 모드에서는 클러스터 전체)")
+metrics.gauge("kiwoom_queue_oldest_age_seconds", lambda: {(("lane", lane),): age for lane, (_, age) in queue_view().items()},
+              "가장 오래 대기 중인 신호의 대기 시간 (레인별, 다중 프로세스 모드에서는 클러스터 전체)")
+
+# 종목 마스터: 기존 파일은 import 시점에 바로 열고(mmap, 네트워크 없음), 갱신은 기동 후 백그라운드에서
+symbols = symbol_master.SymbolMaster(SYMBOL_MASTER_PATH)
+symbols.open()
+metrics.gauge("kiwoom_symbols_loaded", lambda: len(symbols), "종목 마스터 종목 수")
+
+def log_symbols(count):
+    if symbols.is_current:
+        add_log(f"📚 [종목 마스터] {count:,}종목 (기준일 {symbols.date})")
+    else:
+        add_log(f"⚠️ [종목 마스터] 오늘 목록을 받지 못했습니다. (보유: {count:,}종목, 기준일 {symbols.date or '-'}) 가격 제한폭 검사는 생략합니다.")
 
 # ==========================================
 # [3] 키움 증권 API 클래스
 # ==========================================
-class KiwoomAPI():
+class KiwoomTransport():
+    """
+    키움 REST API 요청을 전담하는 HTTP 전송 계층입니다.
+    - 하나의 Session을 공유하여 keep-alive 커넥션을 재사용합니다. (요청마다 TLS 핸드셰이크 X)
+    - 모든 요청에 api-id별 (connect, read) 타임아웃을 적용하여 워커가 무한 대기하지 않도록 합니다.
+    """
+    def __init__(self, base_url, pool_size=HTTP_POOL_SIZE):
+        self.base_url = base_url
+        self.session = requests.Session()
+        # 재시도는 상위 로직(토큰 재발급 등)에서 판단하므로 어댑터 자동 재시도는 끕니다.
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+    def post(self, path, api_id, headers, payload):
+        """
+        POST 요청을 전송합니다.
+        :param path: base_url 이후 경로 (예: /api/dostk/ordr)
+        :param api_id: 타임아웃 선택 기준 (HTTP_TIMEOUTS 키)
+        :return: requests.Response (타임아웃/연결 실패 시 예외 발생)
+        """
+        timeout = HTTP_TIMEOUTS.get(api_id, HTTP_DEFAULT_TIMEOUT)
+        return self.session.post(f"{self.base_url}{path}", headers=headers, json=payload, timeout=timeout)
+
+    def warm_up(self, connections=HTTP_WARM_CONNECTIONS):
+        """
+        커넥션 풀에 keep-alive 커넥션을 미리 채워둡니다.
+        동시에 요청을 보내야 서로 다른 커넥션이 열리므로 스레드로 병렬 실행합니다.
+        """
+        def _touch():
+            try:
+                self.session.head(self.base_url, timeout=HTTP_TIMEOUTS["warmup"])
+            except Exception:
+                pass # 워밍업 실패는 치명적이지 않음 (실제 요청 시 다시 연결)
+
+        threads = [threading.Thread(target=_touch, daemon=True) for _ in range(connections)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        stats = self.stats()
+        add_log(f"🔥 [커넥션 워밍업] 핸드셰이크: {stats['handshakes']}회 | 요청: {stats['requests']}회")
+
+    def stats(self):
+        """
+        커넥션 풀 사용 통계를 반환합니다.
+        - handshakes: 새로 연 커넥션 수 (= TLS 핸드셰이크 횟수)
+        - reused: 기존 커넥션을 재사용한 요청 수
+        """
+        handshakes = total = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None: continue
+            handshakes += pool.num_connections
+            total += pool.num_requests
+        return {"requests": total, "handshakes": handshakes, "reused": max(total - handshakes, 0)}
+
+class TokenBucket():
+    """
+    초당 rate개씩 토큰이 채워지고 최대 capacity개까지 쌓이는 토큰 버킷입니다.
+    토큰이 없으면 다음 토큰이 채워질 때까지 호출 스레드를 대기시킵니다.
+    대기자는 (priority, 도착 순서) 순으로 토큰을 받습니다. (한도 부족 시 랭킹 순서 보장)
+    """
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiters = []               # (priority, seq) 최소 힙
+        self._seq = itertools.count()
+        # 대기 통계
+        self.acquired = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority=0):
+        """
+        토큰 1개를 소비합니다. (필요 시 대기)
+        :param priority: 대기열 우선순위 (작을수록 먼저)
+        :return: 대기한 시간 (초)
+        """
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            started = time.monotonic()
+            now = started
+            while True:
+                self._refill(now)
+                is_head = self._waiters[0] == ticket
+                if is_head and self._tokens >= 1:
+                    heapq.heappop(self._waiters)
+                    self._tokens -= 1
+                    break
+                # 선두는 다음 토큰 충전 시점까지, 나머지는 선두가 빠질 때까지 대기
+                self._cond.wait((1 - self._tokens) / self.rate if is_head else None)
+                now = time.monotonic()
+            self._cond.notify_all() # 다음 선두 대기자 깨움
+
+            waited = now - started
+            self.acquired += 1
+            if waited > 0:
+                self.waits += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+            return waited
+
+    def try_acquire(self):
+        """대기 없이 토큰 1개를 소비합니다. (대기자가 있거나 토큰이 없으면 False)"""
+        with self._cond:
+            self._refill(time.monotonic())
+            if self._waiters or self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.acquired += 1
+            return True
+
+    def refund(self):
+        """try_acquire로 받은 토큰을 돌려줍니다."""
+        with self._cond:
+            self._tokens = min(self.capacity, self._tokens + 1)
+            self.acquired -= 1
+            self._cond.notify_all()
+
+    async def acquire_async(self, priority=0):
+        """
+        acquire()의 asyncio 버전입니다. 이벤트 루프를 막지 않고 asyncio.sleep으로 대기합니다.
+        스레드 대기자가 있으면 그 뒤로 양보합니다. (코루틴끼리는 priority 대신 깨어난 순서)
+        :return: 대기한 시간 (초)
+        """
+        started = time.monotonic()
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                self._refill(now)
+                if not self._waiters and self._tokens >= 1:
+                    self._tokens -= 1
+                    waited = now - started
+                    self.acquired += 1
+                    if waited > 0:
+                        self.waits += 1
+                        self.wait_total += waited
+                        self.wait_max = max(self.wait_max, waited)
+                    return waited
+                delay = max((1 - self._tokens) / self.rate, 0.001)
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            "rate": self.rate,
+            "acquired": self.acquired,
+            "waits": self.waits,
+            "wait_total": round(self.wait_total, 3),
+            "wait_max": round(self.wait_max, 3),
+            "wait_avg": round(self.wait_total / self.waits, 3) if self.waits else 0.0,
+        }
+
+class RateLimiter():
+    """
+    api-id별 토큰 버킷 + 전체(global) 버킷으로 키움 API 호출 속도를 제한합니다.
+    고정 sleep 대신 실제 허용 한도만큼만 대기합니다.
+    """
+    def __init__(self, limits=RATE_LIMITS):
+        self.buckets = {api_id: TokenBucket(rate, burst) for api_id, (rate, burst) in limits.items()}
+
+    def acquire(self, api_id, priority=0):
+        """
+        요청 전송 전 호출합니다. api-id 버킷 -> global 버킷 순으로 토큰을 확보합니다.
+        :param priority: 한도 부족 시 대기 순서 (작을수록 먼저)
+        :return: 총 대기 시간 (초)
+        """
+        waited = 0.0
+        bucket = self.buckets.get(api_id)
+        if bucket:
+            waited += bucket.acquire(priority)
+        if "global" in self.buckets:
+            waited += self.buckets["global"].acquire(priority)
+        return waited
+
+    def try_acquire(self, api_id):
+        """
+        대기 없이 api-id 버킷과 global 버킷의 토큰을 모두 확보합니다. (헤지 요청용 - 한도 여유가 있을 때만 전송)
+        :return: 확보하면 True (하나라도 부족하면 아무것도 소비하지 않고 False)
+        """
+        taken = []
+        for key in (api_id, "global"):
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                continue
+            if not bucket.try_acquire():
+                for b in taken:
+                    b.refund()
+                return False
+            taken.append(bucket)
+        return True
+
+    async def acquire_async(self, api_id, priority=0):
+        """acquire()의 asyncio 버전입니다."""
+        waited = 0.0
+        bucket = self.buckets.get(api_id)
+        if bucket:
+            waited += await bucket.acquire_async(priority)
+        if "global" in self.buckets:
+            waited += await self.buckets["global"].acquire_async(priority)
+        return waited
+
+    def stats(self):
+        """버킷별 대기 통계를 반환합니다."""
+        return {api_id: bucket.stats() for api_id, bucket in self.buckets.items()}
+
+class BreakerOpen(Exception):
+    """서킷 브레이커가 차단 중이라 요청을 보내지 않았음을 알립니다."""
+
+class CircuitBreaker():
+    """
+    api-id별 서킷 브레이커입니다. (멱등 조회 전용)
+    - closed: 정상 전송. 연속 실패(예외/5xx)가 threshold회에 이르면 open
+    - open: cooldown 동안 호출하지 않고 즉시 실패 (호출부는 캐시된 계좌 상태로 대체)
+    - half_open: cooldown이 지나면 시험 요청 1건만 통과. 성공하면 closed, 실패하면 cooldown을 2배로 늘려 다시 open
+    """
+    def __init__(self, name, threshold=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.min_cooldown, self.max_cooldown = cooldown
+        self.cooldown = self.min_cooldown
+        self.state = "closed"
+        self.failures = 0        # 연속 실패 수
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """:return: 요청을 보내도 되면 True"""
+        if self.state == "closed":
+            return True
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open" # 이 호출이 시험 요청 (나머지는 결과가 나올 때까지 계속 차단)
+                add_log(f"🩺 [서킷 시험] {self.name} 시험 요청을 보냅니다.")
+                return True
+            return self.state == "closed"
+
+    def record(self, ok):
+        """요청 결과를 반영합니다."""
+        with self._lock:
+            if ok:
+                if self.state != "closed":
+                    add_log(f"✅ [서킷 복구] {self.name} 정상 응답 - 조회를 재개합니다.")
+                self.state = "closed"
+                self.failures = 0
+                self.cooldown = self.min_cooldown
+                return
+            self.failures += 1
+            if self.state == "half_open":
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self._open()
+            elif self.state == "closed" and self.failures >= self.threshold:
+                self._open()
+
+    def _open(self):
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        add_log(f"⛔ [서킷 차단] {self.name} 연속 실패 {self.failures}회 -> {self.cooldown:g}초간 조회 차단 (캐시된 계좌 상태 사용)")
+
+class PositionBook():
+    """
+    계좌 보유 잔고(kt00018)의 메모리 스냅샷입니다.
+    - 정확한 종목코드를 키로 하는 dict 인덱스 (부분 문자열 매칭 X)
+    - POSITION_CACHE_SECONDS 이내에는 재조회 없이 스냅샷을 공유합니다.
+    - 동시 조회 시 한 번만 API를 호출합니다. (나머지는 갱신 완료를 대기)
+    """
+    def __init__(self, fetch, ttl=POSITION_CACHE_SECONDS):
+        """:param fetch: {ticker: {"name", "qty"}} 또는 실패 시 None을 반환하는 조회 함수"""
+        self._fetch = fetch
+        self.ttl = ttl
+        self._positions = {}
+        self._loaded_at = None   # 마지막 성공 조회 시각 (monotonic)
+        self._lock = threading.Lock()
+        self.live = False        # 체결 스트림 연결 중: 체결이 증분 반영되므로 TTL 만료 없이 스냅샷 사용
+
+    def _is_fresh(self):
+        if self._loaded_at is None:
+            return False
+        return self.live or time.monotonic() - self._loaded_at < self.ttl
+
+    def refresh(self, force=False):
+        """
+        스냅샷이 만료되었으면 1회 조회로 전체 잔고를 갱신합니다.
+        :return: 스냅샷이 최신이면 True (조회 실패 시 False)
+        """
+        if not force and self._is_fresh():
+            return True
+        with self._lock:
+            if not force and self._is_fresh():
+                return True # 대기하는 동안 다른 스레드가 갱신함
+            positions = self._fetch()
+            if positions is None: # 실패/조회 차단 시 기존 스냅샷 유지
+                return False
+            self._positions = positions
+            self._loaded_at = time.monotonic()
+            return True
+
+    def get(self, ticker):
+        """
+        :return: (종목명, 보유수량) 튜플. 미보유 시 (None, 0)
+        """
+        self.refresh()
+        pos = self._positions.get(ticker)
+        if not pos:
+            return None, 0
+        return pos["name"], pos["qty"]
+
+    def name(self, ticker):
+        """:return: 현재 스냅샷의 종목명 (조회하지 않음, 미보유 시 None)"""
+        pos = self._positions.get(ticker)
+        return pos["name"] if pos else None
+
+    def snapshot(self):
+        """현재 스냅샷 사본을 반환합니다. {ticker: {"name", "qty"}}"""
+        self.refresh()
+        return {t: dict(p) for t, p in self._positions.items()}
+
+    def invalidate(self):
+        """다음 조회 시 반드시 재조회하도록 스냅샷을 만료시킵니다."""
+        self._loaded_at = None
+
+    def apply_order(self, trade_type, ticker, qty):
+        """
+        주문 접수 성공을 스냅샷에 반영합니다.
+        - 매도: 보유 수량을 즉시 차감 (연속 청산 신호의 중복 매도 방지)
+        - 매수: 체결 스트림이 연결되어 있으면 체결 시 반영, 아니면 체결 수량을 알 수 없으므로 스냅샷을 만료시킴
+        """
+        if trade_type != "sell":
+            if not self.live:
+                self.invalidate()
+            return
+        self.adjust(ticker, -int(qty))
+
+    def adjust(self, ticker, delta, name=None):
+        """보유 수량을 delta만큼 증감합니다. (체결 반영용, 0 이하가 되면 목록에서 제거)"""
+        with self._lock:
+            pos = self._positions.get(ticker) or {"name": name or ticker, "qty": 0}
+            remain = pos["qty"] + int(delta)
+            if remain > 0:
+                self._positions[ticker] = {**pos, "qty": remain}
+            else:
+                self._positions.pop(ticker, None)
+
+class OrderBook():
+    """
+    주문번호별 주문/체결 장부입니다. 실시간 체결 스트림(ExecutionFeed)의 메시지를 PositionBook에 증분 반영합니다.
+    - 체결량은 누적값 기준 차이만 반영하므로 같은 메시지를 두 번 받아도 한 번만 적용됩니다.
+    - 매도: 주문 접수 시점에 보유 수량에서 미리 차감하고(중복 매도 방지), 거부/취소된 잔량만 되돌립니다.
+      봇이 내지 않은 주문(HTS 등)의 매도 체결은 체결될 때 차감합니다.
+    - 매수: 체결될 때마다 보유 수량에 더합니다.
+    - 스트림 메시지가 send_order 응답보다 먼저 와도 같은 주문번호 항목으로 합쳐집니다.
+    """
+    def __init__(self, positions, capacity=EXEC_ORDER_CAPACITY):
+        self.positions = positions
+        self.capacity = capacity
+        self._orders = OrderedDict() # 주문번호 -> 항목 (접수 순)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(ord_no):
+        """응답/스트림마다 다른 앞자리 0 표기를 통일합니다. ('0000012' -> '12')"""
+        return str(ord_no or "").strip().lstrip("0") or None
+
+    def _entry(self, key, side, ticker):
+        entry = self._orders.get(key)
+        if entry is None:
+            entry = {"ord_no": key, "side": side, "ticker": ticker, "qty": 0, "filled": 0, "remaining": 0,
+                     "deducted": 0, "status": "", "local": False}
+            self._orders[key] = entry
+            while len(self._orders) > self.capacity:
+                closed = next((k for k, e in self._orders.items() if e["remaining"] <= 0 and k != key), None)
+                self._orders.pop(closed if closed is not None else next(iter(self._orders)))
+        return entry
+
+    def accepted(self, trade_type, ticker, qty, ord_no=None):
+        """send_order 접수 성공을 기록합니다. (PositionBook.apply_order 대체)"""
+        key = self._key(ord_no)
+        if key is None:
+            self.positions.apply_order(trade_type, ticker, qty)
+            return
+        qty = int(qty)
+        with self._lock:
+            entry = self._entry(key, trade_type, ticker)
+            entry["local"] = True
+            if not entry["qty"]:
+                entry["qty"] = qty
+                entry["remaining"] = max(qty - entry["filled"], 0)
+            deduct = 0
+            if trade_type == "sell":
+                deduct, entry["deducted"] = qty - entry["deducted"], qty
+        if trade_type == "sell":
+            if deduct > 0:
+                self.positions.adjust(ticker, -deduct)
+        else:
+            self.positions.apply_order(trade_type, ticker, qty)
+
+    def apply(self, event):
+        """
+        실시간 주문체결 이벤트 1건을 반영합니다. (KiwoomRequests.parse_execution 결과)
+        :return: 이번 이벤트로 새로 체결된 수량
+        """
+        with self._lock:
+            if event.get("cancel_of"):
+                entry = self._orders.get(self._key(event["cancel_of"]))
+                if entry is None:
+                    return 0
+                canceled = min(event["qty"], entry["remaining"]) if event["qty"] else entry["remaining"]
+                entry["remaining"] -= canceled
+                entry["status"] = "취소"
+                restore = 0
+                if entry["side"] == "sell":
+                    restore = min(canceled, max(entry["deducted"] - entry["filled"], 0))
+                    entry["deducted"] -= restore
+                ticker, adjust, delta = entry["ticker"], restore, 0
+            else:
+                entry = self._entry(self._key(event["ord_no"]), event["side"], event["ticker"])
+                if event["qty"]:
+                    entry["qty"] = event["qty"]
+                entry["remaining"] = event["remaining"]
+                entry["status"] = event["status"]
+                delta = max(event["filled"] - entry["filled"], 0)
+                entry["filled"] += delta
+                adjust = 0
+                if entry["side"] == "buy":
+                    adjust = delta
+                else:
+                    if entry["filled"] > entry["deducted"]: # 접수 기록보다 체결이 먼저 왔거나 외부 주문
+                        adjust -= entry["filled"] - entry["deducted"]
+                        entry["deducted"] = entry["filled"]
+                    if event["status"] == "거부":
+                        adjust += entry["deducted"] - entry["filled"]
+                        entry["deducted"] = entry["filled"]
+                ticker = entry["ticker"]
+        if adjust:
+            self.positions.adjust(ticker, adjust, event.get("name"))
+        return delta
+
+    def rebase(self, broker_orders):
+        """
+        체결 스트림 (재)연결 시, 방금 받은 잔고 스냅샷을 기준으로 장부를 다시 맞춥니다. (구독 전에 호출)
+        단절 중 체결된 수량은 스냅샷에 이미 들어 있으므로, 브로커 누적 체결량을 기준값으로 삼아
+        이후 스트림 메시지에서는 그 뒤에 체결된 차이만 반영합니다. (이중 반영 방지)
+        - 브로커 미체결 목록에 없는 주문: 단절 중 완료/취소된 것으로 보고 닫음
+          (스냅샷에 이미 반영되었으므로 주문 수량 전체를 기준값으로 삼아 늦게 온 체결 메시지는 무시)
+        - 봇이 낸 미체결 매도 잔량: 스냅샷 보유 수량에 포함되어 있으므로 다시 차감 (중복 매도 방지)
+        - 봇이 모르는 미체결 주문(HTS 등): 같은 기준값으로 새로 등록
+        :param broker_orders: KiwoomRequests.parse_open_orders 결과
+        """
+        broker_orders = {self._key(k): v for k, v in broker_orders.items()}
+        deductions = []
+        with self._lock:
+            for key, entry in self._orders.items():
+                if key not in broker_orders:
+                    entry["remaining"] = 0
+                    entry["filled"] = entry["deducted"] = max(entry["filled"], entry["qty"])
+
+            for key, order in broker_orders.items():
+                entry = self._entry(key, order["side"], order["ticker"])
+                entry.update(qty=order["qty"] or entry["qty"], filled=order["filled"], remaining=order["remaining"])
+                entry["deducted"] = entry["filled"]
+                if entry["side"] == "sell" and entry["local"] and entry["remaining"] > 0:
+                    entry["deducted"] += entry["remaining"]
+                    deductions.append((entry["ticker"], entry["remaining"]))
+        for ticker, qty in deductions:
+            self.positions.adjust(ticker, -qty)
+
+    def open_orders(self):
+        """:return: 미체결 잔량이 남은 주문 목록 (사본)"""
+        with self._lock:
+            return [dict(e) for e in self._orders.values() if e["remaining"] > 0]
+
+    def __len__(self):
+        return len(self._orders)
+
+class ExecutionFeed():
+    """
+    키움 실시간 주문체결(type 00) 스트림을 받아 OrderBook -> PositionBook을 갱신합니다.
+    - 실서버: WebSocket (LOGIN -> REG 등록 -> REAL/PING 수신, aiohttp 필요)
+    - 로컬 모의 서버(mock_kiwoom.py): 같은 메시지를 한 줄씩 흘려주는 /_mock/stream (NDJSON)
+    - 연결 중에는 PositionBook을 live로 두어 청산 시 kt00018 왕복 없이 로컬 잔고로 수량을 정합니다.
+    - 끊기면 live를 해제하고, 다시 연결될 때까지 EXEC_POLL_SECONDS마다 kt00018 1회로 전체 잔고를 재조회합니다.
+    - (재)연결 시 구독 전에 잔고(kt00018)와 미체결 주문(ka10075)으로 장부를 다시 맞추고(_resync),
+      구독이 확인되면 live로 전환합니다. 재정렬에 실패하면 live로 두지 않고 재연결합니다. (단절 중 놓친 체결 보정)
+    """
+    REGISTER = {"trnm": "REG", "grp_no": "1", "refresh": "1", "data": [{"item": [""], "type": ["00"]}]}
+
+    def __init__(self, api, url):
+        self.api = api
+        self.url = url
+        self.enabled = bool(url)
+        self.connected = False
+        self.reconnects = 0
+        self._down = threading.Event() # 스트림 단절 중 (일괄 폴링 스레드 동작 조건)
+        self._synced = False           # 이번 연결에서 구독 전 장부 재정렬을 마쳤는지
+        self._thread = None
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        if self.url.startswith("ws") and aiohttp is None:
+            # requirements.txt에 포함된 필수 의존성: 빠졌다면 배포 오류이므로 조용히 넘기지 않음
+            add_log(f"❌ [체결 스트림 비활성] aiohttp가 설치되지 않아 실시간 체결을 받을 수 없습니다. @{self.api.name} "
+                    "(pip install -r requirements.txt 필요, 그동안 잔고는 kt00018 캐시 조회)")
+            self.enabled = False
+            return
+        self._down.set()
+        self._thread = threading.Thread(target=self._run, name=f"KiwoomExec-{self.api.name}", daemon=True)
+        self._thread.start()
+        threading.Thread(target=self._poll_loop, name=f"KiwoomExecPoll-{self.api.name}", daemon=True).start()
+
+    def _run(self):
+        delay = EXEC_FEED_RECONNECT_SECONDS[0]
+        while True:
+            try:
+                if self.url.startswith("ws"):
+                    asyncio.run(self._consume_ws())
+                else:
+                    self._consume_http()
+                reason = "서버가 연결을 종료함"
+            except Exception as e:
+                reason = str(e) or type(e).__name__
+            if self.connected:
+                delay = EXEC_FEED_RECONNECT_SECONDS[0] # 한 번이라도 연결됐으면 대기 초기화
+                self._on_disconnected(reason)
+            time.sleep(delay)
+            delay = min(delay * 2, EXEC_FEED_RECONNECT_SECONDS[1])
+            self.reconnects += 1
+
+    def _consume_http(self):
+        self._resync() # 모의 스트림은 연결 즉시 구독(REG)까지 확인되므로 열기 전에 맞춤
+        headers = {**self.api.headers, **self.api.tokens.header()}
+        with requests.get(self.url, headers=headers, stream=True, timeout=(3, EXEC_FEED_IDLE_TIMEOUT)) as res:
+            if res.status_code != 200:
+                raise ConnectionError(f"HTTP {res.status_code}")
+            for line in res.iter_lines():
+                if line:
+                    self._handle(json.loads(line))
+
+    async def _consume_ws(self):
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(self.url, receive_timeout=EXEC_FEED_IDLE_TIMEOUT) as ws:
+                await ws.send_json({"trnm": "LOGIN", "token": self.api.tokens.ensure()})
+                async for msg in ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        continue
+                    message = json.loads(msg.data)
+                    trnm = message.get("trnm")
+                    if trnm == "PING":
+                        await ws.send_str(msg.data) # 받은 그대로 돌려보내야 연결이 유지됨
+                    elif trnm == "LOGIN" and str(message.get("return_code")) == "0":
+                        self._resync()
+                        await ws.send_json(self.REGISTER)
+                    else:
+                        self._handle(message)
+
+    def _handle(self, message):
+        trnm = message.get("trnm")
+        if trnm in ("LOGIN", "REG"):
+            if str(message.get("return_code", 0)) != "0":
+                raise ConnectionError(f"{trnm} 실패: {message.get('return_msg')}")
+            if trnm == "REG":
+                self._on_connected()
+        elif trnm == "REAL":
+            for item in message.get("data") or []:
+                if item.get("type") != "00":
+                    continue
+                event = self.api.parse_execution(item.get("values") or {})
+                if event is None:
+                    continue
+                filled = self.api.orders.apply(event)
+                if filled:
+                    metrics.inc("kiwoom_exec_fills_total", filled, side=event["side"], account=self.api.name)
+                    add_log(f"🤝 [체결] {event['ticker']} {'매수' if event['side'] == 'buy' else '매도'} {filled}주"
+                            f" (누적 {event['filled']}/{event['qty']}, 주문번호:{event['ord_no']})",
+                            ticker=event["ticker"], event="fill")
+
+    def _resync(self):
+        """구독 전 장부 재정렬: 잔고 스냅샷 -> 미체결 주문 기준값. 실패하면 예외 (연결을 버리고 재시도)"""
+        self._synced = False
+        if not self.api.positions.refresh(force=True):
+            raise ConnectionError("잔고 스냅샷 실패")
+        open_orders = self.api.fetch_open_orders()
+        if open_orders is None:
+            raise ConnectionError("미체결 조회 실패")
+        self.api.orders.rebase(open_orders)
+        self._synced = True
+
+    def _on_connected(self):
+        if not self._synced:
+            raise ConnectionError("장부 재정렬 전에 구독이 확인됨")
+        self.api.positions.live = True
+        self.connected = True
+        self._down.clear()
+        add_log(f"📡 [체결 스트림 연결] @{self.api.name} 잔고를 로컬에서 갱신합니다.")
+
+    def _on_disconnected(self, reason):
+        self.api.positions.live = False
+        self.connected = False
+        self._down.set()
+        metrics.inc("kiwoom_exec_feed_disconnects_total", account=self.api.name)
+        add_log(f"⚠️ [체결 스트림 단절] @{self.api.name} {reason} -> {EXEC_POLL_SECONDS}초 주기 잔고 조회로 전환")
+
+    def _poll_loop(self):
+        """스트림 단절 중에만 전체 잔고를 주기적으로 재조회합니다. (조회 1회로 모든 종목 갱신)"""
+        while True:
+            self._down.wait()
+            try:
+                self.api.positions.refresh(force=True)
+            except Exception as e:
+                add_log(f"❌ [잔고 폴링 오류] @{self.api.name} {e}")
+            time.sleep(EXEC_POLL_SECONDS)
+
+def exec_feed_url(base_url):
+    """계좌 base_url에 맞는 주문체결 스트림 주소 (EXEC_FEED_URL이 auto가 아니면 그 값)"""
+    if EXEC_FEED_URL != "auto":
+        return EXEC_FEED_URL
+    if base_url.startswith("http://"):
+        return f"{base_url}/_mock/stream" # 로컬 모의 서버
+    host = base_url.split("://", 1)[-1].split("/", 1)[0]
+    return f"wss://{host}:10000/api/dostk/websocket"
+
+class TokenManager():
+    """
+    접근 토큰의 수명을 관리합니다.
+    - 발급 응답의 만료 시각(expires_dt)을 기록하고, 만료 TOKEN_REFRESH_MARGIN초 전에 백그라운드에서 재발급합니다.
+    - 여러 스레드가 동시에 재발급을 요청해도 실제 발급은 한 번만 수행합니다. (single-flight)
+    - 모든 요청은 header()로 현재 토큰을 주입받습니다.
+    """
+    def __init__(self, issue):
+        """:param issue: (token, 만료 epoch 초) 또는 실패 시 None을 반환하는 발급 함수"""
+        self._issue = issue
+        self.token = None
+        self.expires_at = 0.0
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._issued = threading.Event() # 최초 발급 성공
+        self._thread = None
+
+    def is_valid(self, margin=0):
+        return bool(self.token) and time.time() < self.expires_at - margin
+
+    def refresh(self, stale_token=None):
+        """
+        토큰을 재발급합니다. 이미 다른 스레드가 재발급 중이면 그 결과를 기다려 공유합니다.
+        :param stale_token: 호출자가 만료로 판단한 토큰 (이미 교체되었으면 재발급 생략)
+        :return: 현재 토큰 or None
+        """
+        with self._lock:
+            if self.token and self.token != stale_token and self.is_valid():
+                return self.token # 대기하는 동안 다른 스레드가 재발급함
+            issued = self._issue()
+            if issued:
+                self.token, self.expires_at = issued
+                self.refreshes += 1
+                metrics.inc("kiwoom_token_refreshes_total")
+                self._issued.set()
+                self._wake.set() # 백그라운드 갱신 일정 재계산
+            return self.token if self.is_valid() else None
+
+    def ensure(self):
+        """유효한 토큰을 반환합니다. (만료된 경우에만 즉시 재발급)"""
+        if self.is_valid():
+            return self.token
+        return self.refresh(stale_token=self.token)
+
+    def header(self):
+        """:return: 요청 헤더에 병합할 authorization 헤더 (dict)"""
+        token = self.ensure()
+        return {"authorization": f"Bearer {token}"} if token else {}
+
+    def start(self):
+        """최초 토큰을 발급하고 선제 갱신 스레드를 시작합니다. (최초 발급 실패 시 갱신 스레드가 재시도)"""
+        self.refresh()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name="KiwoomToken", daemon=True)
+            self._thread.start()
+
+    def wait_issued(self, timeout=None):
+        """최초 토큰 발급이 성공할 때까지 대기합니다. :return: 발급되었으면 True"""
+        return self._issued.wait(timeout)
+
+    def _refresh_loop(self):
+        while True:
+            if self.token:
+                delay = self.expires_at - TOKEN_REFRESH_MARGIN - time.time()
+            else:
+                delay = 0
+            if delay > 0:
+                self._wake.clear()
+                self._wake.wait(timeout=delay)
+                continue # 깨어난 뒤 일정 재계산
+
+            add_log("🔑 [토큰 갱신] 만료 전 선제 재발급을 시작합니다.")
+            if not self.refresh(stale_token=self.token) or not self.is_valid(margin=TOKEN_REFRESH_MARGIN):
+                time.sleep(TOKEN_RETRY_SECONDS) # 실패(또는 수명이 마진보다 짧음) 시 잠시 후 재시도
+
+class CashLedger():
+    """
+    주문 가능 현금(kt00011)의 프로세스 내 장부입니다.
+    - 매수 배치마다 kt00011 1회로 장부를 맞추고(sync), 배치 전체 예산을 우선순위대로 배정합니다.
+    - 배정된 금액은 예약(reserve)되며, 주문 접수 시 확정(commit), 거절 시 해제(release)됩니다.
+    - 배치 종료 후 CASH_RECONCILE_SECONDS 뒤 브로커와 다시 대조합니다.
+    - 대조는 진행 중인 배치와 겹칠 수 있습니다. (dispatch_buy_batch는 접수를 기다리지 않고 반환)
+      그래서 조회를 시작하기 전에 확정된 사용액만 브로커 금액에 반영된 것으로 보고, 조회 중/후에 접수된 주문과
+      아직 접수 전인 예약은 그대로 차감합니다. (늦게 시작한 조회의 응답이 먼저 반영되면 이전 응답은 버림)
+    가용 현금 = 브로커 현금 - 예약 중 금액 - 마지막으로 반영한 조회 이후 확정된 금액
+    """
+    def __init__(self, fetch):
+        """:param fetch: (ticker, price) -> (주문가능금액, 주문가능수량) 조회 함수 (kt00011, 조회 차단 중이면 None)"""
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.broker_cash = 0
+        self.reserved = {}         # 예약 id -> 금액
+        self.committed = 0         # 누적 확정(접수) 금액
+        self.settled = 0           # 그중 브로커 금액에 반영된 것으로 본 누적 금액 (반영한 조회 시작 시점의 committed)
+        self.synced_at = None
+        self._sync_seq = 0         # 시작한 조회 순번
+        self._applied_seq = 0      # 장부에 반영한 조회 순번
+        self._probe = None         # 재대조 시 사용할 (ticker, price) - kt00011은 종목/단가가 필요
+        self._timer = None
+
+    @property
+    def spent(self):
+        """마지막으로 반영한 조회 이후 접수된 주문 금액"""
+        return self.committed - self.settled
+
+    @property
+    def available(self):
+        return max(self.broker_cash - sum(self.reserved.values()) - self.spent, 0)
+
+    def sync(self, ticker, price):
+        """
+        브로커 주문 가능 현금으로 장부를 맞춥니다. (kt00011 1회, 조회 차단 중이면 장부 유지)
+        진행 중인 배치의 예약과 조회 도중 접수된 주문은 지우지 않습니다. (다음 대조에서 정산)
+        """
+        with self._lock:
+            self._sync_seq += 1
+            seq, mark = self._sync_seq, self.committed # 조회 전에 접수된 주문까지만 브로커 금액에 반영됨
+        result = self._fetch(ticker, price)
+        if result is None:
+            return self.available
+        cash, _ = result
+        with self._lock:
+            if seq > self._applied_seq: # 더 늦게 시작한 조회가 이미 반영되었으면 버림
+                self._applied_seq = seq
+                self.broker_cash = cash
+                self.settled = mark
+                self.synced_at = time.time()
+            self._probe = (ticker, price)
+        return cash
+
+    def estimate(self, price):
+        """
+        마지막 대조 기준 장부로 주문 가능 현금/수량을 추정합니다. (kt00011 조회 차단 중 대체값)
+        :return: (가용 현금, 가능 수량) - 대조한 적이 없으면 (0, 0)
+        """
+        if self.synced_at is None or price <= 0:
+            return 0, 0
+        cash = self.available
+        return cash, int(cash // price)
+
+    def reserve(self, amount):
+        """
+        가용 현금 한도 내에서 amount를 예약합니다.
+        :return: {"id", "amount"} (amount는 실제 배정액, 부족 시 0일 수 있음)
+        """
+        with self._lock:
+            granted = min(int(amount), self.available)
+            res_id = next(self._ids)
+            self.reserved[res_id] = granted
+            return {"id": res_id, "amount": granted}
+
+    def commit(self, reservation, used):
+        """주문 접수: 예약을 해제하고 실제 주문 금액을 사용액으로 확정합니다."""
+        with self._lock:
+            self.reserved.pop(reservation["id"], None)
+            self.committed += int(used)
+
+    def release(self, reservation):
+        """주문 거절/미전송: 예약을 해제하여 다른 주문이 쓸 수 있게 합니다."""
+        with self._lock:
+            self.reserved.pop(reservation["id"], None)
+
+    def allocate(self, targets, per_order=None):
+        """
+        랭킹 순으로 정렬된 매수 대상에 예산을 배정합니다. (상위 종목부터 TARGET_BUY_AMOUNT씩)
+        :return: 대상별 예약 리스트 (targets와 같은 순서)
+        """
+        return [self.reserve(self.order_amount(target, per_order)) for target in targets]
+
+    @staticmethod
+    def order_amount(target, per_order=None):
+        """대상 1건에 필요한 예산 (실제 주문할 수량 x 가격, 1주 가격이 목표 금액보다 비싸면 최소 1주)"""
+        per_order = TARGET_BUY_AMOUNT if per_order is None else per_order
+        return strategy.order_amount(float(target.get("price", 0) or 0), per_order)
+
+    def schedule_reconcile(self, delay=None):
+        """delay초 뒤 브로커와 재대조를 예약합니다. (이미 예약되어 있으면 유지)"""
+        if self._probe is None or (self._timer and self._timer.is_alive()):
+            return
+        delay = CASH_RECONCILE_SECONDS if delay is None else delay
+        self._timer = threading.Timer(delay, self._reconcile)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _reconcile(self):
+        try:
+            local = self.available
+            cash = self.sync(*self._probe)
+            add_log(f"🧾 [현금 대조] 장부 가용: {local:,}원 -> 브로커: {cash:,}원")
+        except Exception as e:
+            add_log(f"❌ [현금 대조 오류] {e}")
+
+class KiwoomRequests():
+    """
+    동기(KiwoomAPI) / 비동기(AsyncKiwoomAPI) 클라이언트가 공유하는 요청 생성 및 응답 해석 로직입니다.
+    각 요청 빌더는 (경로, api-id, 페이로드) 튜플을 반환합니다.
+    """
+    @staticmethod
+    def token_request(app_key, app_secret):
+        data = {
+            "grant_type": "client_credentials",
+            "appkey": app_key,
+            "secretkey": app_secret
+        }
+        return "/oauth2/token", "oauth2", data
+
+    @staticmethod
+    def stock_info_request(ticker):
+        return "/api/dostk/stkinfo", "ka10001", {"stk_cd": ticker}
+
+    @staticmethod
+    def symbol_list_request(market_code):
+        return "/api/dostk/stkinfo", "ka10099", {"mrkt_tp": market_code}
+
+    @staticmethod
+    def balance_request():
+        payload = {
+            "dmst_stex_tp": "KRX",
+            "qry_tp": "1"
+        }
+        return "/api/dostk/acnt", "kt00018", payload
+
+    @staticmethod
+    def open_orders_request():
+        payload = {
+            "all_stk_tp": "0", # 전체 종목
+            "trde_tp": "0",    # 매수+매도
+            "stk_cd": "",
+            "stex_tp": "0",
+        }
+        return "/api/dostk/acnt", "ka10075", payload
+
+    @staticmethod
+    def orderable_request(ticker, price):
+        payload = {
+            "stk_cd": ticker,
+            "uv": str(price), # API 요청 시 문자열 변환 필수
+        }
+        return "/api/dostk/acnt", "kt00011", payload
+
+    @staticmethod
+    def order_request(trade_type, ticker, price, qty, stop=0):
+        api_id = "kt10000" if trade_type == "buy" else "kt10001"
+        ord_prc = int(float(price))
+
+        # 주문 유형 결정 (지정가/시장가/스탑로스 등)
+        if ord_prc == 0:
+            trde_tp = "3" # 시장가
+        else:
+            trde_tp = "0" if stop != 0 else "00" # 지정가 (API 문서에 따라 코드 확인 필요)
+
+        # JSON 페이로드 구성
+        payload = {
+            "dmst_stex_tp": "KRX",
+            "stk_cd": ticker,
+            "ord_qty": str(qty),
+            "ord_uv": str(ord_prc),
+            "trde_tp": trde_tp,
+        }
+        return "/api/dostk/ordr", api_id, payload
+
+    @staticmethod
+    def parse_token(resp):
+        return resp.get("token") or resp.get("access_token")
+
+    @staticmethod
+    def parse_token_expiry(resp):
+        """
+        토큰 만료 시각을 epoch 초로 반환합니다.
+        expires_dt(YYYYMMDDhhmmss, KST) -> expires_in(초) -> TOKEN_DEFAULT_TTL 순으로 사용합니다.
+        """
+        expires_dt = resp.get("expires_dt")
+        if expires_dt:
+            try:
+                return datetime.strptime(str(expires_dt), "%Y%m%d%H%M%S").replace(tzinfo=KST).timestamp()
+            except ValueError:
+                pass
+        if resp.get("expires_in"):
+            return time.time() + float(resp["expires_in"])
+        return time.time() + TOKEN_DEFAULT_TTL
+
+    @staticmethod
+    def parse_positions(data):
+        """잔고 리스트 -> {정규화된 종목코드: {"name", "qty"}}"""
+        positions = {}
+        for stock in data.get('acnt_evlt_remn_indv_tot', []):
+            ticker = normalize_ticker(stock.get('stk_cd'))
+            qty = int(stock.get('rmnd_qty', 0) or 0)
+            if ticker and qty > 0:
+                positions[ticker] = {"name": stock.get('stk_nm') or ticker, "qty": qty}
+        return positions
+
+    @staticmethod
+    def parse_symbols(data, market):
+        """종목 목록(ka10099) -> [(종목코드, 종목명, 시장, 기준가)]"""
+        rows = []
+        for item in data.get("list") or []:
+            ticker = normalize_ticker(item.get("code"))
+            try:
+                base = abs(int(float(str(item.get("lastPrice") or 0).strip() or 0)))
+            except ValueError:
+                base = 0
+            if ticker:
+                rows.append((ticker, str(item.get("name") or "").strip(), market, base))
+        return rows
+
+    @staticmethod
+    def check_order_price(trade_type, ticker, price):
+        """
+        종목 마스터로 지정가를 호가 단위에 맞추고 가격 제한폭을 벗어난 주문은 전송 전에 거절합니다.
+        :return: (보정된 가격, 거절 사유 또는 None)
+        """
+        checked, reason = symbols.check_price(ticker, price, trade_type)
+        if checked != int(float(price or 0)) and not reason:
+            add_log(f"🔧 [호가 보정] {ticker} {int(float(price)):,}원 -> {checked:,}원", ticker=ticker, event="order")
+        return checked, reason
+
+    @staticmethod
+    def parse_open_orders(data):
+        """미체결(ka10075) -> {주문번호: {"side", "ticker", "qty", "filled", "remaining"}}"""
+        orders = {}
+        for item in data.get("oso") or []:
+            ord_no = str(item.get("ord_no") or "").strip()
+            if not ord_no:
+                continue
+            qty = abs(int(item.get("ord_qty") or 0))
+            remaining = abs(int(item.get("oso_qty") or 0))
+            filled = item.get("cntr_qty")
+            orders[ord_no] = {"side": "sell" if "매도" in str(item.get("io_tp_nm") or "") else "buy",
+                              "ticker": normalize_ticker(item.get("stk_cd")), "qty": qty, "remaining": remaining,
+                              "filled": abs(int(filled)) if str(filled or "").strip() else max(qty - remaining, 0)}
+        return orders
+
+    @staticmethod
+    def parse_orderable(data):
+        """:return: (주문가능금액, 주문가능수량)"""
+        cash = int(data.get("min_ord_alow_amt", 100))          # 주문 가능 현금
+        avail_qty = int(data.get("min_ord_alowq", 100))
+        # avail_qty = math.floor(cash / price)
+        return cash, avail_qty
+
+    @staticmethod
+    def parse_execution(values):
+        """
+        실시간 주문체결(type 00) values -> 체결 이벤트 dict (주문번호가 없으면 None)
+        - ord_no(9203), ticker(9001), name(302), status(913: 접수/체결/확인/거부)
+        - side(907: 1 매도 / 2 매수), qty(900), remaining(902), filled(911: 누적 체결량), price(910)
+        - cancel_of: 취소 확인이면 원주문번호(904)
+        """
+        ord_no = str(values.get("9203") or "").strip()
+        if not ord_no:
+            return None
+        def _num(key):
+            try:
+                return abs(int(float(str(values.get(key) or 0).strip() or 0)))
+            except ValueError:
+                return 0
+        side_code = str(values.get("907") or "").strip()
+        order_type = str(values.get("905") or "")
+        side = "sell" if side_code == "1" or (not side_code and "매도" in order_type) else "buy"
+        status = str(values.get("913") or "").strip()
+        return {
+            "ord_no": ord_no,
+            "ticker": normalize_ticker(values.get("9001")),
+            "name": str(values.get("302") or "").strip() or None,
+            "status": status,
+            "side": side,
+            "qty": _num("900"),
+            "remaining": _num("902"),
+            "filled": _num("911"),
+            "price": _num("910"),
+            "cancel_of": (str(values.get("904") or "").strip() or None) if "취소" in order_type and status == "확인" else None,
+        }
+
+    @staticmethod
+    def is_token_expired(rt_cd, msg):
+        """주문 응답이 토큰 만료(8005) 에러인지 판별합니다."""
+        return str(rt_cd) == "8005" or "Token" in str(msg)
+
+class KiwoomAPI(KiwoomRequests):
     """
     키움증권(또는 모의투자) REST API와의 통신을 전담하는 클래스입니다.
     토큰 발급, 잔고 조회, 주문 전송 등의 기능을 수행합니다.
     """
-    def __init__(self, app_key, app_secret):
-        """API 초기화 및 최초 인증 토큰 발급"""
+    def __init__(self, app_key, app_secret, connect=True, name="main", base_url=None):
+        """
+        API 초기화 및 최초 인증 토큰 발급
+        :param connect: False면 토큰 발급/커넥션 예열을 connect() 호출 시점으로 미룸 (서버는 기동 스레드에서 연결)
+        :param name: 계좌 구분 이름 (다중 계좌 로그/지표용)
+        """
+        self.name = name
         self.app_key = app_key
         self.app_secret = app_secret
-        self.base_url = "https://mockapi.kiwoom.com"
+        self.base_url = base_url or BASE_URL
+        self.transport = KiwoomTransport(self.base_url)
+        self.limiter = RateLimiter()
+        self.positions = PositionBook(self.fetch_positions)
+        self.orders = OrderBook(self.positions)
+        self.feed = ExecutionFeed(self, exec_feed_url(self.base_url))
+        self.cash = CashLedger(self.fetch_orderable)
+        self.tokens = TokenManager(self.issue_token)
+        self.breakers = {api_id: CircuitBreaker(f"{api_id}@{name}") for api_id in HEDGED_READS}
+        self.latency = {api_id: deque(maxlen=HEDGE_WINDOW) for api_id in HEDGED_READS} # 최근 정상 응답 지연 (헤지 기준)
+        self._hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="KiwoomHedge")
         
-        # 기본 헤더 설정 (토큰 발급 전)
+        # 기본 헤더 설정 (인증 헤더는 요청 시 TokenManager가 주입)
         self.headers = {"Content-Type": "application/json;charset=UTF-8"}
         
-        # 초기 토큰 발급 시도
-        self.access_token = self.get_token()
-        if self.access_token:
-            self.headers.update({"authorization": f"Bearer {self.access_token}"})
+        if connect:
+            self.connect()
+
+    def connect(self):
+        """
+        초기 토큰 발급 + 선제 갱신 스레드 시작 (이 요청으로 첫 커넥션이 열림) 후 커넥션 예열, 체결 스트림 구독, 잔고 선적재
+        토큰이 발급될 때까지 반환하지 않으므로 기동 스레드(Startup)에서 호출합니다. 단계별 소요 시간은 startup에 기록됩니다.
+        """
+        with startup.phase("token"):
+            self.tokens.start()
+            if not self.tokens.wait_issued(TOKEN_STARTUP_TIMEOUT):
+                raise TimeoutError(f"토큰 발급 대기 {TOKEN_STARTUP_TIMEOUT}초 초과")
+        with startup.phase("warmup"):
+            self.transport.warm_up()
+        self.feed.start()
+        with startup.phase("positions"):
+            self.positions.refresh() # 스트림이 먼저 맞췄으면 생략됨
+
+    @property
+    def access_token(self):
+        return self.tokens.token
+
+    def _post(self, path, api_id, payload, headers=None):
+        """
+        공용 전송 헬퍼: 호출 한도 확보 후 인증 헤더 + api-id를 붙여 전송 계층으로 요청합니다.
+        멱등 조회(HEDGED_READS)는 서킷 브레이커/헤지 요청을 거칩니다. (차단 중이면 BreakerOpen)
+        """
+        if headers is None:
+            headers = {**self.headers, **self.tokens.header()}
+        else:
+            headers = headers.copy()
+        if api_id in self.breakers:
+            return self._read(path, api_id, headers, payload)
+        waited = self._acquire(api_id)
+        if api_id != "oauth2":
+            headers["api-id"] = api_id
+        return self._send(path, api_id, headers, payload, waited)
+
+    def _acquire(self, api_id):
+        waited = self.limiter.acquire(api_id, current_priority())
+        metrics.observe("kiwoom_rate_limit_wait_seconds", waited, api_id=api_id, account=self.name)
+        return waited
+
+    def _send(self, path, api_id, headers, payload, waited=0.0, trace=None, hedge=False):
+        """전송 계층으로 1회 요청하고 지표/추적 구간을 남깁니다. (trace: 헤지 스레드에서 호출한 신호의 추적)"""
+        started = time.perf_counter()
+        try:
+            res = self.transport.post(path, api_id, headers, payload)
+        except Exception as e:
+            metrics.inc("kiwoom_http_errors_total", api_id=api_id, account=self.name, reason=type(e).__name__)
+            if tracer.active:
+                tracer.span(api_id, started, trace=trace, wait_ms=round(waited * 1000, 2), account=self.name,
+                            error=type(e).__name__, hedge=hedge)
+            raise
+        elapsed = time.perf_counter() - started
+        metrics.observe("kiwoom_http_request_seconds", elapsed, api_id=api_id, account=self.name)
+        if tracer.active:
+            tracer.span(api_id, started, trace=trace, wait_ms=round(waited * 1000, 2), account=self.name,
+                        http=res.status_code, hedge=hedge)
+        if res.status_code != 200:
+            metrics.inc("kiwoom_http_errors_total", api_id=api_id, account=self.name, reason=str(res.status_code))
+        elif api_id in self.latency:
+            self.latency[api_id].append(elapsed)
+        return res
+
+    def _hedge_delay(self, api_id):
+        """:return: 헤지 요청을 보낼 대기 시간 (최근 응답 지연의 HEDGE_QUANTILE 분위, 표본 부족 시 None)"""
+        samples = sorted(self.latency[api_id])
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(samples[min(int(len(samples) * HEDGE_QUANTILE), len(samples) - 1)], HEDGE_MIN_DELAY)
+
+    def _read(self, path, api_id, headers, payload):
+        """
+        멱등 조회 전송 (HEDGED_READS, 주문 api-id는 해당 없음)
+        - 서킷 브레이커가 차단 중이면 보내지 않고 BreakerOpen (호출부가 캐시된 계좌 상태로 대체)
+        - 최근 응답 지연의 p95가 지나도 응답이 없으면 같은 요청을 한 번 더 보내고, 먼저 온 응답을 사용합니다.
+          헤지 요청은 호출 한도에 여유가 있을 때만 보냅니다. (대기하지 않음)
+        - 예외/5xx는 실패, 그 외 응답은 성공으로 브레이커에 반영합니다.
+        """
+        breaker = self.breakers[api_id]
+        if not breaker.allow():
+            metrics.inc("kiwoom_breaker_rejects_total", api_id=api_id, account=self.name)
+            raise BreakerOpen(api_id)
+        headers["api-id"] = api_id
+        try:
+            waited = self._acquire(api_id)
+            delay = self._hedge_delay(api_id)
+            if delay is None:
+                res = self._send(path, api_id, headers, payload, waited)
+            else:
+                res = self._hedged_send(path, api_id, headers, payload, waited, delay)
+        except Exception:
+            breaker.record(False)
+            raise
+        breaker.record(res.status_code < 500)
+        return res
+
+    def _hedged_send(self, path, api_id, headers, payload, waited, delay):
+        trace = getattr(_dispatch_ctx, "trace", None) if tracer.active else None
+        primary = self._hedge_pool.submit(self._send, path, api_id, headers, payload, waited, trace)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        if not self.limiter.try_acquire(api_id):
+            metrics.inc("kiwoom_hedged_requests_total", api_id=api_id, account=self.name, outcome="skipped")
+            return primary.result()
+        hedge = self._hedge_pool.submit(self._send, path, api_id, headers, payload, 0.0, trace, True)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    outcome = "won" if future is hedge else "lost"
+                    metrics.inc("kiwoom_hedged_requests_total", api_id=api_id, account=self.name, outcome=outcome)
+                    return future.result() # 늦은 쪽 응답은 버림 (조회라 부작용 없음)
+                error = future.exception()
+        raise error
 
     def get_token(self):
         """
         OAuth2 Client Credentials 방식으로 접근 토큰을 발급받습니다.
         :return: token (str) or False
         """
-        url = f"{self.base_url}/oauth2/token"
-        headers = self.headers.copy() # 인증 전 헤더 사용
-        data = {
-            "grant_type": "client_credentials",
-            "appkey": self.app_key,
-            "secretkey": self.app_secret
-        }
+        issued = self.issue_token()
+        return issued[0] if issued else False
+
+    def issue_token(self):
+        """
+        토큰을 발급하고 만료 시각을 함께 반환합니다. (TokenManager가 호출)
+        :return: (token, 만료 epoch 초) or None
+        """
+        headers = {"Content-Type": self.headers["Content-Type"]} # 인증 전 헤더 사용
+        path, api_id, data = self.token_request(self.app_key, self.app_secret)
         try:
             if not self.app_key or not self.app_secret:
                 add_log("❌ [설정 오류] API Key가 누락되었습니다.")
-                return False
+                return None
 
-            res = requests.post(url, headers=headers, data=json.dumps(data))
+            res = self._post(path, api_id, data, headers=headers)
             if res.status_code == 200:
                 resp = res.json()
-                token = resp.get("token") or resp.get("access_token")
-                add_log(f"✅ [인증 성공] 토큰이 발급되었습니다.")
-                return token
+                token = self.parse_token(resp)
+                if not token:
+                    add_log(f"❌ [인증 실패] {res.text}")
+                    return None
+                expires_at = self.parse_token_expiry(resp)
+                expires_str = datetime.fromtimestamp(expires_at, KST).strftime('%m-%d %H:%M')
+                add_log(f"✅ [인증 성공] 토큰이 발급되었습니다. (만료: {expires_str})")
+                return token, expires_at
             else:
                 add_log(f"❌ [인증 실패] {res.text}")
-                return False
+                return None
         except Exception as e:
             add_log(f"❌ [연결 오류] 토큰 발급 중 예외 발생: {e}")
-            return False
+            return None
         
     def get_stock_name_from_ticker(self, ticker):
         """
-        종목 코드(Ticker)를 입력받아 종목명(Name)을 조회합니다.
-        :return: stock_name (str)
+        종목 코드(Ticker)를 입력받아 종목명(Name)을 조회합니다. (종목 마스터에 있으면 API 호출 없음)
+        :return: stock_name (str)
+        """
+        name = symbols.name(ticker)
+        if name:
+            return name
+        try:
+            res = self._post(*self.stock_info_request(ticker))
+            if res.status_code == 200:
+                data = res.json()
+                return data.get("stk_nm", "XXXXX")
+            else:
+                add_log(f"❌ [종목명 조회 실패] {res.text}")
+                return "Unknown"
+        except Exception as e:
+            add_log(f"❌ [시스템 오류] 종목명 조회 중: {e}")
+            return "Error"
+
+    def fetch_symbols(self):
+        """
+        시장별 종목 목록(ka10099)을 연속 조회(cont-yn/next-key)로 모두 받습니다. (종목 마스터 생성용)
+        :return: [(종목코드, 종목명, 시장, 기준가)] or None (실패 시)
+        """
+        rows = []
+        _dispatch_ctx.priority = SYMBOL_FETCH_PRIORITY # 페이지 조회가 주문의 global 한도를 앞지르지 않도록
+        try:
+            for code, market in SYMBOL_MARKETS.items():
+                next_key = ""
+                while True:
+                    headers = {**self.headers, **self.tokens.header()}
+                    if next_key:
+                        headers.update({"cont-yn": "Y", "next-key": next_key})
+                    res = self._post(*self.symbol_list_request(code), headers=headers)
+                    if res.status_code != 200:
+                        add_log(f"❌ [종목 목록 조회 실패] {market} | {res.text[:200]}")
+                        return None
+                    rows += self.parse_symbols(res.json(), market)
+                    next_key = res.headers.get("next-key", "")
+                    if res.headers.get("cont-yn") != "Y" or not next_key:
+                        break
+            return rows
+        except Exception as e:
+            add_log(f"❌ [시스템 오류] 종목 목록 조회 중: {e}")
+            return None
+        finally:
+            _dispatch_ctx.priority = 0
+
+    def fetch_open_orders(self):
+        """
+        미체결 주문(ka10075) 전체를 조회합니다. (체결 스트림 재연결 시 OrderBook 재정렬용)
+        :return: {주문번호: {...}} or None (실패 시)
+        """
+        try:
+            res = self._post(*self.open_orders_request())
+            if res.status_code == 200:
+                return self.parse_open_orders(res.json())
+            add_log(f"❌ [미체결 조회 실패] {res.text[:200]}")
+            return None
+        except Exception as e:
+            add_log(f"❌ [시스템 오류] 미체결 조회 중: {e}")
+            return None
+
+    def fetch_positions(self):
+        """
+        계좌 평가 잔고(kt00018) 전체를 1회 조회하여 종목코드 인덱스로 변환합니다.
+        :return: {ticker: {"name": 종목명, "qty": 보유수량}} or None (실패 시)
         """
-        url = f"{self.base_url}/api/dostk/stkinfo"
-        headers = self.headers.copy()
-        headers.update({"api-id": "ka10001"})
-        payload = {"stk_cd": ticker}
-
         try:
-            res = requests.post(url, headers=headers, json=payload)
+            res = self._post(*self.balance_request())
             if res.status_code == 200:
-                data = res.json()
-                return data.get("stk_nm", "XXXXX")
+                return self.parse_positions(res.json())
             else:
-                add_log(f"❌ [종목명 조회 실패] {res.text}")
-                return "Unknown"
+                add_log(f"❌ [잔고 조회 실패] {res.text}")
+                return None
+        except BreakerOpen:
+            return None # 차단 중: PositionBook이 마지막 스냅샷을 계속 사용
         except Exception as e:
-            add_log(f"❌ [시스템 오류] 종목명 조회 중: {e}")
-            return "Error"
+            add_log(f"❌ [시스템 오류] 잔고 조회 중: {e}")
+            return None
 
     def get_stock_balance(self, ticker):
         """
-        특정 종목의 현재 보유 수량과 종목명을 확인합니다.
+        특정 종목의 현재 보유 수량과 종목명을 확인합니다. (PositionBook 스냅샷 기반)
         :param ticker: 종목 코드
         :return: (종목명, 보유수량) 튜플
         """
-        # print("\n🔍 잔고 조회 API 요청 중...")
-        url = f"{self.base_url}/api/dostk/acnt"
-        headers = self.headers.copy()
-        headers.update({"api-id": "kt00018"})
-        payload = {
-            "dmst_stex_tp": "KRX",
-            "qry_tp": "1"
-        }
+        name, qty = self.positions.get(ticker)
+        if qty > 0:
+            add_log(f"🧐 [잔고 확인] {name}({ticker}) | 보유량: {qty}주")
+            return name, qty
 
-        try:
-            res = requests.post(url, headers=headers, json=payload)
-            if res.status_code == 200:
-                data = res.json()
-                # 잔고 리스트 가져오기
-                balance = data.get('acnt_evlt_remn_indv_tot', [])
-                
-                for stock in balance:
-                    if ticker in stock.get('stk_cd', ''):
-                        name = self.get_stock_name_from_ticker(ticker)
-                        qty = int(stock.get('rmnd_qty', 0))
-                        add_log(f"🧐 [잔고 확인] {name}({ticker}) | 보유량: {qty}주")
-                        return name, qty
-                
-                # 보유 종목이 없는 경우
-                return 0, 0
-            else:
-                add_log(f"❌ [잔고 조회 실패] {res.text}")
-                return 0, 0
-        except Exception as e:
-            add_log(f"❌ [시스템 오류] 잔고 조회 중: {e}")
-            return 0, 0
+        # 보유 종목이 없는 경우
+        return 0, 0
     
     def get_withdrawable_amount(self, ticker, price):
         """
         해당 종목을 지정가에 매수할 때, '주문 가능 현금'과 '최대 주문 가능 수량'을 조회합니다.
+        kt00011이 서킷 브레이커로 차단 중이면 현금 장부(마지막 대조 기준)로 추정합니다.
         :param ticker: 종목 코드
         :param price: 매수 희망 단가
         :return: (주문가능금액, 주문가능수량)
         """
-        url = f"{self.base_url}/api/dostk/acnt"
-        headers = self.headers.copy()
-        headers.update({"api-id": "kt00011"})
-
-        payload = {
-            "stk_cd": ticker,
-            "uv": str(price), # API 요청 시 문자열 변환 필수
-        }
+        result = self.fetch_orderable(ticker, price)
+        return result if result is not None else self.cash.estimate(price)
 
+    def fetch_orderable(self, ticker, price):
+        """
+        kt00011 1회 조회 (CashLedger 대조용)
+        :return: (주문가능금액, 주문가능수량) / 실패 시 (0, 0) / 조회 차단 중이면 None
+        """
         try:
-            res = requests.post(url, headers=headers, json=payload)
+            res = self._post(*self.orderable_request(ticker, price))
             if res.status_code == 200:
-                data = res.json()
-                cash = int(data.get("min_ord_alow_amt", 100))          # 주문 가능 현금
-                avail_qty = int(data.get("min_ord_alowq", 100))
-                # avail_qty = math.floor(cash / price)
-                return cash, avail_qty
+                return self.parse_orderable(res.json())
             return 0, 0 # 실패 시 0 반환
+        except BreakerOpen:
+            return None
         except Exception as e:
             add_log(f"❌ [시스템 오류] 가능 금액 조회: {e}")
             return 0, 0
@@ -190,41 +2931,29 @@ class KiwoomAPI():
         
         :param trade_type: "buy" or "sell"
         :param retry: 토큰 만료 에러(8005) 발생 시 재귀적으로 1회 재시도 여부
+                      (정상 상황에서는 TokenManager가 미리 갱신하므로 예외적인 안전장치)
         :return: API 응답 결과 (Dict)
         """
-        if trade_type == "buy":
-            api_id = "kt10000"; tr_type_nm = "매수"
-        else:
-            api_id = "kt10001"; tr_type_nm = "매도"
-
-        url = f"{self.base_url}/api/dostk/ordr"
-        headers = self.headers.copy()
-        headers.update({"api-id": api_id})
-
-        ord_prc = int(float(price))
-        
-        # 주문 유형 결정 (지정가/시장가/스탑로스 등)
-        if ord_prc == 0:
-            trde_tp = "3" # 시장가
+        tr_type_nm = "매수" if trade_type == "buy" else "매도"
+        symbols.refresh_async(self.fetch_symbols, on_done=log_symbols) # 날짜가 바뀌었으면 백그라운드 재생성
+        price, reason = self.check_order_price(trade_type, ticker, price)
+        if reason:
+            add_log(f"🚫 [주문 차단] {ticker} {tr_type_nm} {price:,}원 - {reason}", ticker=ticker, event="reject")
+            metrics.inc("kiwoom_order_rejects_total", side=trade_type, account=self.name, code="local")
+            return {"status": "fail", "data": {"return_code": "local", "return_msg": reason}}
+        path, api_id, payload = self.order_request(trade_type, ticker, price, qty, stop)
+        ord_prc = payload["ord_uv"]
+        if payload["trde_tp"] == "3":
             add_log("market order")
-        else:
-            trde_tp = "0" if stop != 0 else "00" # 지정가 (API 문서에 따라 코드 확인 필요)
-
-        # JSON 페이로드 구성
-        payload = {
-            "dmst_stex_tp": "KRX",
-            "stk_cd": ticker,
-            "ord_qty": str(qty),
-            "ord_uv": str(ord_prc),
-            "trde_tp": trde_tp,
-        }
 
         try:
-            name = self.get_stock_name_from_ticker(ticker)
-            time.sleep(0.5) # API 과부하 방지 딜레이
+            stale_token = self.tokens.token
+            # 종목명은 로그용이므로 API로 조회하지 않음 (종목 마스터 -> 보유 잔고 순, 없으면 코드만)
+            name = symbols.name(ticker) or self.positions.name(ticker)
             
-            add_log(f"🚀 [{tr_type_nm} 전송] {ticker}({name}) | {qty}주 | {ord_prc}원")
-            res = requests.post(url, headers=headers, json=payload)
+            add_log(f"🚀 [{tr_type_nm} 전송] {ticker}{f'({name})' if name else ''} | {qty}주 | {ord_prc}원", ticker=ticker, event="order")
+
+            res = self._post(path, api_id, payload)
             
             if res.status_code == 200:
                 result = res.json()
@@ -233,23 +2962,25 @@ class KiwoomAPI():
 
                 # 1. 정상 체결 (Return Code: 0)
                 if str(rt_cd) == "0":
-                    add_log(f"✅ [주문 접수 완료] 주문번호:{result.get('ord_no')} | {msg}")
+                    add_log(f"✅ [주문 접수 완료] 주문번호:{result.get('ord_no')} | {msg}", ticker=ticker, event="order")
+                    metrics.inc("kiwoom_orders_total", side=trade_type, account=self.name)
+                    self.orders.accepted(trade_type, ticker, qty, result.get('ord_no'))
                     return {"status": "success", "data": result}
                 
                 # 2. 토큰 만료 에러 감지 및 재시도 로직
-                elif retry and (str(rt_cd) == "8005" or "Token" in str(msg)):
+                elif retry and self.is_token_expired(rt_cd, msg):
                     add_log(f"🔄 [토큰 만료] 재발급 후 주문을 재시도합니다.")
                     
-                    # 새 토큰 발급
-                    new_token = self.get_token()
-                    if new_token:
-                        self.access_token = new_token
-                        self.headers["authorization"] = f"Bearer {new_token}"
+                    # 새 토큰 발급 (동시에 만료를 감지한 다른 요청과 재발급 1회 공유)
+                    if self.tokens.refresh(stale_token=stale_token):
                         # 재귀 호출 (retry=False로 무한 루프 방지)
                         return self.send_order(trade_type, ticker, price, qty, stop, retry=False)
+                    add_log(f"❌ [주문 실패] 토큰 재발급에 실패했습니다.")
+                    return {"status": "fail", "data": result}
                 
                 else:
-                    add_log(f"❌ [주문 거절] 코드:{rt_cd} | {msg}")
+                    add_log(f"❌ [주문 거절] 코드:{rt_cd} | {msg}", ticker=ticker, event="reject")
+                    metrics.inc("kiwoom_order_rejects_total", side=trade_type, account=self.name, code=rt_cd)
                     return {"status": "fail", "data": result}
             else:
                 add_log(f"❌ [HTTP 에러] {res.status_code} | {res.text}")
@@ -259,95 +2990,494 @@ class KiwoomAPI():
             add_log(f"❌ [실행 오류] {e}")
             return {"status": "error", "msg": str(e)}
 
+class AsyncKiwoomAPI(KiwoomRequests):
+    """
+    한 계좌(KiwoomAPI)의 asyncio 버전 주문 클라이언트입니다. (aiohttp 필요, ASYNC_DISPATCH=1일 때 사용)
+    하나의 커넥션 풀(TCPConnector) 위에서 여러 주문/가능금액 조회를 동시에 진행하므로,
+    매수 배치와 다계좌 청산을 스레드 없이 이벤트 루프 하나에서 asyncio.gather로 겹쳐 보낼 수 있습니다.
+    토큰/호출 한도/잔고/주문 장부/현금 장부는 원래 계좌 객체와 공유합니다. (토큰 발급/갱신은 동기 TokenManager 담당)
+
+    사용 예 (AsyncDispatcher의 이벤트 루프 안에서):
+        client = async_dispatcher.client(kiwoom)
+        result = await client.send_order("buy", ticker, price, qty)
+    """
+    def __init__(self, api, pool_size=HTTP_POOL_SIZE):
+        """:param api: 주문을 보낼 계좌 (KiwoomAPI)"""
+        if aiohttp is None:
+            raise RuntimeError("AsyncKiwoomAPI를 사용하려면 aiohttp 설치가 필요합니다. (pip install -r requirements.txt)")
+        self.api = api
+        self.name = api.name
+        self.base_url = api.base_url
+        self.pool_size = pool_size
+        self.session = None
+
+    async def open(self):
+        """커넥션 풀 생성 (이벤트 루프 안에서 호출)"""
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _headers(self):
+        """인증 헤더 (만료된 경우에만 재발급을 스레드로 넘겨 루프를 막지 않음)"""
+        tokens = self.api.tokens
+        auth = tokens.header() if tokens.is_valid() else await asyncio.to_thread(tokens.header)
+        return {**self.api.headers, **auth}
+
+    async def _post(self, path, api_id, payload):
+        """
+        공용 전송 헬퍼 (비동기): 호출 한도 확보 후 인증 헤더 + api-id를 붙여 전송하고 지표/추적 구간을 남깁니다.
+        우선순위와 추적은 태스크별 _async_ctx에서 읽습니다. (스레드 로컬 _dispatch_ctx 대신)
+        :return: (HTTP 상태코드, JSON dict 또는 None, 응답 본문 텍스트)
+        """
+        priority, trace = _async_ctx.get()
+        await self.open()
+        waited = await self.api.limiter.acquire_async(api_id, priority)
+        metrics.observe("kiwoom_rate_limit_wait_seconds", waited, api_id=api_id, account=self.name)
+        headers = await self._headers()
+        headers["api-id"] = api_id
+        connect, read = HTTP_TIMEOUTS.get(api_id, HTTP_DEFAULT_TIMEOUT)
+        timeout = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+        started = time.perf_counter()
+        try:
+            async with self.session.post(f"{self.base_url}{path}", headers=headers, json=payload, timeout=timeout) as res:
+                status, text = res.status, await res.text()
+        except Exception as e:
+            metrics.inc("kiwoom_http_errors_total", api_id=api_id, account=self.name, reason=type(e).__name__)
+            if trace is not None:
+                tracer.span(api_id, started, trace=trace, wait_ms=round(waited * 1000, 2), account=self.name,
+                            error=type(e).__name__, mode="async")
+            raise
+        metrics.observe("kiwoom_http_request_seconds", time.perf_counter() - started, api_id=api_id, account=self.name)
+        if trace is not None:
+            tracer.span(api_id, started, trace=trace, wait_ms=round(waited * 1000, 2), account=self.name,
+                        http=status, mode="async")
+        if status != 200:
+            metrics.inc("kiwoom_http_errors_total", api_id=api_id, account=self.name, reason=str(status))
+        try:
+            data = json.loads(text) if text else {}
+        except json.JSONDecodeError:
+            data = None
+        return status, data, text
+
+    async def get_withdrawable_amount(self, ticker, price):
+        """
+        kt00011 조회 (비동기). 서킷 브레이커는 동기 클라이언트와 공유합니다. (차단 중이면 현금 장부로 추정)
+        :return: (주문가능금액, 주문가능수량)
+        """
+        api_id = "kt00011"
+        breaker = self.api.breakers.get(api_id)
+        if breaker is not None and not breaker.allow():
+            metrics.inc("kiwoom_breaker_rejects_total", api_id=api_id, account=self.name)
+            return self.api.cash.estimate(price)
+        try:
+            status, data, text = await self._post(*self.orderable_request(ticker, price))
+        except Exception as e:
+            if breaker is not None:
+                breaker.record(False)
+            add_log(f"❌ [시스템 오류] 가능 금액 조회: {e}")
+            return 0, 0
+        if breaker is not None:
+            breaker.record(status < 500)
+        if status == 200 and data is not None:
+            return self.parse_orderable(data)
+        return 0, 0
+
+    async def send_order(self, trade_type, ticker, price, qty, stop=0, retry=True):
+        """
+        매수/매도 주문을 전송합니다. (KiwoomAPI.send_order와 같은 규칙/로그/지표)
+        :param retry: 토큰 만료 에러(8005) 발생 시 1회 재시도 여부 (재발급은 TokenManager가 single-flight로 수행)
+        :return: API 응답 결과 (Dict)
+        """
+        api = self.api
+        tr_type_nm = "매수" if trade_type == "buy" else "매도"
+        symbols.refresh_async(api.fetch_symbols, on_done=log_symbols) # 날짜가 바뀌었으면 백그라운드 재생성
+        price, reason = self.check_order_price(trade_type, ticker, price)
+        if reason:
+            add_log(f"🚫 [주문 차단] {ticker} {tr_type_nm} {price:,}원 - {reason}", ticker=ticker, event="reject")
+            metrics.inc("kiwoom_order_rejects_total", side=trade_type, account=self.name, code="local")
+            return {"status": "fail", "data": {"return_code": "local", "return_msg": reason}}
+        path, api_id, payload = self.order_request(trade_type, ticker, price, qty, stop)
+
+        try:
+            stale_token = api.tokens.token
+            name = symbols.name(ticker) or api.positions.name(ticker)
+            add_log(f"🚀 [{tr_type_nm} 전송] {ticker}{f'({name})' if name else ''} | {qty}주 | {payload['ord_uv']}원", ticker=ticker, event="order")
+
+            status, result, text = await self._post(path, api_id, payload)
+            if status != 200 or result is None:
+                add_log(f"❌ [HTTP 에러] {status} | {text}")
+                return {"status": "fail", "data": text}
+
+            rt_cd = result.get('return_code', "XXXXX")
+            msg = result.get('return_msg', "")
+            if str(rt_cd) == "0":
+                add_log(f"✅ [주문 접수 완료] 주문번호:{result.get('ord_no')} | {msg}", ticker=ticker, event="order")
+                metrics.inc("kiwoom_orders_total", side=trade_type, account=self.name)
+                api.orders.accepted(trade_type, ticker, qty, result.get('ord_no'))
+                return {"status": "success", "data": result}
+            if retry and self.is_token_expired(rt_cd, msg):
+                add_log(f"🔄 [토큰 만료] 재발급 후 주문을 재시도합니다.")
+                if await asyncio.to_thread(api.tokens.refresh, stale_token):
+                    return await self.send_order(trade_type, ticker, price, qty, stop, retry=False)
+                add_log(f"❌ [주문 실패] 토큰 재발급에 실패했습니다.")
+                return {"status": "fail", "data": result}
+            add_log(f"❌ [주문 거절] 코드:{rt_cd} | {msg}", ticker=ticker, event="reject")
+            metrics.inc("kiwoom_order_rejects_total", side=trade_type, account=self.name, code=rt_cd)
+            return {"status": "fail", "data": result}
+
+        except Exception as e:
+            add_log(f"❌ [실행 오류] {e}")
+            return {"status": "error", "msg": str(e)}
+
+class AsyncDispatcher():
+    """
+    AsyncKiwoomAPI를 실행하는 전용 이벤트 루프 스레드입니다. (처음 사용할 때 시작)
+    동기 코드(워커 스레드/매수 배치)는 submit()으로 코루틴을 넘기고, 계좌별 클라이언트는 client()로 공유합니다.
+    """
+    def __init__(self):
+        self.loop = None
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="KiwoomAsync", daemon=True).start()
+                self.loop = loop
+        return self.loop
+
+    def submit(self, coro):
+        """:return: concurrent.futures.Future (코루틴 결과)"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop or self._start())
+
+    def run(self, coro):
+        """코루틴을 루프에 넘기고 결과를 기다립니다. (호출 스레드는 대기)"""
+        return self.submit(coro).result()
+
+    def client(self, api):
+        """:return: 계좌별 AsyncKiwoomAPI (계좌당 1개, 커넥션 풀 공유)"""
+        with self._lock:
+            client = self._clients.get(id(api))
+            if client is None:
+                client = self._clients[id(api)] = AsyncKiwoomAPI(api)
+            return client
+
 # 인스턴스 생성
-kiwoom = KiwoomAPI(app_key=app_key, app_secret=app_secret)
+class AccountRouter():
+    """
+    여러 계좌(KiwoomAPI 인스턴스)에 주문을 나눠 보냅니다.
+    - 계좌마다 토큰/커넥션 풀/호출 한도/현금 장부/잔고 스냅샷이 독립적이므로 계좌 수만큼 처리량이 늘어납니다.
+    - 매수: 배치마다 모든 계좌의 현금을 동시에 조회(kt00011)하고, 랭킹 순으로 남은 예산이 가장 큰 계좌에 배정
+    - 청산: 해당 종목을 보유한 모든 계좌에서 동시에 매도 (계좌별 보유 수량 기준으로 분할 비율 적용)
+    계좌가 1개면 추가 스레드 없이 기존과 똑같이 동작합니다.
+    """
+    def __init__(self, accounts):
+        """:param accounts: [KiwoomAPI] (첫 번째가 기본 계좌)"""
+        self.accounts = list(accounts)
+        self.primary = self.accounts[0]
+        self._pool = ThreadPoolExecutor(max_workers=max(len(self.accounts), 2), thread_name_prefix="KiwoomRoute")
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def map(self, fn, items):
+        """
+        계좌별 작업을 동시에 실행합니다. (1건이면 호출 스레드에서 바로 실행)
+        호출 스레드의 시그널 추적을 풀 스레드에 이어 붙여, 계좌별 API 호출도 같은 추적에 구간으로 남깁니다.
+        """
+        items = list(items)
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        trace = getattr(_dispatch_ctx, "trace", None)
+        def _run(item):
+            _dispatch_ctx.trace = trace
+            try:
+                return fn(item)
+            finally:
+                _dispatch_ctx.trace = None
+        return list(self._pool.map(_run, items))
+
+    def connect(self):
+        """
+        모든 계좌를 동시에 연결합니다. (기동 스레드에서 호출)
+        - 기본 계좌 연결 실패(토큰 발급 시간 초과 등)는 기동 실패 (Startup이 간격을 늘려가며 다시 호출)
+        - 추가 계좌는 제외하고 기동하며, 백그라운드 재발급이 성공하면 다시 합류시킵니다.
+        """
+        accounts = self.accounts
+        failed = [api for api, ok in zip(accounts, self.map(self._connect, accounts)) if not ok]
+        if self.primary in failed:
+            raise RuntimeError(f"기본 계좌({self.primary.name}) 연결 실패")
+        if failed:
+            self.accounts = [api for api in accounts if api not in failed] # 순회 중인 스레드를 위해 교체
+            for api in failed:
+                threading.Thread(target=self._rejoin, args=(api,), name="KiwoomRejoin", daemon=True).start()
+
+    @staticmethod
+    def _connect(api):
+        try:
+            api.connect()
+            return True
+        except Exception as e:
+            add_log(f"❌ [계좌 연결 실패] {api.name}: {e}")
+            return False
+
+    def _rejoin(self, api):
+        """제외된 계좌의 토큰이 발급되면 나머지 연결 단계를 마치고 주문 대상에 다시 넣습니다."""
+        add_log(f"⚠️ [계좌 제외] {api.name} 계좌 없이 기동합니다. (토큰 발급 시 자동 합류)")
+        api.tokens.wait_issued()
+        api.transport.warm_up()
+        api.feed.start()
+        api.positions.refresh()
+        self.accounts = self.accounts + [api]
+        add_log(f"✅ [계좌 합류] {api.name} 계좌를 주문 대상에 다시 포함합니다.")
+
+    def label(self, api):
+        """로그용 계좌 표시 (단일 계좌면 생략)"""
+        return f" @{api.name}" if len(self.accounts) > 1 else ""
+
+    def sync_cash(self, ticker, price):
+        """모든 계좌의 현금 장부를 동시에 맞춥니다. :return: 전체 주문 가능 현금"""
+        def _sync(api):
+            try:
+                return api.cash.sync(ticker, price)
+            except Exception as e:
+                add_log(f"❌ [현금 조회 실패]{self.label(api)} {e}")
+                return 0
+        return sum(self.map(_sync, self.accounts))
+
+    def allocate(self, targets, per_order=None):
+        """
+        랭킹 순으로 정렬된 매수 대상을 계좌에 배정하고 예산을 예약합니다.
+        대상마다 남은 가용 현금이 가장 큰 계좌를 고르고, 같으면 배정 건수가 적은 계좌를 고릅니다. (호출 한도 분산)
+        :return: [(KiwoomAPI, 예약)] (targets와 같은 순서)
+        """
+        accounts = self.accounts
+        assigned = {id(api): 0 for api in accounts}
+        assignments = []
+        for target in targets:
+            api = max(accounts, key=lambda a: (a.cash.available, -assigned[id(a)]))
+            assigned[id(api)] += 1
+            assignments.append((api, api.cash.reserve(CashLedger.order_amount(target, per_order))))
+        return assignments
 
+    def holders(self, ticker):
+        """:return: 해당 종목을 보유한 계좌 목록 (잔고 스냅샷 동시 조회)"""
+        accounts = self.accounts
+        quantities = self.map(lambda api: api.positions.get(ticker)[1], accounts)
+        return [api for api, qty in zip(accounts, quantities) if qty > 0]
+
+router = AccountRouter([
+    KiwoomAPI(app_key=acc["app_key"], app_secret=acc["app_secret"], name=acc.get("name") or f"account{idx}",
+              base_url=acc.get("base_url"), connect=False)
+    for idx, acc in enumerate(ACCOUNTS, 1)
+])
+kiwoom = router.primary # 기본 계좌 (단일 계좌 코드/테스트 호환용)
+async_dispatcher = AsyncDispatcher() # ASYNC_DISPATCH=1일 때 매수 배치/청산 주문을 보내는 이벤트 루프 (처음 사용할 때 시작)
+if ASYNC_DISPATCH and aiohttp is None:
+    add_log("❌ [비동기 주문 비활성] aiohttp가 설치되지 않아 스레드 풀로 주문합니다. (pip install -r requirements.txt 필요)")
+    ASYNC_DISPATCH = False
+# 연결(토큰/예열/잔고)은 import 시점이 아니라 become_executor()의 기동 스레드에서 진행합니다.
+metrics.gauge("kiwoom_exec_feed_connected", lambda: {(("account", a.name),): int(a.feed.connected) for a in router.accounts},
+              "실시간 체결 스트림 연결 여부 (계좌별)")
+metrics.gauge("kiwoom_open_orders", lambda: {(("account", a.name),): len(a.orders.open_orders()) for a in router.accounts},
+              "미체결 잔량이 남은 주문 수 (계좌별)")
+metrics.describe("kiwoom_exec_fills_total", "실시간 스트림으로 반영한 체결 수량")
+metrics.gauge("kiwoom_breaker_open", lambda: {(("api_id", k), ("account", a.name)): int(b.state != "closed")
+                                              for a in router.accounts for k, b in a.breakers.items()},
+              "조회 서킷 브레이커 차단 여부 (api-id/계좌별, 시험 중 포함)")
+metrics.describe("kiwoom_breaker_rejects_total", "서킷 브레이커 차단으로 보내지 않은 조회 수")
+metrics.describe("kiwoom_hedged_requests_total", "p95 초과로 보낸 헤지 조회 (won: 헤지 응답 사용 / lost: 원 요청 응답 사용 / skipped: 한도 부족)")
 
 # ==========================================
 # [4] 주문 집행 로직 (Execution Logic)
 # ==========================================
-def execute_buy(data):
+def execute_buy(data, reservation=None, api=None):
     """
     매수 시그널 처리: 
-    - 가용 현금 확인 후 목표 금액(TARGET_BUY_AMOUNT)만큼 수량 계산
+    - 목표 금액(TARGET_BUY_AMOUNT)만큼 수량 계산
+    - 배치 매수는 CashLedger가 배정한 예산(reservation)으로, 단건 매수는 kt00011 1회 조회로 가능 수량 확인
     - 잔고 부족 시 가능한 최대 수량으로 보정하여 주문
+    :param api: 주문할 계좌 (기본: 기본 계좌)
     """
+    api = api or kiwoom
     ticker = data.get("ticker")
     price = float(data.get("price", 0))
     score = data.get("score", 0)
     stop = data.get("stop", 0)
 
-    # 잔고 및 종목명 조회
-    cash, avail_qty = kiwoom.get_withdrawable_amount(ticker=ticker, price=price)
-    add_log(f"현금: {cash} | 구매가능수량: {avail_qty}")
-    
-    if price > 0:
-        # 목표 금액에 따른 수량 계산
-        buy_qty = int(TARGET_BUY_AMOUNT / price)
-        if buy_qty < 1: buy_qty = 1
-
-        # 현금이 부족할 경우, 최대 가능 수량으로 조정
-        if buy_qty > avail_qty:
-            add_log(f"⚠️ [수량 조정] 목표:{buy_qty}주 -> 가능:{avail_qty}주 (잔고 부족)")
-            buy_qty = avail_qty
-
-        # 주문 전송
-        if buy_qty > 0:
-            add_log(f"🏆 [최종 진입] {ticker} (점수: {score}) -> {buy_qty}주")
-            result = kiwoom.send_order(trade_type="buy", ticker=ticker, price=price, qty=buy_qty, stop=stop)
-            status = result.get("status", "fail")
-            _cash, _avail_qty = kiwoom.get_withdrawable_amount(ticker=ticker, price=price)
-            # add_log(f"주문완료 후 현금: {_cash} | 구매가능수량: {_avail_qty}")
-            return status
+    if price <= 0:
+        add_log(f"⚠️ 가격 정보 오류({price})로 매수를 건너뜁니다: {ticker}")
+        if reservation: api.cash.release(reservation)
+        return "error"
 
+    # 가능 수량 확인 (배정 예산 또는 잔고 조회)
+    if reservation is None:
+        cash, avail_qty = api.get_withdrawable_amount(ticker=ticker, price=price)
+        add_log(f"현금: {cash} | 구매가능수량: {avail_qty}")
     else:
+        avail_qty = int(reservation["amount"] / price)
+        add_log(f"💵 [예산 배정] {ticker} {reservation['amount']:,}원 | 구매가능수량: {avail_qty}")
+
+    buy_qty = buy_quantity(ticker, price, avail_qty)
+    if buy_qty <= 0:
+        if reservation: api.cash.release(reservation)
+        return "skip"
+
+    # 주문 전송
+    add_log(f"🏆 [최종 진입] {ticker} (점수: {score}) -> {buy_qty}주")
+    result = api.send_order(trade_type="buy", ticker=ticker, price=price, qty=buy_qty, stop=stop)
+    return settle_buy(api, reservation, result.get("status", "fail"), buy_qty * price)
+
+def buy_quantity(ticker, price, avail_qty):
+    """
+    목표 금액(TARGET_BUY_AMOUNT)에 따른 수량을 가능 수량으로 보정합니다. (execute_buy / execute_buy_async 공용)
+    :return: 주문 수량 (0이면 매수 불가)
+    """
+    # 목표 금액에 따른 수량 계산 (strategy.target_quantity: 최소 1주)
+    buy_qty = target_quantity(price, TARGET_BUY_AMOUNT)
+
+    # 현금이 부족할 경우, 최대 가능 수량으로 조정
+    if buy_qty > avail_qty:
+        add_log(f"⚠️ [수량 조정] 목표:{buy_qty}주 -> 가능:{avail_qty}주 (잔고 부족)")
+        buy_qty = avail_qty
+
+    if buy_qty <= 0:
+        add_log(f"🚫 [매수 불가] {ticker} 주문 가능 현금이 부족합니다.")
+    return buy_qty
+
+def settle_buy(api, reservation, status, used):
+    """배정 예산을 주문 결과대로 정산합니다. (접수: 사용 금액 확정 / 거절: 다음 주문이 쓸 수 있도록 반환)"""
+    if reservation:
+        if status == "success":
+            api.cash.commit(reservation, used)
+        else:
+            api.cash.release(reservation)
+    return status
+
+async def execute_buy_async(data, reservation, api):
+    """
+    execute_buy의 asyncio 버전입니다. (ASYNC_DISPATCH, AsyncDispatcher 루프에서 실행)
+    kt00011 조회와 주문은 계좌별 AsyncKiwoomAPI로 보내 같은 배치의 다른 종목과 겹쳐 진행합니다.
+    """
+    client = async_dispatcher.client(api)
+    ticker = data.get("ticker")
+    price = float(data.get("price", 0))
+
+    if price <= 0:
         add_log(f"⚠️ 가격 정보 오류({price})로 매수를 건너뜁니다: {ticker}")
+        if reservation: api.cash.release(reservation)
         return "error"
 
-def execute_sell(data):
+    if reservation is None:
+        cash, avail_qty = await client.get_withdrawable_amount(ticker, price)
+        add_log(f"현금: {cash} | 구매가능수량: {avail_qty}")
+    else:
+        avail_qty = int(reservation["amount"] / price)
+        add_log(f"💵 [예산 배정] {ticker} {reservation['amount']:,}원 | 구매가능수량: {avail_qty}")
+
+    buy_qty = buy_quantity(ticker, price, avail_qty)
+    if buy_qty <= 0:
+        if reservation: api.cash.release(reservation)
+        return "skip"
+
+    add_log(f"🏆 [최종 진입] {ticker} (점수: {data.get('score', 0)}) -> {buy_qty}주")
+    result = await client.send_order("buy", ticker, price, buy_qty, data.get("stop", 0))
+    return settle_buy(api, reservation, result.get("status", "fail"), buy_qty * price)
+
+def execute_sell(data, api=None):
     """
     매도 시그널 처리:
     - 현재 보유 잔고 확인
     - 시그널 메시지(TP/SL 등)에 따라 분할 매도 비율 결정
+    :param api: 주문할 계좌 (기본: 기본 계좌)
+    :return: 주문 상태 ("success"/"fail") 또는 "skip"
     """
+    api = api or kiwoom
     ticker = data.get("ticker")
     action_raw = data.get("action", "") # 예: "Profit Target 1", "Stop Loss"
     stop = data.get("stop", 0)
     
-    # 1. 잔고 조회
-    name, current_qty = kiwoom.get_stock_balance(ticker)
-    time.sleep(0.2) 
+    # 1. 잔고 조회 (체결 스트림 연결 중에는 로컬 잔고, 끊기면 PositionBook 스냅샷 공유: 연속 청산 신호도 kt00018 1회)
+    name, current_qty = api.get_stock_balance(ticker)
 
     if current_qty > 0:
-        sell_qty = 0
-        log_msg = ""
-        
-        # 2. 청산 전략에 따른 수량 계산
-        if "Profit Target 1" in action_raw:
-            sell_qty = int(current_qty / 2) # 50% 분할 익절
-            if sell_qty < 1: sell_qty = 1
-            log_msg = "💰 TP 1 (50%)"
-            
-        elif any(k in action_raw for k in ["Profit Target 2", "Final Exit", "Final Stop Loss"]):
-            sell_qty = current_qty          # 전량 청산
-            log_msg = "👋 전량 청산"
-            
-        elif "Stop Loss" in action_raw:
-            sell_qty = int(current_qty * 0.3) # 30% 부분 손절 (예시)
-            if sell_qty < 1: sell_qty = 1
-            log_msg = "📉 부분 손절 (30%)"
-        
-        else:
-            sell_qty = int(current_qty / 3) # 그 외 1/3 청산
-            if sell_qty < 1: sell_qty = 1
-            log_msg = "✂️ 일반 분할 청산"
+        # 2. 청산 전략에 따른 수량 계산 (TP1 50% / 전량 / Stop Loss 30% / 그 외 1/3 - strategy.exit_quantity)
+        sell_qty, log_msg = exit_quantity(action_raw, current_qty)
 
         add_log(f"{log_msg} {ticker}({name}) -> {sell_qty}주 매도 실행")
         # 매도는 보통 지정가 혹은 시장가로 던짐 (여기서는 stop 가격 활용)
-        kiwoom.send_order("sell", ticker, price=stop, stop=stop, qty=sell_qty)
+        result = api.send_order("sell", ticker, price=stop, stop=stop, qty=sell_qty)
+        return result.get("status", "fail")
     else:
         add_log(f"🚫 [매도 불가] {ticker} 보유 잔고가 없습니다.")
+        return "skip"
+
+async def execute_sell_async(data, api, trace=None):
+    """
+    execute_sell의 asyncio 버전입니다. (ASYNC_DISPATCH, AsyncDispatcher 루프에서 실행)
+    잔고 확인은 PositionBook(스냅샷 만료 시 kt00018)을 스레드로 넘기고, 주문은 AsyncKiwoomAPI로 보냅니다.
+    :param trace: 워커 스레드에 연결된 신호 추적 (태스크의 _async_ctx로 전달)
+    """
+    _async_ctx.set((0, trace))
+    ticker = data.get("ticker")
+    stop = data.get("stop", 0)
+    name, current_qty = await asyncio.to_thread(api.get_stock_balance, ticker)
+    if current_qty <= 0:
+        add_log(f"🚫 [매도 불가] {ticker} 보유 잔고가 없습니다.")
+        return "skip"
+    sell_qty, log_msg = exit_quantity(data.get("action", ""), current_qty)
+    add_log(f"{log_msg} {ticker}({name}) -> {sell_qty}주 매도 실행")
+    result = await async_dispatcher.client(api).send_order("sell", ticker, stop, sell_qty, stop)
+    return result.get("status", "fail")
+
+async def _exit_all_async(data, accounts, trace):
+    return await asyncio.gather(*(execute_sell_async(data, api, trace) for api in accounts))
+
+
+# ==========================================
+
+def execute_exit(data):
+    """
+    청산 신호를 해당 종목을 보유한 모든 계좌에서 동시에 집행합니다. (단일 계좌면 execute_sell과 같음)
+    ASYNC_DISPATCH면 계좌별 매도를 이벤트 루프에서 asyncio.gather로 동시에 보냅니다. (워커 스레드는 결과를 기다림)
+    :return: 한 계좌라도 주문이 접수되면 "success"
+    """
+    holders = router.accounts if len(router) == 1 else router.holders(data.get("ticker"))
+    if ASYNC_DISPATCH and holders:
+        trace = getattr(_dispatch_ctx, "trace", None) if tracer.active else None
+        statuses = async_dispatcher.run(_exit_all_async(data, holders, trace))
+        return "success" if "success" in statuses else statuses[0]
+    if len(router) == 1:
+        return execute_sell(data)
+    if not holders:
+        add_log(f"🚫 [매도 불가] {data.get('ticker')} 보유한 계좌가 없습니다.")
+        return "skip"
+    statuses = router.map(lambda api: execute_sell(data, api), holders)
+    return "success" if "success" in statuses else statuses[0]
+
+
+# ==========================================
+# [4-1] 매수 후보 선별 (Streaming Top-K)
+# ==========================================
+# 정책/선택기 본체는 strategy.py (오프라인 재생 replay.py와 공유), 여기서는 서버 설정값을 기본으로 연결합니다.
+def make_flush_policy(name=None):
+    """설정 이름(BUY_FLUSH_POLICY)으로 마감 정책 객체를 생성합니다."""
+    return strategy.make_flush_policy(name or BUY_FLUSH_POLICY, window=BUFFER_SECONDS,
+                                      max_wait=BUY_MAX_WAIT_SECONDS, quiet=BUY_QUIET_SECONDS)
 
+class BuySelector(strategy.BuySelector):
+    """서버 설정(MAX_BUY_RANK / SCORE_THRESHOLD / BUY_FLUSH_POLICY)을 기본값으로 쓰는 Top-K 선택기"""
+    def __init__(self, k=None, threshold=None, policy=None, clock=time.time):
+        super().__init__(k=MAX_BUY_RANK if k is None else k,
+                         threshold=SCORE_THRESHOLD if threshold is None else threshold,
+                         policy=policy or make_flush_policy(), clock=clock)
 
 # ==========================================
 # [5] 스마트 워커 (Background Worker)
@@ -355,21 +3485,27 @@ def execute_sell(data):
 def worker():
     """
     백그라운드 스레드:
-    1. 큐에서 트레이딩 시그널을 꺼냅니다.
+    1. 스케줄러에서 트레이딩 시그널을 꺼냅니다. (청산 레인 우선, 신호 도착 즉시 깨어남)
     2. [매도]는 즉시 집행합니다 (우선순위 높음).
-    3. [매수]는 일정 시간(BUFFER_SECONDS) 동안 모아서 점수(Score) 경쟁을 붙입니다.
-    4. 상위 랭킹 종목만 선별하여 매수합니다.
+    3. [매수]는 BuySelector로 종목별 최고 점수를 스트리밍 집계하며 경쟁을 붙입니다.
+    4. 마감 정책(BUY_FLUSH_POLICY)이 정한 시점에 상위 랭킹 종목만 선별하여 매수합니다.
     """
     add_log("👷 스마트 랭킹 워커가 시작되었습니다.")
+    if not startup.ready:
+        add_log(f"⏸️ [기동 대기] 키움 연결 준비({startup.state})가 끝나면 대기 중인 신호를 집행합니다.")
+        while not startup.wait(TOKEN_STARTUP_TIMEOUT): # 무기한 대기하지 않고 주기적으로 상태를 남김
+            add_log(f"⏸️ [기동 대기] 아직 준비되지 않았습니다. ({startup.state}, 시도 {startup.attempts}회{f', 오류: {startup.error}' if startup.error else ''})")
     
-    buy_buffer = []          # 매수 후보군 임시 저장소
-    flush_deadline = None    # 랭킹 산정 마감 시간
+    buy_selector = BuySelector()  # 매수 후보 Top-K 선택기
+    buffered = []                 # 이번 사이클에 받은 매수 신호 (저널 완료 처리용)
+    flush_deadline = None         # 랭킹 산정 마감 시간
     
     while True:
         try:
-            # 1. 큐 데이터 폴링 (0.5초 대기)
+            # 1. 다음 신호 대기 (버퍼 마감이 있으면 마감 시각까지만 대기)
+            timeout = max(flush_deadline - time.time(), 0) if flush_deadline else None
             try:
-                data = order_queue.get(timeout=0.5)
+                data = order_queue.get(timeout=timeout)
             except queue.Empty:
                 data = None
             
@@ -379,50 +3515,72 @@ def worker():
                 country = data.get("country", "")
 
                 # [A] 매도(청산) 신호 -> 즉시 실행
-                if any(k in action for k in ["Profit", "Stop", "Exit"]):
+                if is_exit_signal(action):
                     add_log(f"⚡ [매도 급행] {data.get('ticker')} 즉시 처리를 시작합니다.")
-                    if country != "US":
-                        execute_sell(data)
-                        time.sleep(1) 
+                    journal.dispatched(data)
+                    tracer.begin(data, "exit")
+                    tracer.attach(data)
+                    status = "error"
+                    try:
+                        # 호출 간격은 KiwoomAPI의 RateLimiter가 조절
+                        status = execute_exit(data) if country != "US" else "skip"
+                    finally:
+                        journal.complete(data, status)
+                        tracer.end(data, status)
                 
                 # [B] 매수 신호 -> 버퍼링 (경쟁 유도)
                 elif "BUY" in action:
                     # 첫 매수 신호가 들어오면 타이머 시작
-                    if not buy_buffer:
-                        flush_deadline = time.time() + BUFFER_SECONDS
-                        add_log(f"⏳ [매수 버퍼링 시작] {BUFFER_SECONDS}초 뒤 랭킹을 산정합니다.")
+                    if not buy_selector:
+                        add_log(f"⏳ [매수 버퍼링 시작] 마감 정책: {buy_selector.policy.describe()}")
                     
-                    buy_buffer.append(data)
-                    add_log(f"📥 [후보 등록] {data.get('ticker')} (점수: {data.get('score', 0)})")
+                    buy_selector.add(data)
+                    buffered.append(data)
+                    tracer.begin(data, "buy")
+                    flush_deadline = buy_selector.deadline() # 신호마다 마감 시각 재계산 (sliding/early)
+                    add_log(f"📥 [후보 등록] {data.get('ticker')} (점수: {data.get('score', 0)})", ticker=data.get('ticker'), event="rank")
                 
+                else:
+                    journal.complete(data, "ignored")
+
                 # 작업 완료 표시
                 order_queue.task_done()
 
             # 3. 버퍼 마감 시간 체크 및 일괄 실행
-            if buy_buffer and flush_deadline and time.time() >= flush_deadline:
-                add_log(f"⚖️ [랭킹 산정 시작] 후보: {len(buy_buffer)}개 / 선발: {MAX_BUY_RANK}개")
-                
-                # (1) 점수 기준 내림차순 정렬 (Score가 높은 순)
-                buy_buffer_scored = [b for b in buy_buffer if b.get("score", 0) > SCORE_THRESHOLD]
-                sorted_buys = sorted(buy_buffer_scored, key=lambda x: float(x.get("score", 0)), reverse=True)
+            if buy_selector and flush_deadline and time.time() >= flush_deadline:
+                add_log(f"⚖️ [랭킹 산정 시작] 신호: {len(buy_selector)}건 / 후보: {buy_selector.qualified}개 / 선발: {buy_selector.k}개")
                 
-                # (2) 상위 N개 선발
-                final_targets = sorted_buys[:MAX_BUY_RANK]
-                dropped_targets = sorted_buys[MAX_BUY_RANK:]
+                # (1)~(2) 종목별 최고 점수 기준 상위 K개 선발 (이미 스트리밍으로 집계됨)
+                for residency in buy_selector.residency():
+                    metrics.observe("kiwoom_buy_buffer_residency_seconds", residency)
+                ranking_started = time.perf_counter()
+                final_targets, dropped_tickers = buy_selector.flush()
+                metrics.observe("kiwoom_ranking_seconds", time.perf_counter() - ranking_started)
+
+                # 선발되지 않은 신호(탈락/같은 종목의 이전 신호)는 저널에서 완료 처리
+                selected = {id(t) for t in final_targets} if country != "US" else set()
+                for signal in buffered:
+                    if id(signal) not in selected:
+                        journal.complete(signal, "dropped")
+                        tracer.end(signal, "dropped")
+                buffered = []
                 
-                # (3) 선발 종목 매수 집행
+                # (3) 선발 종목 매수 집행 (동시 전송, 호출 간격은 RateLimiter가 조절)
                 if country != "US":
-                    for target in final_targets:
-                        execute_buy(target)
-                        time.sleep(1) # 주문 간 텀을 두어 API 과부하 방지
+                    if final_targets:
+                        # 배치 전체 예산을 계좌별 kt00011 1회로 확인 후 랭킹 순으로 계좌/예산 배정
+                        top = final_targets[0]
+                        cash = router.sync_cash(top.get("ticker"), float(top.get("price", 0) or 0))
+                        assignments = router.allocate(final_targets)
+                        budget = [f"{r['amount']}{router.label(a)}" for a, r in assignments]
+                        add_log(f"💰 [예산 배정] 가용 현금: {cash:,}원 -> {budget}")
+                        dispatch_buy_batch(final_targets, assignments)
 
                     # (4) 탈락 종목 로깅
-                    if dropped_targets:
-                        dropped_tickers = [d.get('ticker') for d in dropped_targets]
+                    if dropped_tickers:
                         add_log(f"🗑️ [진입 탈락] 점수/순위 미달: {dropped_tickers}")
                 
-                # (5) 버퍼 초기화
-                buy_buffer = []
+                # (5) 마감 초기화 (선택기는 flush 시 비워짐)
                 flush_deadline = None
                 add_log("🏁 [사이클 종료] 다시 대기 상태로 전환합니다.")
 
@@ -430,79 +3588,290 @@ def worker():
             add_log(f"❌ [워커 오류] 처리 중 예외 발생: {e}")
             time.sleep(1)
 
+# 계좌마다 BUY_DISPATCH_WORKERS개씩 (계좌별 호출 한도가 독립적이므로 동시 전송 수도 계좌 수에 비례)
+buy_executor = ThreadPoolExecutor(max_workers=BUY_DISPATCH_WORKERS * len(router), thread_name_prefix="KiwoomBuy")
+
+def dispatch_buy_batch(targets, assignments=None):
+    """
+    랭킹 순으로 정렬된 매수 대상을 스레드 풀(ASYNC_DISPATCH면 AsyncDispatcher 이벤트 루프)에 동시에 제출합니다.
+    - assignments: AccountRouter.allocate()가 배정한 대상별 (계좌, 예산) (없으면 기본 계좌에서 종목마다 kt00011 조회)
+    - 순위(rank)가 API 호출 우선순위가 되어, 한도가 부족하면 상위 종목이 먼저 전송됩니다.
+    - 워커 스레드는 대기하지 않고 바로 다음 신호(매도 등)를 처리합니다.
+    - 주문별 지연(배치 시작 -> 주문 응답)과 배치 요약을 로그로 남깁니다.
+    """
+    batch_started = time.monotonic()
+    latencies = []
+    lock = threading.Lock()
+
+    def _run(rank, target, api, reservation):
+        _dispatch_ctx.priority = rank
+        journal.dispatched(target)
+        tracer.attach(target)
+        try:
+            status = execute_buy(target, reservation, api)
+        except Exception as e:
+            add_log(f"❌ [매수 집행 오류] {target.get('ticker')}: {e}")
+            status = "error"
+        finally:
+            _dispatch_ctx.priority = 0
+        _finish(rank, target, api, status)
+
+    async def _run_async(rank, target, api, reservation):
+        journal.dispatched(target)
+        _async_ctx.set((rank, tracer.attach(target, bind=False))) # 태스크마다 컨텍스트가 복사되므로 다른 주문과 섞이지 않음
+        try:
+            status = await execute_buy_async(target, reservation, api)
+        except Exception as e:
+            add_log(f"❌ [매수 집행 오류] {target.get('ticker')}: {e}")
+            status = "error"
+        _finish(rank, target, api, status)
+
+    def _finish(rank, target, api, status):
+        journal.complete(target, status)
+        tracer.end(target, status)
+        elapsed = time.monotonic() - batch_started
+        metrics.observe("kiwoom_buy_dispatch_seconds", elapsed, status=status)
+        add_log(f"⏱️ [주문 지연] #{rank} {target.get('ticker')}{router.label(api)} | {elapsed:.2f}초 | {status}")
+
+        with lock:
+            latencies.append(elapsed)
+            done = len(latencies) == len(targets)
+        if done:
+            add_log(f"📊 [배치 완료] {len(targets)}건 | 최초 {min(latencies):.2f}초 / 최종 {max(latencies):.2f}초")
+            for api in {id(a): a for a, _ in assignments}.values():
+                api.cash.schedule_reconcile()
+
+    assignments = assignments or [(kiwoom, None)] * len(targets)
+    for rank, (target, (api, reservation)) in enumerate(zip(targets, assignments), 1):
+        if ASYNC_DISPATCH:
+            async_dispatcher.submit(_run_async(rank, target, api, reservation))
+        else:
+            buy_executor.submit(_run, rank, target, api, reservation)
+
+worker_thread = None           # 현재 워커 스레드 (생존 확인용 참조)
+_worker_lock = threading.Lock()
+
 def start_worker_if_needed():
-    """워커 스레드가 죽었는지 확인하고 필요 시 재시작"""
-    is_alive = False
-    for t in threading.enumerate():
-        if t.name == "KiwoomWorker":
-            is_alive = True
-            break
-            
-    if not is_alive:
+    """워커 스레드가 죽었는지 확인하고 필요 시 재시작 (스레드 목록 순회 없이 참조로 확인)"""
+    global worker_thread
+    if cluster.enabled and not cluster.is_leader:
+        return # 다중 프로세스 모드에서는 리더만 주문을 집행
+    if worker_thread is not None and worker_thread.is_alive():
+        return
+    with _worker_lock:
+        if worker_thread is not None and worker_thread.is_alive():
+            return
         add_log("🚑 워커 스레드가 발견되지 않아 재시작합니다.")
-        t = threading.Thread(target=worker, name="KiwoomWorker", daemon=True)
-        t.start()
+        if worker_thread is not None:
+            metrics.inc("kiwoom_worker_restarts_total") # 최초 기동이 아닌 경우만
+        worker_thread = threading.Thread(target=worker, name="KiwoomWorker", daemon=True)
+        worker_thread.start()
+
+def become_executor():
+    """
+    이 프로세스가 주문 집행을 맡을 때 1회 호출합니다. (네트워크를 기다리지 않고 바로 반환)
+    저널에서 미처리 신호 복구 (청산 신호 등 유실 방지) -> 백그라운드 키움 연결 시작 -> 워커 시작 (연결 준비까지 대기)
+    """
+    with startup.phase("journal"):
+        replayed = journal.replay()
+    def _prepare():
+        router.connect()
+        symbols.refresh_async(kiwoom.fetch_symbols, on_done=log_symbols) # 준비 완료를 막지 않음 (없으면 API로 대체)
+    startup.start(_prepare)
+    if replayed:
+        order_queue.put_many(replayed)
+        start_worker_if_needed()
+
+def enqueue_signals(signals):
+    """
+    웹훅 시그널을 확정(durable)한 뒤 대기열에 넣습니다.
+    - 단일 프로세스: 저널 group commit -> 스케줄러
+    - 다중 프로세스: 공유 큐 커밋 (리더의 pump가 저널 -> 스케줄러로 이관)
+    :return: 확정되면 True
+    """
+    if cluster.enabled:
+        return cluster.submit(signals)
+    if not journal.accept(signals):
+        return False
+    order_queue.put_many(signals)
+    return True
+
+if cluster.enabled:
+    cluster.start(on_elected=become_executor)
+else:
+    become_executor()
 
 # ==========================================
 # [6] 웹 서버 라우팅 (Flask)
 # ==========================================
+@app.route('/ready')
+def ready():
+    """
+    기동 준비 상태 (로드밸런서/헬스체크용). 키움 연결 준비 전에는 503
+    /webhook은 준비 전에도 시그널을 받아 대기열에 쌓아둡니다.
+    다중 프로세스 모드의 비리더는 시그널 접수만 하므로 항상 준비 상태입니다.
+    """
+    status = startup.status()
+    if cluster.enabled and not cluster.is_leader:
+        status.update(ready=True, role="follower")
+    return jsonify(status), 200 if status["ready"] else 503
+
 @app.route('/')
 def index():
-    """로그 확인용 간단한 웹 페이지 렌더링"""
-    html = """
+    """
+    로그 확인용 간단한 웹 페이지 렌더링
+    페이지는 한 번만 받고, 이후에는 /logs?since=<마지막 id>로 새 로그만 받아 위에 추가합니다.
+    """
+    return """
     <html><head><title>Kiwoom Bot Status</title>
-    <meta http-equiv="refresh" content="3">
+    <meta charset="utf-8">
     <style>
         body { background-color: #101010; color: #FFB000; padding: 20px; font-family: 'Consolas', monospace; }
         .log { border-bottom: 1px solid #333; padding: 6px; font-size: 14px; }
+        .log.ERROR { color: #FF5050; }
+        .log.WARN { color: #FFE070; }
         h2 { border-bottom: 2px solid #FFB000; padding-bottom: 10px; }
     </style>
     </head><body>
     <h2>🚀 Kiwoom Smart Trading Bot</h2>
-    <div id="logs">
+    <div id="logs"></div>
+    <script>
+        const MAX_LINES = %d;
+        const box = document.getElementById("logs");
+        let lastId = 0;
+
+        function render(entry) {
+            const div = document.createElement("div");
+            div.className = "log " + entry.level;
+            div.textContent = "[" + entry.time + "] " + entry.message;
+            box.insertBefore(div, box.firstChild);
+        }
+
+        async function poll() {
+            try {
+                const res = await fetch("/logs?since=" + lastId);
+                const body = await res.json();
+                body.entries.forEach(render);
+                lastId = body.last_id;
+                while (box.childNodes.length > MAX_LINES) box.removeChild(box.lastChild);
+            } catch (e) { /* 다음 주기에 재시도 */ }
+            setTimeout(poll, 2000);
+        }
+
+        fetch("/logs?tail=" + MAX_LINES).then(r => r.json()).then(body => {
+            body.entries.forEach(render);
+            lastId = body.last_id;
+        }).finally(() => setTimeout(poll, 2000));
+    </script>
+    </body></html>
+    """ % DASHBOARD_LOG_LINES
+
+@app.route('/logs')
+def logs():
     """
-    for log in server_logs:
-        html += f"<div class='log'>{log}</div>"
-    return html + "</div></body></html>"
+    구조화 로그 조회 (JSON)
+    - since: 이 id 이후 항목만 반환 (증분 조회)
+    - tail: 최근 N개 반환 (최초 로딩용)
+    - limit: 최대 반환 건수 (기본 LOG_PAGE_SIZE)
+    """
+    try:
+        tail = int(request.args.get("tail") or 0)
+        since = int(request.args.get("since", 0))
+        limit = min(int(request.args.get("limit", LOG_PAGE_SIZE)), LOG_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"status": "error", "reason": "invalid tail/since/limit"}), 400
+    last_id = server_logs.last_id
+    if tail:
+        entries, truncated = server_logs.tail(min(tail, LOG_PAGE_SIZE)), False
+    else:
+        entries, truncated = server_logs.since(since, limit)
+    if entries:
+        last_id = entries[-1]["id"]
+    return jsonify({"last_id": last_id, "entries": entries, "truncated": truncated})
+
+@app.route('/logs/stream')
+def logs_stream():
+    """
+    구조화 로그 실시간 스트림 (Server-Sent Events)
+    재접속 시 Last-Event-ID(또는 ?since=) 이후 항목부터 이어서 전송합니다.
+    """
+    try:
+        start_id = int(request.headers.get("Last-Event-ID") or request.args.get("since", server_logs.last_id))
+    except ValueError:
+        return jsonify({"status": "error", "reason": "invalid since/Last-Event-ID"}), 400
+
+    def _stream(last_id):
+        while True:
+            if not server_logs.wait(last_id, timeout=15):
+                yield ": ping\n\n" # 프록시 유휴 연결 종료 방지
+                continue
+            entries, _ = server_logs.since(last_id)
+            for entry in entries:
+                last_id = entry["id"]
+                yield f"id: {last_id}\ndata: {json.dumps(entry, ensure_ascii=False)}\n\n"
+
+    return Response(stream_with_context(_stream(start_id)), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 수집용 운영 지표"""
+    return Response(metrics.render(labels=cluster.labels, peers=cluster.peer_metrics()), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+def busy_response(reason, body=None):
+    """접수 거절 응답: 매수 레인 포화(full) 429 / 워커 정체(stalled)·기동 실패(startup_failed) 503, Retry-After와 대기열 상태 포함"""
+    view = queue_view()
+    payload = {"status": "busy", "reason": reason, "retry_after": QUEUE_RETRY_AFTER,
+               "queue": {**{lane: depth for lane, (depth, _) in view.items()}, "oldest_age": max(age for _, age in view.values())},
+               **(body or {})}
+    return jsonify(payload), 429 if reason == "full" else 503, {"Retry-After": str(QUEUE_RETRY_AFTER)}
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """
     TradingView 등의 외부 툴에서 보내는 웹훅을 수신합니다.
-    데이터를 파싱하여 큐(Order Queue)에 넣는 역할만 수행합니다.
+    데이터를 파싱하여 저널에 확정한 뒤 큐(Order Queue)에 넣는 역할만 수행합니다.
+    중복 수신(signal_id 또는 내용+시각 구간 기준)은 {"status": "duplicate"}로 응답하고 버립니다.
+    매수/청산으로 분류되지 않는 action(예: "WARMUP")은 400으로 거절합니다.
+    혼잡 시 매수 신호는 429(대기열 포화)/503(워커 정체)와 Retry-After로 거절합니다. (청산 신호는 기동 실패 중이 아니면 항상 접수)
+    기동 실패(키움 연결 재시도 중)에는 집행할 수 없으므로 모든 신호를 503으로 거절합니다.
     """
     try:
         start_worker_if_needed() # 일꾼 생존 확인
+        if startup.failed:
+            return busy_response("startup_failed", {"error": startup.error})
 
         raw_data = request.get_data(as_text=True)
         if not raw_data: return jsonify({"status": "no data"}), 400
 
-        # [JSON 파싱 보정] 줄바꿈 문자 등으로 인한 JSON 에러 방지
-        raw_data = raw_data.replace('\n', ' ').replace('\r', '')
-        
-        data = None
-        # 1. 표준 JSON 파싱 시도
         try:
-            data = json.loads(raw_data)
-        except json.JSONDecodeError:
-            # 2. TradingView 경고 메시지 포맷 ('||' 구분자) 처리
-            if "||" in raw_data:
-                try:
-                    parts = raw_data.split("||", 1)
-                    json_str = parts[1]
-                    data = json.loads(json_str)
-                except Exception as e:
-                    add_log(f"❌ [파싱 실패] Split 방식 실패: {e}")
-                    return jsonify({"status": "error", "reason": "invalid split format"}), 400
-            else:
-                add_log(f"❌ [파싱 실패] JSON 형식이 아닙니다: {raw_data}")
-                return jsonify({"status": "error", "reason": "invalid json"}), 400
+            parse_started = time.perf_counter()
+            data = parse_signal(raw_data)
+            metrics.observe("kiwoom_webhook_parse_seconds", time.perf_counter() - parse_started, endpoint="single")
+        except ValueError as e:
+            add_log(f"❌ [파싱 실패] {e}: {raw_data[:200]}")
+            return jsonify({"status": "error", "reason": str(e)}), 400
 
-        # 정상 파싱된 데이터를 큐에 삽입
-        order_queue.put(data)
-        
-        q_size = order_queue.qsize()
-        add_log(f"📥 [Webhook 수신] {data.get('ticker')} | {data.get('action')} (대기열: {q_size})")
+        # 중복 수신(재전송 등)은 큐에 넣지 않고 정상 응답 (재전송 중단)
+        dedup_key = dedup.check(data)
+        if dedup_key is None:
+            add_log(f"🔁 [중복 무시] {data.get('ticker')} | {data.get('action')}", ticker=data.get('ticker'), event="duplicate")
+            return jsonify({"status": "duplicate"}), 200
+
+        # 접수 제어: 혼잡 시 매수는 받지 않고 재시도 안내 (오래 쌓인 매수는 어차피 가격이 지나감)
+        admitted, _, reason = order_queue.admit([data], cluster.backlog())
+        if not admitted:
+            dedup.forget(dedup_key)
+            add_log(f"🚦 [접수 거절] {data.get('ticker')} | {data.get('action')} ({reason})", ticker=data.get('ticker'), event="shed")
+            return busy_response(reason)
+
+        # 저널(또는 공유 큐)에 확정된 뒤에만 큐에 넣고 "queued" 응답
+        if not enqueue_signals([data]):
+            dedup.forget(dedup_key)
+            add_log(f"❌ [저널 지연] {data.get('ticker')} 기록이 확정되지 않았습니다.")
+            return jsonify({"status": "error", "reason": "journal unavailable"}), 503
+        metrics.inc("kiwoom_webhook_signals_total", endpoint="single")
+        add_log(f"📥 [Webhook 수신] {data.get('ticker')} | {data.get('action')} (대기열: {order_queue.qsize()})", ticker=data.get('ticker'), event="webhook")
 
         return jsonify({"status": "queued"}), 200
 
@@ -510,6 +3879,177 @@ def webhook():
         add_log(f"❌ [Webhook 오류] {e}")
         return jsonify({"status": "error"}), 500
 
+@app.route('/webhook/batch', methods=['POST'])
+def webhook_batch():
+    """
+    여러 시그널을 한 번에 수신합니다.
+    - JSON 배열: [{...}, {...}]
+    - NDJSON: 한 줄에 시그널 1건 (TradingView '||' 포맷 줄도 허용)
+    파싱에 성공한 시그널은 모두 큐에 넣고, 실패한 줄은 errors로, 중복 수신은 duplicates 건수로 알려줍니다.
+    혼잡으로 접수하지 않은 매수는 rejected 건수로 알려주고 Retry-After를 붙입니다. (전부 거절되면 429/503)
+    기동 실패(키움 연결 재시도 중)에는 전부 503으로 거절합니다.
+    """
+    try:
+        start_worker_if_needed()
+        if startup.failed:
+            return busy_response("startup_failed", {"error": startup.error})
+
+        raw_data = request.get_data(as_text=True)
+        if not raw_data.strip(): return jsonify({"status": "no data"}), 400
+
+        signals, errors = [], []
+        parse_started = time.perf_counter()
+        if raw_data.lstrip().startswith("["):
+            try:
+                items = json.loads(raw_data, strict=False)
+            except json.JSONDecodeError:
+                return jsonify({"status": "error", "reason": "invalid json array"}), 400
+            for idx, item in enumerate(items):
+                if not isinstance(item, dict):
+                    errors.append({"index": idx, "reason": "not an object"})
+                    continue
+                try:
+                    check_action(item)
+                    signals.append(item)
+                except ValueError as e:
+                    errors.append({"index": idx, "reason": str(e)})
+        else:
+            for idx, line in enumerate(raw_data.splitlines()):
+                if not line.strip(): continue
+                try:
+                    signals.append(parse_signal(line))
+                except ValueError as e:
+                    errors.append({"index": idx, "reason": str(e)})
+
+        metrics.observe("kiwoom_webhook_parse_seconds", time.perf_counter() - parse_started, endpoint="batch")
+        if not signals:
+            return jsonify({"status": "error", "reason": "no valid signals", "errors": errors}), 400
+
+        received = len(signals)
+        dedup_keys = {} # id(신호) -> 중복 색인 키 (접수 실패 시 취소용)
+        for d in signals:
+            key = dedup.check(d)
+            if key is not None:
+                dedup_keys[id(d)] = key
+        signals = [d for d in signals if id(d) in dedup_keys]
+        duplicates = received - len(signals)
+        if duplicates:
+            add_log(f"🔁 [중복 무시] 일괄 수신 중 {duplicates}건", event="duplicate")
+        if not signals:
+            return jsonify({"status": "duplicate", "count": 0, "duplicates": duplicates, "errors": errors}), 200
+
+        signals, rejected, reason = order_queue.admit(signals, cluster.backlog())
+
+        for d in rejected:
+            dedup.forget(dedup_keys[id(d)])
+        if rejected:
+            add_log(f"🚦 [접수 거절] 일괄 수신 중 매수 {len(rejected)}건 ({reason})", event="shed")
+        if not signals:
+            return busy_response(reason, {"count": 0, "rejected": len(rejected), "duplicates": duplicates, "errors": errors})
+
+        if not enqueue_signals(signals):
+            for d in signals:
+                dedup.forget(dedup_keys[id(d)])
+            add_log(f"❌ [저널 지연] 일괄 {len(signals)}건 기록이 확정되지 않았습니다.")
+            return jsonify({"status": "error", "reason": "journal unavailable"}), 503
+        metrics.inc("kiwoom_webhook_signals_total", len(signals), endpoint="batch")
+        tickers = [d.get('ticker') for d in signals[:20]]
+        add_log(f"📥 [Webhook 일괄 수신] {len(signals)}건 {tickers}{' ...' if len(signals) > 20 else ''} (실패: {len(errors)}건, 대기열: {order_queue.qsize()})", event="webhook")
+
+        body = {"status": "queued", "count": len(signals), "duplicates": duplicates, "rejected": len(rejected), "errors": errors}
+        return jsonify(body), 200, ({"Retry-After": str(QUEUE_RETRY_AFTER)} if rejected else {})
+
+    except Exception as e:
+        add_log(f"❌ [Webhook 오류] {e}")
+        return jsonify({"status": "error"}), 500
+
+def admin_required(view):
+    """관리자 엔드포인트 인증: X-Admin-Token 헤더(또는 Bearer 토큰)가 ADMIN_TOKEN과 같아야 합니다. (미설정 시 404)"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"status": "disabled"}), 404
+        supplied = request.headers.get("X-Admin-Token") or request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+            add_log(f"⚠️ [관리자 인증 실패] {request.path} ({request.remote_addr})")
+            return jsonify({"status": "unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+_profile_lock = threading.Lock() # 프로파일링은 한 번에 하나만 (수집 스레드가 끝나면 해제)
+_profile = None                  # 마지막으로 시작한 SamplingProfiler (결과 조회용)
+
+def _profile_done(profiler):
+    add_log(f"🔬 [프로파일링 완료] #{profiler.id} 샘플 {profiler.samples}회 / 스택 {len(profiler.stacks)}종")
+    _profile_lock.release()
+
+@app.route('/admin/profile', methods=['POST'])
+@admin_required
+def admin_profile():
+    """
+    백그라운드 샘플링 프로파일링을 시작하고 조회용 id를 202로 바로 반환합니다. (이 프로세스 한정)
+    결과는 GET /admin/profile/<id>로 받습니다. (수집 중이면 202와 진행 상태)
+    - seconds: 수집 시간 (기본 10, 최대 PROFILE_MAX_SECONDS)
+    - interval: 수집 간격 (초, 기본 PROFILE_INTERVAL)
+    - threads: 대상 스레드 이름(쉼표 구분, 포함 여부) / all (기본: 워커, 매수/계좌 집행, 요청 스레드)
+    """
+    global _profile
+    try:
+        seconds = min(float(request.args.get("seconds", 10)), PROFILE_MAX_SECONDS)
+        interval = max(float(request.args.get("interval", PROFILE_INTERVAL)), 0.001)
+    except ValueError:
+        return jsonify({"status": "error", "reason": "invalid seconds/interval"}), 400
+    threads = request.args.get("threads")
+    threads = None if threads == "all" else tuple(t for t in threads.split(",") if t) if threads else PROFILE_THREADS
+    if not _profile_lock.acquire(blocking=False):
+        return jsonify({"status": "busy", "reason": "profiling already in progress", "id": _profile and _profile.id}), 409
+    try:
+        _profile = SamplingProfiler(threads, interval)
+        add_log(f"🔬 [프로파일링 시작] #{_profile.id} {seconds:g}초 | 간격 {interval * 1000:g}ms | 대상: {threads or '전체'}")
+        _profile.start(seconds, on_done=_profile_done)
+    except Exception:
+        _profile_lock.release()
+        raise
+    return jsonify({**_profile.status(), "result": f"/admin/profile/{_profile.id}"}), 202
+
+@app.route('/admin/profile/<int:profile_id>', methods=['GET'])
+@admin_required
+def admin_profile_result(profile_id):
+    """
+    프로파일링 결과 (마지막 1회분만 보관)
+    - format: collapsed(기본, flamegraph 입력) / json
+    """
+    profiler = _profile
+    if profiler is None or profiler.id != profile_id:
+        return jsonify({"status": "error", "reason": "unknown profile id"}), 404
+    if not profiler.done.is_set():
+        return jsonify(profiler.status()), 202
+    if request.args.get("format") == "json":
+        return jsonify({"samples": profiler.samples, "seconds": round(profiler.elapsed, 3), "interval": profiler.interval,
+                        "stacks": profiler.stacks})
+    return Response(profiler.collapsed(), mimetype="text/plain; charset=utf-8")
+
+@app.route('/admin/trace', methods=['GET', 'POST'])
+@admin_required
+def admin_trace():
+    """
+    시그널 처리 추적 (이 프로세스 한정, 다중 프로세스 모드에서는 리더에 요청)
+    - POST ?count=M: 다음 M개 신호의 추적을 예약 (이전 결과는 지움, 0이면 예약 취소)
+    - GET: 남은 예약 수와 완료된 추적 (신호별 구간: buffer / api-id별 호출 한도 대기·HTTP 왕복)
+    """
+    if request.method == "POST":
+        try:
+            count = int(request.args.get("count", 10))
+        except ValueError:
+            return jsonify({"status": "error", "reason": "invalid count"}), 400
+        count = max(0, min(count, TRACE_MAX_SIGNALS))
+        tracer.arm(count)
+        add_log(f"🔬 [추적 예약] 다음 시그널 {count}건")
+        return jsonify({"status": "armed", "count": count}), 200
+    return jsonify(tracer.status()), 200
+
+startup.record("import", _BOOT_STARTED) # 모듈 import(앱 생성) 소요 시간 - 네트워크 대기 없음
+
 # ==========================================
 # [7] 메인 실행 블록
 # ==========================================
@@ -0,0 +1,207 @@
+import heapq
+import itertools
+import time
+from fractions import Fraction
+
+# ==========================================
+# [1] 매매 정책 기본값
+# ==========================================
+# 이 모듈은 API/스레드/시계에 의존하지 않는 순수 의사결정 코드만 담습니다.
+# server.py(실거래)와 replay.py(오프라인 재생/파라미터 탐색)가 같은 코드를 사용합니다.
+EXIT_KEYWORDS = ("Profit", "Stop", "Exit")
+FULL_EXIT_KEYWORDS = ("Profit Target 2", "Final Exit", "Final Stop Loss")
+
+DEFAULT_EXIT_SPLITS = {      # 부분 청산 비율 (보유 수량 대비)
+    "tp1": Fraction(1, 2),       # Profit Target 1: 50% 분할 익절
+    "stop_loss": Fraction(3, 10), # Stop Loss: 30% 부분 손절
+    "default": Fraction(1, 3),   # 그 외 청산 신호: 1/3
+}
+
+# ==========================================
+# [2] 신호 분류 / 수량 계산
+# ==========================================
+def is_exit_signal(action):
+    """매도(청산) 신호 여부"""
+    return any(k in action for k in EXIT_KEYWORDS)
+
+def is_buy_signal(action):
+    """매수 신호 여부 (청산 키워드 없이 BUY 포함)"""
+    return "BUY" in action and not is_exit_signal(action)
+
+def is_full_exit(action):
+    """전량 청산 신호 여부 (부분 청산 신호를 대체함)"""
+    return any(k in action for k in FULL_EXIT_KEYWORDS)
+
+def target_quantity(price, target_amount):
+    """목표 금액에 해당하는 매수 수량 (1주 가격이 목표 금액보다 비싸면 최소 1주)"""
+    return max(int(target_amount / price), 1)
+
+def order_amount(price, target_amount):
+    """매수 1건에 필요한 예산 (실제 주문할 수량 x 가격)"""
+    return target_quantity(price, target_amount) * price if price > 0 else 0
+
+def exit_quantity(action, current_qty, splits=None):
+    """
+    청산 신호 문구에 따른 매도 수량을 계산합니다.
+    :param splits: 부분 청산 비율 (기본 DEFAULT_EXIT_SPLITS, 키: tp1 / stop_loss / default)
+    :return: (매도 수량, 로그용 설명)
+    """
+    splits = {**DEFAULT_EXIT_SPLITS, **(splits or {})}
+    if "Profit Target 1" in action:
+        ratio, label = splits["tp1"], f"💰 TP 1 ({float(splits['tp1']):.0%})"
+    elif is_full_exit(action):
+        return current_qty, "👋 전량 청산"
+    elif "Stop Loss" in action:
+        ratio, label = splits["stop_loss"], f"📉 부분 손절 ({float(splits['stop_loss']):.0%})"
+    else:
+        ratio, label = splits["default"], "✂️ 일반 분할 청산"
+    return max(int(current_qty * ratio), 1), label
+
+# ==========================================
+# [3] 매수 후보 선별 (Streaming Top-K)
+# ==========================================
+class FixedWindowPolicy():
+    """첫 매수 신호 후 window초가 지나면 마감합니다."""
+    name = "fixed"
+
+    def __init__(self, window, max_wait, quiet=None):
+        self.window = window
+        self.max_wait = max_wait
+
+    def _cap(self, selector, deadline):
+        return min(deadline, selector.first_at + self.max_wait)
+
+    def deadline(self, selector):
+        return self._cap(selector, selector.first_at + self.window)
+
+    def describe(self):
+        return f"고정 {self.window}초"
+
+class SlidingWindowPolicy(FixedWindowPolicy):
+    """마지막 매수 신호 후 quiet초간 새 신호가 없으면 마감합니다. (max_wait 상한)"""
+    name = "sliding"
+
+    def __init__(self, window, max_wait, quiet=None):
+        super().__init__(window, max_wait)
+        self.quiet = window if quiet is None else quiet
+
+    def deadline(self, selector):
+        return self._cap(selector, selector.last_at + self.quiet)
+
+    def describe(self):
+        return f"무신호 {self.quiet}초 (최대 {self.max_wait}초)"
+
+class EarlyFlushPolicy(FixedWindowPolicy):
+    """기준 점수를 넘는 후보가 K개 모이면 윈도우를 기다리지 않고 즉시 마감합니다."""
+    name = "early"
+
+    def deadline(self, selector):
+        if selector.qualified >= selector.k:
+            return selector.last_at
+        return super().deadline(selector)
+
+    def describe(self):
+        return f"상위 후보 확보 시 즉시 (최대 {min(self.window, self.max_wait)}초)"
+
+FLUSH_POLICIES = {p.name: p for p in (FixedWindowPolicy, SlidingWindowPolicy, EarlyFlushPolicy)}
+
+def make_flush_policy(name, window, max_wait, quiet=None):
+    """정책 이름으로 마감 정책 객체를 생성합니다. (알 수 없는 이름이면 fixed)"""
+    return FLUSH_POLICIES.get(name, FixedWindowPolicy)(window, max_wait, quiet)
+
+class BuySelector():
+    """
+    매수 후보를 스트리밍으로 선별하는 Top-K 선택기입니다. (버퍼 전체 정렬 대체)
+    - 종목별로 최고 점수 1건만 유지합니다. (같은 종목이 여러 자리를 차지하지 않음)
+    - 크기 K의 최소 힙으로 상위 K개만 유지하고, 밀려난 종목은 탈락 목록에 기록합니다.
+    - 마감 시점은 교체 가능한 정책(FlushPolicy)이 결정합니다.
+    - clock을 바꾸면 가상 시계로도 동작합니다. (오프라인 재생용)
+    """
+    def __init__(self, k, threshold, policy, clock=time.time):
+        self.k = k
+        self.threshold = threshold
+        self.policy = policy
+        self.clock = clock
+        self._seq = itertools.count()
+        self._reset()
+
+    def _reset(self):
+        self._best = {}          # ticker -> (score, seq, data)
+        self._heap = []          # (score, -seq, ticker) 최소 힙 (동점이면 늦게 온 신호가 먼저 밀려남)
+        self._arrived = {}       # ticker -> 첫 신호 도착 시각 (버퍼 체류 시간 계산용)
+        self.dropped = {}        # ticker -> score (기준 미달 또는 순위 밀림)
+        self.received = 0
+        self.first_at = None
+        self.last_at = None
+
+    def __len__(self):
+        return self.received
+
+    @property
+    def qualified(self):
+        return len(self._best)
+
+    def add(self, data):
+        """
+        매수 신호 1건을 반영합니다.
+        :return: 현재 상위 K개에 포함되었는지 여부
+        """
+        now = self.clock()
+        if self.first_at is None:
+            self.first_at = now
+        self.last_at = now
+        self.received += 1
+
+        ticker = data.get("ticker")
+        self._arrived.setdefault(ticker, now)
+        try:
+            score = float(data.get("score", 0))
+        except (TypeError, ValueError):
+            score = 0.0
+        if score <= self.threshold:
+            if ticker not in self._best:
+                self.dropped.setdefault(ticker, score)
+            return ticker in self._best
+
+        best = self._best.get(ticker)
+        if best and best[0] >= score:
+            return True # 기존 최고 점수 유지
+        seq = next(self._seq)
+        self._best[ticker] = (score, seq, data)
+        self.dropped.pop(ticker, None)
+        heapq.heappush(self._heap, (score, -seq, ticker))
+
+        # 상위 K개를 넘으면 최저 점수 종목을 밀어냄 (갱신으로 무효가 된 힙 항목은 건너뜀)
+        while len(self._best) > self.k:
+            low_score, neg_seq, low_ticker = heapq.heappop(self._heap)
+            current = self._best.get(low_ticker)
+            if current and current[1] == -neg_seq:
+                del self._best[low_ticker]
+                self.dropped[low_ticker] = low_score
+        return ticker in self._best
+
+    def deadline(self):
+        """현재 후보 상태 기준 마감 시각 (후보가 없으면 None)"""
+        if self.first_at is None:
+            return None
+        return self.policy.deadline(self)
+
+    def residency(self, now=None):
+        """현재 후보들의 버퍼 체류 시간 목록 (초)"""
+        now = self.clock() if now is None else now
+        return [now - self._arrived[t] for t in self._best if t in self._arrived]
+
+    def due(self, now=None):
+        deadline = self.deadline()
+        return deadline is not None and (self.clock() if now is None else now) >= deadline
+
+    def flush(self):
+        """
+        점수 내림차순 상위 K개를 반환하고 선택기를 비웁니다.
+        :return: (선발 신호 리스트, 탈락 종목 리스트)
+        """
+        ranked = sorted(self._best.values(), key=lambda x: (-x[0], x[1]))
+        targets = [data for _, _, data in ranked]
+        dropped = list(self.dropped)
+        self._reset()
+        return targets, dropped
@@ -0,0 +1,252 @@
+import os
+import mmap
+import struct
+import time
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+# ==========================================
+# [1] 호가 단위 / 가격 제한폭
+# ==========================================
+# 이 모듈은 API/스레드 설정에 의존하지 않습니다. 종목 목록 조회 함수는 server.py가 넘겨줍니다.
+KST = ZoneInfo("Asia/Seoul")
+
+MARKETS = ("KOSPI", "KOSDAQ", "KONEX", "ETF", "ETN") # 파일에는 인덱스(1바이트)로 저장
+TICK_TABLE = (               # (가격 상한 미만, 호가 단위) - 2023-01-25 유가/코스닥 통합 기준
+    (2000, 1),
+    (5000, 5),
+    (20000, 10),
+    (50000, 50),
+    (200000, 100),
+    (500000, 500),
+    (float("inf"), 1000),
+)
+FUND_TICK_TABLE = (          # ETF/ETN (가격 상한 미만, 호가 단위)
+    (2000, 1),
+    (float("inf"), 5),
+)
+PRICE_LIMIT_RATE = 0.3       # 일일 가격 제한폭 (기준가 대비 ±30%)
+REFRESH_RETRY_SECONDS = 600  # 목록 갱신 실패 후 다시 시도하기까지의 간격 (초)
+
+def tick_size(price, market="KOSPI"):
+    """해당 가격대의 호가 단위 (ETF/ETN은 FUND_TICK_TABLE)"""
+    table = FUND_TICK_TABLE if market in ("ETF", "ETN") else TICK_TABLE
+    for bound, tick in table:
+        if price < bound:
+            return tick
+    return table[-1][1]
+
+def round_to_tick(price, market="KOSPI", up=False):
+    """
+    가격을 유효한 호가로 맞춥니다. (기본 내림, up=True면 올림)
+    구간 경계(2,000 / 5,000 / ...)는 다음 구간 호가 단위의 배수이므로 올림 결과도 항상 유효한 호가입니다.
+    """
+    price = int(price)
+    tick = tick_size(price, market)
+    if up:
+        return -(-price // tick) * tick
+    return price // tick * tick
+
+def price_limits(base, market="KOSPI"):
+    """
+    기준가(전일 종가)로 당일 상/하한가를 계산합니다.
+    제한폭은 기준가의 호가 단위로 절사하고, 상한가는 내림 / 하한가는 올림으로 호가에 맞춥니다.
+    :return: (상한가, 하한가)
+    """
+    tick = tick_size(base, market)
+    width = int(base * PRICE_LIMIT_RATE) // tick * tick
+    return round_to_tick(base + width, market), round_to_tick(max(base - width, 1), market, up=True)
+
+# ==========================================
+# [2] 종목 마스터 (메모리 맵 파일)
+# ==========================================
+class SymbolMaster():
+    """
+    KRX 전 종목의 종목명/시장/기준가/상하한가를 담은 고정 폭 레코드 파일을 mmap으로 읽습니다.
+    - 파일 구조: 헤더 | 종목코드 순으로 정렬된 레코드 배열 | 종목명(UTF-8) 연속 영역
+    - 조회는 mmap 위 이진 탐색이라 프로세스별 인덱스를 만들지 않으며, 같은 파일을 여러 프로세스가 공유합니다.
+      (페이지 캐시 1벌, gunicorn 워커가 늘어도 메모리 증가 없음)
+    - 하루 1회(KST 날짜 기준) 목록을 받아 임시 파일 -> 교체(os.replace)로 다시 만듭니다.
+      교체 전에 열어둔 mmap은 이전 파일을 계속 가리키므로 읽는 쪽은 잠금이 필요 없습니다.
+    - 날짜가 지난 파일은 종목명/호가 단위에만 쓰고, 가격 제한폭 검사는 하지 않습니다. (기준가가 바뀌었으므로)
+    """
+    MAGIC = b"KRXSYM1\0"
+    HEADER = struct.Struct("<8sIII")     # magic, 기준일(YYYYMMDD), 종목 수, 종목명 영역 시작 위치
+    RECORD = struct.Struct("<6sBxiiiIH") # 종목코드, 시장, (패딩), 기준가, 상한가, 하한가, 종목명 위치, 종목명 길이
+
+    def __init__(self, path):
+        self.path = path
+        self.enabled = bool(path)
+        self.date = 0            # 현재 열린 파일의 기준일 (YYYYMMDD)
+        self._state = None       # (mmap, 종목 수, 종목명 영역 시작 위치) - 한 번에 교체
+        self._building = False
+        self._attempted_at = None  # 마지막 갱신 시도 시각 (monotonic)
+        self._lock = threading.Lock() # _building/_attempted_at 확인-설정을 한 번에 (주문 스레드가 동시에 호출)
+
+    @staticmethod
+    def today():
+        return int(datetime.now(KST).strftime("%Y%m%d"))
+
+    @property
+    def loaded(self):
+        return self._state is not None
+
+    @property
+    def count(self):
+        return self._state[1] if self._state else 0
+
+    @property
+    def is_current(self):
+        return self.loaded and self.date == self.today()
+
+    def open(self):
+        """기존 파일을 엽니다. :return: 열었으면 True (없거나 손상되었으면 False)"""
+        if not self.enabled or not os.path.exists(self.path):
+            return False
+        with open(self.path, "rb") as f:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return False # 빈 파일
+        if len(mapped) < self.HEADER.size:
+            mapped.close()
+            return False
+        magic, date, count, names_at = self.HEADER.unpack_from(mapped, 0)
+        if magic != self.MAGIC or names_at != self.HEADER.size + count * self.RECORD.size or names_at > len(mapped):
+            mapped.close()
+            return False
+        # 이전 mmap은 닫지 않고 GC에 맡김 (다른 스레드가 조회 중일 수 있음)
+        self._state = (mapped, count, names_at)
+        self.date = date
+        return True
+
+    def load(self, fetch):
+        """
+        오늘 날짜 파일이 있으면 열고, 없으면 fetch()로 목록을 받아 만든 뒤 엽니다.
+        :param fetch: () -> [(종목코드, 종목명, 시장, 기준가)] 또는 실패 시 None
+        :return: 종목 수 (실패 시 기존 파일 유지, 0일 수 있음)
+        """
+        if not self.enabled:
+            return 0
+        if self.open() and self.date == self.today():
+            return self.count
+        rows = fetch()
+        if rows:
+            self.build(rows)
+            self.open()
+        return self.count
+
+    def build(self, rows, date=None):
+        """목록으로 파일을 만듭니다. (임시 파일 -> fsync -> 교체)"""
+        records, names = [], bytearray()
+        seen = set()
+        for ticker, name, market, base in sorted(rows, key=lambda r: r[0]):
+            ticker = str(ticker)
+            if len(ticker) != 6 or ticker in seen:
+                continue
+            seen.add(ticker)
+            market = market if market in MARKETS else "KOSPI"
+            base = int(base or 0)
+            upper, lower = price_limits(base, market) if base > 0 else (0, 0)
+            encoded = str(name or ticker).encode("utf-8")[:255]
+            records.append((ticker.encode("ascii"), MARKETS.index(market), base, upper, lower, len(names), len(encoded)))
+            names += encoded
+        names_at = self.HEADER.size + len(records) * self.RECORD.size
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, date or self.today(), len(records), names_at))
+            for record in records:
+                f.write(self.RECORD.pack(*record))
+            f.write(names)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        return len(records)
+
+    def refresh_async(self, fetch, on_done=None):
+        """
+        기준일이 지났으면 백그라운드에서 다시 만듭니다. (중복 실행 방지, 조회는 기존 파일로 계속)
+        실패하면 REFRESH_RETRY_SECONDS 동안은 다시 시도하지 않습니다. (주문마다 호출해도 비용 없음)
+        """
+        if not self.enabled or self._building or self.is_current:
+            return
+        with self._lock:
+            if self._building:
+                return
+            if self._attempted_at is not None and time.monotonic() - self._attempted_at < REFRESH_RETRY_SECONDS:
+                return
+            self._building = True
+            self._attempted_at = time.monotonic()
+        def _run():
+            try:
+                count = self.load(fetch)
+                if on_done:
+                    on_done(count)
+            finally:
+                self._building = False
+        threading.Thread(target=_run, name="KiwoomSymbols", daemon=True).start()
+
+    def _find(self, ticker):
+        """:return: (레코드 튜플, mmap, 종목명 영역 시작 위치) 또는 None (mmap 위 이진 탐색)"""
+        state = self._state
+        if state is None:
+            return None
+        mapped, count, names_at = state
+        key = str(ticker).encode("ascii", "ignore")
+        lo, hi = 0, count
+        base_at, size = self.HEADER.size, self.RECORD.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            at = base_at + mid * size
+            code = mapped[at:at + 6]
+            if code < key:
+                lo = mid + 1
+            elif code > key:
+                hi = mid
+            else:
+                return self.RECORD.unpack_from(mapped, at), mapped, names_at
+        return None
+
+    def get(self, ticker):
+        """:return: {"ticker", "name", "market", "base", "upper", "lower"} 또는 None (미등록 종목)"""
+        found = self._find(ticker)
+        if found is None:
+            return None
+        (code, market, base, upper, lower, name_at, name_len), mapped, names_at = found
+        start = names_at + name_at
+        return {
+            "ticker": code.decode("ascii"),
+            "name": mapped[start:start + name_len].decode("utf-8", "replace"),
+            "market": MARKETS[market],
+            "base": base,
+            "upper": upper,
+            "lower": lower,
+        }
+
+    def name(self, ticker):
+        """종목명 (미등록이면 None)"""
+        info = self.get(ticker)
+        return info["name"] if info else None
+
+    def check_price(self, ticker, price, trade_type):
+        """
+        지정가 주문 가격을 호가 단위로 맞추고 당일 가격 제한폭을 검사합니다.
+        - 매수는 올림 / 매도는 내림 (호가에 걸리지 않은 가격은 체결 가능한 쪽으로 - 신호 가격 도달 시 바로 체결)
+        - 시장가(0)와 미등록 종목은 그대로 통과
+        :return: (보정된 가격, 거절 사유 또는 None)
+        """
+        price = int(float(price or 0))
+        info = self.get(ticker) if price > 0 else None
+        if info is None:
+            return price, None
+        rounded = round_to_tick(price, info["market"], up=(trade_type == "buy"))
+        if self.date == self.today() and info["upper"]:
+            if rounded > info["upper"]:
+                return rounded, f"상한가 {info['upper']:,}원 초과"
+            if rounded < info["lower"]:
+                return rounded, f"하한가 {info['lower']:,}원 미만"
+        return rounded, None
+
+    def __len__(self):
+        return self.count
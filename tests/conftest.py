@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_kiwoom
+
+# server 모듈은 import 시점에 키움 연결/워커를 시작하므로, 모의 서버를 먼저 띄우고 파일 출력은 끕니다.
+_mock_server, _mock_url = mock_kiwoom.serve_in_thread()
+os.environ["KIWOOM_BASE_URL"] = _mock_url
+os.environ["KIWOOM_JOURNAL"] = ""
+os.environ["KIWOOM_SYMBOLS"] = ""
+os.environ["KIWOOM_LOG_FILE"] = ""
+os.environ["KIWOOM_CLUSTER_DB"] = ""
+
+@pytest.fixture(scope="session")
+def server():
+    import server as module
+    module.startup.wait(30)
+    return module
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+import requests
+
+@pytest.fixture
+def api(server):
+    api = server.KiwoomAPI("key", "secret", connect=False, name="async", base_url=server.BASE_URL)
+    api.limiter = server.RateLimiter({}) # 호출 한도 대기 없음
+    api.tokens.refresh()
+    yield api
+    api._hedge_pool.shutdown(wait=False)
+
+def broker_orders(server, since):
+    return requests.get(f"{server.BASE_URL}/_mock/orders", params={"since": since}, timeout=5).json()
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+def test_send_order_reaches_broker_and_order_book(server, api):
+    since = time.time()
+    client = server.async_dispatcher.client(api)
+    assert server.async_dispatcher.client(api) is client # 계좌당 1개
+    result = server.async_dispatcher.run(client.send_order("buy", "005930", 70000, 2))
+    assert result["status"] == "success"
+    assert [(o["side"], o["ticker"], o["qty"]) for o in broker_orders(server, since)] == [("buy", "005930", 2)]
+    assert [o["ticker"] for o in api.orders.open_orders()] == ["005930"]
+
+def test_expired_token_is_refreshed_once_and_order_retried(server, api):
+    api.tokens.token = "mock-stale" # 브로커가 8005로 거절하는 토큰 (로컬 만료 시각은 유효)
+    refreshes = api.tokens.refreshes
+    client = server.async_dispatcher.client(api)
+    result = server.async_dispatcher.run(client.send_order("buy", "000660", 120000, 1))
+    assert result["status"] == "success"
+    assert api.tokens.refreshes == refreshes + 1 and api.tokens.token != "mock-stale"
+
+def test_buy_batch_is_dispatched_on_event_loop(server, api, monkeypatch):
+    monkeypatch.setattr(server, "ASYNC_DISPATCH", True)
+    since = time.time()
+    targets = [{"ticker": "035420", "price": 200000, "score": 9}, {"ticker": "035720", "price": 50000, "score": 8}]
+    api.cash.sync("035420", 200000) # 브로커 현금으로 장부 대조
+    reservation = api.cash.reserve(2000000)
+    server.dispatch_buy_batch(targets, [(api, reservation), (api, None)])
+    assert wait_until(lambda: len(api.orders.open_orders()) == 2) # 접수 응답까지 반영
+    assert sorted(o["ticker"] for o in broker_orders(server, since)) == ["035420", "035720"]
+
+def test_exit_is_sent_from_every_holder_on_event_loop(server, api, monkeypatch):
+    monkeypatch.setattr(server, "ASYNC_DISPATCH", True)
+    monkeypatch.setattr(server, "router", server.AccountRouter([api]))
+    server.async_dispatcher.run(server.async_dispatcher.client(api).send_order("buy", "051910", 400000, 3))
+    api.positions.invalidate()
+    since = time.time()
+    status = server.execute_exit({"ticker": "051910", "action": "Take Profit Full", "stop": 400000})
+    assert status == "success"
+    assert [(o["side"], o["ticker"]) for o in broker_orders(server, since)] == [("sell", "051910")]
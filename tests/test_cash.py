@@ -0,0 +1,34 @@
+import threading
+
+def test_sync_keeps_in_flight_reservations_and_orders_accepted_during_fetch(server):
+    during_fetch = []
+    def fetch(ticker, price):
+        for reservation, used in during_fetch:
+            ledger.commit(reservation, used)
+        return 1000000, 0
+    ledger = server.CashLedger(fetch)
+    ledger.sync("005930", 70000)
+    accepted, pending = ledger.reserve(300000), ledger.reserve(200000)
+    ledger.commit(ledger.reserve(100000), 100000) # 조회 전 접수 -> 브로커 금액에 반영됨
+    during_fetch.append((accepted, 300000))       # 조회가 오가는 사이 진행 중인 배치의 주문이 접수됨
+    ledger.sync("005930", 70000)
+    assert ledger.spent == 300000
+    assert ledger.reserved == {pending["id"]: 200000}
+    assert ledger.available == 1000000 - 300000 - 200000
+
+def test_sync_response_older_than_applied_one_is_ignored(server):
+    slow_started, release = threading.Event(), threading.Event()
+    def fetch(ticker, price):
+        if ticker == "slow":
+            slow_started.set()
+            release.wait(5)
+            return 900000, 0
+        return 500000, 0
+    ledger = server.CashLedger(fetch)
+    slow = threading.Thread(target=ledger.sync, args=("slow", 1))
+    slow.start()
+    assert slow_started.wait(5)
+    ledger.sync("fast", 1)
+    release.set()
+    slow.join()
+    assert ledger.broker_cash == 500000
@@ -0,0 +1,71 @@
+import fcntl
+import time
+
+import pytest
+
+def _follower(server, path):
+    """다른 프로세스가 리더 잠금을 쥔 상태의 팔로워"""
+    lock_file = open(path + ".leader", "a")
+    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    follower = server.ClusterCoordinator(path)
+    follower.start(on_elected=lambda: None)
+    assert not follower.is_leader
+    return follower, lock_file
+
+def _publish_leader_lanes(server, path, exits, buys, age=0.0):
+    conn = server.sqlite_connect(path, synchronous="NORMAL")
+    conn.execute("INSERT OR REPLACE INTO lanes (pid, updated_at, exits, buys, exit_age, buy_age) VALUES (?, ?, ?, ?, ?, ?)",
+                 (-1, time.time(), exits, buys, age, age))
+    conn.close()
+
+@pytest.fixture
+def follower(server, tmp_path):
+    path = str(tmp_path / "cluster.db")
+    follower, lock_file = _follower(server, path)
+    yield follower, path
+    lock_file.close()
+
+def test_follower_rejects_buys_when_cluster_backlog_full(server, follower):
+    follower, path = follower
+    scheduler = server.SignalScheduler(max_buys=5)
+    _publish_leader_lanes(server, path, exits=1, buys=2)
+    assert follower.submit([{"ticker": f"00000{i}", "action": "BUY"} for i in range(2)])
+
+    view = follower.queue_view()
+    assert view["exit"][0] == 1 and view["buy"][0] == 2 and view["shared"][0] == 2
+    assert follower.backlog()[0] == 4
+
+    admitted, rejected, reason = scheduler.admit([{"ticker": "100000", "action": "BUY"},
+                                                  {"ticker": "200000", "action": "BUY"}], follower.backlog())
+    assert [d["ticker"] for d in admitted] == ["100000"]
+    assert len(rejected) == 1 and reason == "full"
+
+    assert follower.submit(admitted)
+    admitted, rejected, reason = scheduler.admit([{"ticker": "300000", "action": "BUY"},
+                                                  {"ticker": "300000", "action": "EXIT"}], follower.backlog())
+    assert [d["action"] for d in admitted] == ["EXIT"] # 청산은 항상 접수
+    assert reason == "full"
+
+def test_follower_rejects_buys_when_shared_queue_stalls(server, follower):
+    follower, path = follower
+    scheduler = server.SignalScheduler(max_buys=100, stall_seconds=5)
+    conn = server.sqlite_connect(path, synchronous="NORMAL")
+    conn.execute("INSERT INTO signals (ts, data) VALUES (?, ?)", (time.time() - 10, '{"ticker": "005930", "action": "BUY"}'))
+    conn.close()
+
+    admitted, rejected, reason = scheduler.admit([{"ticker": "000660", "action": "BUY"}], follower.backlog())
+    assert not admitted and reason == "stalled"
+
+def test_stale_leader_lanes_are_ignored(server, follower):
+    follower, path = follower
+    conn = server.sqlite_connect(path, synchronous="NORMAL")
+    conn.execute("INSERT INTO lanes (pid, updated_at, exits, buys, exit_age, buy_age) VALUES (?, ?, ?, ?, ?, ?)",
+                 (-1, time.time() - 60, 3, 400, 0, 0))
+    conn.close()
+    assert follower.queue_view()["buy"] == (0, 0)
+
+def test_shared_log_batch_trims_to_capacity_in_same_transaction(server, tmp_path):
+    logs = server.SharedLogStore(str(tmp_path / "cluster.db"), capacity=50)
+    logs.extend([(f"m{i}", "INFO", None, None, time.time(), None) for i in range(120)])
+    assert len(logs) == 50 and not logs._conn.in_transaction
+    assert [e["message"] for e in logs.tail(2)] == ["m118", "m119"]
@@ -0,0 +1,97 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+class FakeTransport():
+    """지연/실패를 호출 순서대로 지정하는 전송 계층 (post 호출 기록)"""
+    def __init__(self, *behaviors):
+        self.behaviors = list(behaviors) # (지연 초, 상태 코드 또는 예외)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def post(self, path, api_id, headers, payload):
+        with self._lock:
+            index = self.calls
+            self.calls += 1
+        delay, outcome = self.behaviors[min(index, len(self.behaviors) - 1)]
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(status_code=outcome, index=index)
+
+@pytest.fixture
+def api(server):
+    api = server.KiwoomAPI("key", "secret", connect=False, name="test", base_url="http://127.0.0.1:9")
+    api.limiter = server.RateLimiter({}) # 호출 한도 대기 없음
+    yield api
+
+    api._hedge_pool.shutdown(wait=False)
+
+def read(api):
+    return api._post("/api/dostk/acnt", "kt00018", {}, headers={})
+
+def test_breaker_opens_after_consecutive_failures_and_probes_with_backoff(server):
+    breaker = server.CircuitBreaker("kt00018@test", threshold=2, cooldown=(0.05, 0.15))
+    breaker.record(False)
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow() # 시험 요청 결과가 나올 때까지 나머지는 차단
+    breaker.record(False)
+    assert breaker.state == "open" and breaker.cooldown == 0.1
+
+    time.sleep(0.06)
+    assert not breaker.allow() # 늘어난 cooldown 동안은 계속 차단
+    time.sleep(0.05)
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed" and breaker.failures == 0 and breaker.cooldown == 0.05
+
+def test_read_trips_breaker_and_skips_transport(server, api):
+    api.transport = FakeTransport((0, 500))
+    for _ in range(server.BREAKER_FAILURES):
+        assert read(api).status_code == 500
+    with pytest.raises(server.BreakerOpen):
+        read(api)
+    assert api.transport.calls == server.BREAKER_FAILURES
+
+def test_read_counts_exceptions_as_failures_but_not_4xx(server, api):
+    api.transport = FakeTransport((0, ConnectionError("reset")))
+    with pytest.raises(ConnectionError):
+        read(api)
+    assert api.breakers["kt00018"].failures == 1
+    api.transport = FakeTransport((0, 400))
+    assert read(api).status_code == 400
+    assert api.breakers["kt00018"].failures == 0
+
+def test_orders_never_go_through_breaker(server, api):
+    api.transport = FakeTransport((0, 500))
+    for _ in range(server.BREAKER_FAILURES + 1):
+        assert api._post("/api/dostk/ordr", "kt10000", {}, headers={}).status_code == 500
+    assert api.transport.calls == server.BREAKER_FAILURES + 1
+
+def test_slow_read_is_hedged_and_first_response_wins(server, api):
+    api.latency["kt00018"].extend([0.01] * server.HEDGE_MIN_SAMPLES)
+    api.transport = FakeTransport((0.5, 200), (0, 200))
+    started = time.monotonic()
+    res = read(api)
+    assert res.index == 1 # 헤지 요청의 응답
+    assert time.monotonic() - started < 0.4
+    assert api.transport.calls == 2
+
+def test_read_is_not_hedged_without_rate_limit_room(server, api):
+    api.latency["kt00018"].extend([0.01] * server.HEDGE_MIN_SAMPLES)
+    api.limiter = server.RateLimiter({"kt00018": (1, 1)}) # 원 요청이 유일한 토큰을 씀
+    api.transport = FakeTransport((0.2, 200), (0, 200))
+    assert read(api).index == 0
+    assert api.transport.calls == 1
+
+def test_read_is_not_hedged_before_enough_samples(server, api):
+    api.transport = FakeTransport((0.2, 200), (0, 200))
+    assert read(api).index == 0
+    assert api.transport.calls == 1
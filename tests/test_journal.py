@@ -0,0 +1,65 @@
+import json
+import time
+
+def wait_durable(journal, timeout=5):
+    deadline = time.monotonic() + timeout
+    while journal._durable < journal._appended and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert journal._durable >= journal._appended
+
+def read_records(path):
+    with open(path, "rb") as f:
+        return [json.loads(line) for line in f]
+
+def test_replay_returns_only_unfinished_signals(server, tmp_path):
+    path = str(tmp_path / "signals.journal")
+    journal = server.SignalJournal(path)
+    assert journal.replay() == []
+    done, sent, pending = ({"ticker": "000001", "action": "BUY", "_sid": 7}, {"ticker": "000002", "action": "Stop Loss"},
+                           {"ticker": "000003", "action": "Final Exit"})
+    assert journal.accept([done, sent, pending])
+    journal.complete(done, "success")
+    journal.dispatched(sent) # 전송 시작 후 완료 기록 없음 -> 이중 주문 위험이라 재실행하지 않음
+    wait_durable(journal)
+
+    restarted = server.SignalJournal(path)
+    replayed = restarted.replay()
+    assert replayed == [{**pending, "_jid": pending["_jid"]}]
+    assert restarted.max_sid == 7
+    assert [(r["op"], r["id"]) for r in read_records(path)] == [("a", pending["_jid"])] # 미완료 기록만 남도록 다시 씀
+
+    # 재기동 후 발급하는 id는 기존 id와 겹치지 않음
+    new = {"ticker": "000004", "action": "BUY"}
+    assert restarted.accept([new])
+    assert new["_jid"] > pending["_jid"]
+
+def test_replay_expires_old_buys_and_skips_torn_line(server, tmp_path):
+    path = str(tmp_path / "signals.journal")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "a", "id": 1, "ts": time.time() - server.JOURNAL_REPLAY_BUY_SECONDS - 1,
+                            "data": {"ticker": "000001", "action": "BUY"}}) + "\n")
+        f.write(json.dumps({"op": "a", "id": 2, "ts": time.time() - server.JOURNAL_REPLAY_BUY_SECONDS - 1,
+                            "data": {"ticker": "000002", "action": "Stop Loss"}}) + "\n")
+        f.write('{"op": "a", "id": 3, "ts"') # 기록 도중 중단된 마지막 줄
+
+    journal = server.SignalJournal(path)
+    replayed = journal.replay()
+    assert [d["ticker"] for d in replayed] == ["000002"] # 오래된 청산은 그대로 복구
+    assert [r["id"] for r in read_records(path)] == [2]
+
+def test_completed_records_are_compacted(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "JOURNAL_COMPACT_BYTES", 1024)
+    path = str(tmp_path / "signals.journal")
+    journal = server.SignalJournal(path)
+    journal.replay()
+    signals = [{"ticker": f"{i:06d}", "action": "BUY"} for i in range(30)]
+    assert journal.accept(signals)
+    for data in signals[:-1]:
+        journal.complete(data, "success")
+    wait_durable(journal)
+
+    deadline = time.monotonic() + 5
+    while len(read_records(path)) > 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [(r["op"], r["id"]) for r in read_records(path)] == [("a", signals[-1]["_jid"])]
+    assert [d["ticker"] for d in server.SignalJournal(path).replay()] == ["000029"]
@@ -0,0 +1,111 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+def fill(ord_no, side, ticker, qty, filled, status="체결"):
+    return {"ord_no": ord_no, "side": side, "ticker": ticker, "name": None, "status": status,
+            "qty": qty, "remaining": qty - filled, "filled": filled, "price": 0, "cancel_of": None}
+
+@pytest.fixture
+def book(server):
+    positions = server.PositionBook(lambda: {"005930": {"name": "삼성전자", "qty": 10}})
+    positions.refresh()
+    positions.live = True # 체결 스트림 연결 중 (체결을 증분 반영)
+    return server.OrderBook(positions), positions
+
+
+def qty(positions, ticker):
+    return positions.get(ticker)[1]
+
+def test_sell_is_deducted_once_across_accept_and_fills(book):
+    orders, positions = book
+    orders.accepted("sell", "005930", 6, "0000012")
+    assert qty(positions, "005930") == 4 # 접수 시점에 미리 차감
+    assert orders.apply(fill("12", "sell", "005930", 6, 2)) == 2
+    assert orders.apply(fill("12", "sell", "005930", 6, 2)) == 0 # 같은 메시지 재수신
+    orders.apply(fill("0000012", "sell", "005930", 6, 6))
+    assert qty(positions, "005930") == 4
+    assert orders.open_orders() == []
+
+def test_fill_before_accept_response_is_merged(book):
+    orders, positions = book
+    orders.apply(fill("7", "sell", "005930", 5, 3))
+    assert qty(positions, "005930") == 7
+    orders.accepted("sell", "005930", 5, "0007")
+    assert qty(positions, "005930") == 5 # 나머지 잔량만 추가 차감
+
+def test_rejected_and_canceled_sells_restore_remaining(book):
+    orders, positions = book
+    orders.accepted("sell", "005930", 4, "21")
+    orders.apply(fill("21", "sell", "005930", 4, 0, status="거부"))
+    assert qty(positions, "005930") == 10
+
+    orders.accepted("sell", "005930", 4, "22")
+    orders.apply(fill("22", "sell", "005930", 4, 1))
+    orders.apply({**fill("23", "sell", "005930", 0, 0, status="확인"), "cancel_of": "22"}) # 잔량 전부 취소
+    assert qty(positions, "005930") == 9
+
+def test_buy_fills_add_to_positions(book):
+    orders, positions = book
+    orders.accepted("buy", "000660", 5, "31")
+    orders.apply(fill("31", "buy", "000660", 5, 2))
+    orders.apply(fill("31", "buy", "000660", 5, 5))
+    assert qty(positions, "000660") == 5
+
+def test_rebase_does_not_double_count_fills_in_snapshot(server):
+    snapshot = {"005930": {"name": "삼성전자", "qty": 10}}
+    positions = server.PositionBook(lambda: {t: dict(p) for t, p in snapshot.items()})
+    positions.refresh()
+    orders = server.OrderBook(positions)
+    orders.accepted("sell", "005930", 6, "41")
+    orders.accepted("sell", "005930", 2, "42")
+    assert qty(positions, "005930") == 2
+
+    # 단절 중 41번은 4주, 42번은 전량 체결 -> 새 스냅샷에 이미 반영됨
+    snapshot["005930"]["qty"] = 4
+    positions.refresh(force=True)
+    orders.rebase({"0041": {"side": "sell", "ticker": "005930", "qty": 6, "filled": 4, "remaining": 2}})
+    assert qty(positions, "005930") == 2 # 미체결 매도 잔량 2주는 다시 차감
+    orders.apply(fill("41", "sell", "005930", 6, 4)) # 재연결 후 늦게 온 과거 체결
+    orders.apply(fill("42", "sell", "005930", 2, 2))
+    assert qty(positions, "005930") == 2
+    orders.apply(fill("41", "sell", "005930", 6, 6))
+    assert qty(positions, "005930") == 2
+    assert orders.open_orders() == []
+
+def test_feed_goes_live_only_after_resync(server):
+    snapshot = {"005930": {"name": "삼성전자", "qty": 10}}
+    fetch = lambda: snapshot
+    positions = server.PositionBook(lambda: fetch())
+    api = SimpleNamespace(name="test", positions=positions, orders=server.OrderBook(positions), fetch_open_orders=lambda: {})
+    feed = server.ExecutionFeed(api, "")
+
+    with pytest.raises(ConnectionError):
+        feed._on_connected() # 재정렬 없이 구독 확인
+    fetch = lambda: None
+    with pytest.raises(ConnectionError):
+        feed._resync()
+    assert not positions.live and not feed.connected
+
+    fetch = lambda: snapshot
+    feed._resync()
+    feed._on_connected()
+    assert positions.live and feed.connected
+
+def test_feed_applies_mock_stream_fills(server):
+    api = server.kiwoom
+    deadline = time.monotonic() + 10
+    while not api.positions.live and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert api.feed.connected and api.positions.live
+
+    assert api.send_order("buy", "123450", 10000, 5)["status"] == "success"
+    deadline = time.monotonic() + 5
+    while qty(api.positions, "123450") != 5 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert qty(api.positions, "123450") == 5
+
+    assert api.send_order("sell", "123450", 10000, 2)["status"] == "success"
+    time.sleep(0.3) # 체결 메시지 수신 후에도 한 번만 차감
+    assert qty(api.positions, "123450") == 3
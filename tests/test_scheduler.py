@@ -0,0 +1,105 @@
+import queue
+import time
+
+import pytest
+
+@pytest.fixture
+def scheduler(server):
+    scheduler = server.SignalScheduler(max_buys=3, max_age=30, stall_seconds=15)
+    scheduler.discarded = []
+    scheduler.on_discard = lambda data, reason: scheduler.discarded.append((data.get("ticker"), data.get("action"), reason))
+    return scheduler
+
+def drain(scheduler):
+    items = []
+    while True:
+        try:
+            items.append(scheduler.get(timeout=0))
+        except queue.Empty:
+            return [(d["ticker"], d["action"]) for d in items]
+
+def test_exit_lane_goes_before_buy_lane(scheduler):
+    scheduler.put({"ticker": "000001", "action": "BUY"})
+    scheduler.put({"ticker": "000002", "action": "Stop Loss"})
+    scheduler.put({"ticker": "000003", "action": "BUY"})
+    scheduler.put({"ticker": "000004", "action": "Final Exit"})
+    assert scheduler.lane_sizes() == (2, 2)
+    assert drain(scheduler) == [("000002", "Stop Loss"), ("000004", "Final Exit"), ("000001", "BUY"), ("000003", "BUY")]
+    assert scheduler.qsize() == 0
+
+def test_full_exit_replaces_pending_partial_exits(scheduler):
+    scheduler.put({"ticker": "000001", "action": "Profit Target 1"})
+    scheduler.put({"ticker": "000002", "action": "Stop Loss"})
+    scheduler.put({"ticker": "000001", "action": "Stop Loss"})
+    scheduler.put({"ticker": "000001", "action": "Final Exit"})   # 000001의 첫 자리(000002보다 앞)를 차지
+    scheduler.put({"ticker": "000001", "action": "Profit Target 1"}) # 전량 청산 대기 중이라 버림
+    assert drain(scheduler) == [("000001", "Final Exit"), ("000002", "Stop Loss")]
+    assert scheduler.coalesced == 3
+    assert [r for *_, r in scheduler.discarded] == ["coalesced"] * 3
+
+def test_same_exit_signal_is_coalesced(scheduler):
+    scheduler.put({"ticker": "000001", "action": "Stop Loss"})
+    scheduler.put({"ticker": "000001", "action": "Stop Loss"})
+    assert scheduler.lane_sizes() == (1, 0)
+    assert scheduler.coalesced == 1
+
+def test_exit_cancels_pending_buy(scheduler):
+    scheduler.put({"ticker": "000001", "action": "BUY"})
+    scheduler.put({"ticker": "000001", "action": "Stop Loss"})
+    assert drain(scheduler) == [("000001", "Stop Loss")]
+    assert scheduler.discarded == [("000001", "BUY", "coalesced")]
+
+def test_newer_buy_replaces_pending_buy_and_moves_to_tail(scheduler):
+    scheduler.put({"ticker": "000001", "action": "BUY", "price": 100})
+    scheduler.put({"ticker": "000002", "action": "BUY", "price": 200})
+    scheduler.put({"ticker": "000001", "action": "BUY", "price": 110})
+    assert scheduler.lane_sizes() == (0, 2)
+    items = [scheduler.get(timeout=0) for _ in range(2)]
+    assert [(d["ticker"], d["price"]) for d in items] == [("000002", 200), ("000001", 110)]
+    assert scheduler.qsize() == 0
+
+def test_unknown_action_is_ignored(scheduler):
+    scheduler.put({"ticker": "000001", "action": "WARMUP"})
+    assert scheduler.qsize() == 0
+    assert scheduler.discarded == [("000001", "WARMUP", "ignored")]
+
+def test_buy_lane_overflow_sheds_oldest_buy(scheduler):
+    scheduler.put_many([{"ticker": f"00000{i}", "action": "BUY"} for i in range(4)])
+    assert scheduler.lane_sizes() == (0, 3)
+    assert scheduler.shed == 1
+    assert drain(scheduler) == [("000001", "BUY"), ("000002", "BUY"), ("000003", "BUY")]
+
+def test_stale_buys_expire_instead_of_dispatching(server):
+    scheduler = server.SignalScheduler(max_age=0.05)
+    scheduler.put({"ticker": "000001", "action": "BUY"})
+    time.sleep(0.1)
+    scheduler.put({"ticker": "000002", "action": "Stop Loss"})
+    assert drain(scheduler) == [("000002", "Stop Loss")]
+    assert scheduler.expired == 1
+
+def test_older_buy_expires_behind_coalesced_buy(server):
+    scheduler = server.SignalScheduler(max_age=0.1)
+    scheduler.put({"ticker": "000001", "action": "BUY", "price": 100})
+    scheduler.put({"ticker": "000002", "action": "BUY", "price": 200})
+    time.sleep(0.06)
+    scheduler.put({"ticker": "000001", "action": "BUY", "price": 110}) # 000001은 새로 대기 시작
+    time.sleep(0.06)
+    data = scheduler.get(timeout=0)
+    assert (data["ticker"], data["price"]) == ("000001", 110)
+    assert scheduler.expired == 1 and scheduler.qsize() == 0 # 000002는 앞쪽에 가려지지 않고 만료
+
+def test_admit_rejects_buys_beyond_lane_room(scheduler):
+    scheduler.put_many([{"ticker": f"00000{i}", "action": "BUY"} for i in range(2)])
+    admitted, rejected, reason = scheduler.admit([{"ticker": "100000", "action": "BUY"}, {"ticker": "200000", "action": "BUY"},
+                                                  {"ticker": "300000", "action": "Final Exit"}])
+    assert [d["ticker"] for d in admitted] == ["100000", "300000"]
+    assert [d["ticker"] for d in rejected] == ["200000"]
+    assert reason == "full" and scheduler.rejected == 1
+
+def test_admit_rejects_buys_while_worker_stalls(server):
+    scheduler = server.SignalScheduler(stall_seconds=0.05)
+    scheduler.put({"ticker": "000001", "action": "Stop Loss"})
+    time.sleep(0.1)
+    admitted, rejected, reason = scheduler.admit([{"ticker": "100000", "action": "BUY"}, {"ticker": "200000", "action": "Stop Loss"}])
+    assert [d["ticker"] for d in admitted] == ["200000"]
+    assert reason == "stalled"
@@ -0,0 +1,44 @@
+import threading
+import time
+
+import pytest
+
+@pytest.fixture
+def failing_startup(server, monkeypatch):
+    """기본 계좌 연결이 두 번 실패한 뒤 성공하는 기동 (재시도 간격 단축)"""
+    monkeypatch.setattr(server, "STARTUP_RETRY_SECONDS", (0.01, 0.02))
+    startup = server.Startup(time.perf_counter())
+    release = threading.Event()
+    calls = []
+
+    def prepare():
+        calls.append(1)
+        if len(calls) <= 2 or not release.is_set():
+            raise RuntimeError("기본 계좌(main) 연결 실패")
+    startup.start(prepare)
+    return startup, release, calls
+
+def test_failed_startup_is_retried_until_ready(failing_startup):
+    startup, release, calls = failing_startup
+    assert not startup.wait(0.1)
+    assert startup.failed and startup.state == "failed" and startup.attempts >= 2
+    release.set()
+    assert startup.wait(5)
+    assert not startup.failed and startup.error is None and startup.state == "ready"
+    assert startup.status()["attempts"] == len(calls) >= 3
+
+def test_webhook_rejects_signals_while_startup_failed(server, failing_startup, monkeypatch):
+    startup, release, _ = failing_startup
+    monkeypatch.setattr(server, "startup", startup)
+    assert not startup.wait(0.1)
+    client = server.app.test_client()
+    res = client.post("/webhook", json={"ticker": "005930", "action": "Stop Loss", "price": 70000, "stop": 69000})
+    assert res.status_code == 503 and res.get_json()["reason"] == "startup_failed"
+    assert res.headers["Retry-After"]
+    res = client.post("/webhook/batch", json=[{"ticker": "005930", "action": "BUY", "price": 70000, "score": 1}])
+    assert res.status_code == 503
+
+    release.set()
+    assert startup.wait(5)
+    res = client.post("/webhook", json={"ticker": "005930", "action": "BUY", "price": 70000, "score": 1, "signal_id": "startup-1"})
+    assert res.status_code == 200 and res.get_json()["status"] == "queued"
@@ -0,0 +1,47 @@
+import threading
+import time
+
+import pytest
+
+import symbols
+
+@pytest.fixture
+def master(tmp_path):
+    master = symbols.SymbolMaster(str(tmp_path / "symbols.bin"))
+    master.build([("005930", "삼성전자", "KOSPI", 70000), ("069500", "KODEX 200", "ETF", 35000),
+                  ("252670", "KODEX 200선물인버스2X", "ETF", 1995)])
+    assert master.open()
+    return master
+
+def test_off_tick_prices_round_toward_marketable(master):
+    assert master.check_price("005930", 70050, "buy") == (70100, None)
+    assert master.check_price("005930", 70050, "sell") == (70000, None)
+    assert master.check_price("005930", 70000, "buy") == (70000, None) # 이미 호가면 그대로
+
+def test_fund_tick_follows_price_band(master):
+    assert symbols.tick_size(1995, "ETF") == 1 and symbols.tick_size(35000, "ETN") == 5
+    assert master.check_price("252670", 1997, "buy") == (1997, None)
+    assert master.check_price("069500", 35002, "buy") == (35005, None)
+    assert master.check_price("069500", 35002, "sell") == (35000, None)
+
+def test_refresh_runs_once_under_concurrent_callers(tmp_path):
+    master = symbols.SymbolMaster(str(tmp_path / "symbols.bin"))
+    started, release = threading.Event(), threading.Event()
+    calls = []
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return [("005930", "삼성전자", "KOSPI", 70000)]
+
+    callers = [threading.Thread(target=master.refresh_async, args=(fetch,)) for _ in range(8)]
+    for thread in callers:
+        thread.start()
+    for thread in callers:
+        thread.join()
+    assert started.wait(5)
+    release.set()
+    deadline = time.monotonic() + 5
+    while not master.is_current and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert master.is_current and len(calls) == 1